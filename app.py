@@ -1,21 +1,33 @@
 # app.py (with RAG integration)
 
-from flask import Flask, render_template, request, jsonify, abort, url_for, session
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from flask import Flask, render_template, request, jsonify, abort, session, Response, stream_with_context, g
+from flask import before_render_template, template_rendered
+from langchain_core.messages import HumanMessage, AIMessage
 # Removed dotenv import as load_dotenv() wasn't called
 import os
 import logging
 import json
 import time
 import traceback
-import requests
 import uuid
 import re
+import atexit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # --- RAG Processor Import ---
 # Import the functions we need from our new module
 import rag_processor
+from persona_registry import PersonaRegistry
+from conversation_store import create_conversation_store
+from denial_filter import DenialFilterRegistry
+import context_builder
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_HISTORY
+from joke_provider import JokeProvider
+from feedback_store import create_feedback_writer, make_record
+from static_assets import AssetManifest, ASSET_URL_PREFIX
+from intent_router import IntentRouter, coach_aliases
+import llm_client
+import metrics
 
 # --- Setup ---
 # Configure logging (consider DEBUG for testing, INFO for production)
@@ -47,41 +59,61 @@ if not os.path.isdir(COACH_DATA_DIR):
     # Consider exiting if coach data is essential
     # exit(1)
 
-# For cache busting static assets
-app.config['LAST_UPDATED'] = int(time.time())
+# --- Static Assets ---
+# Fingerprinted, precompressed assets from `python static_assets.py build`; their URLs only
+# change when the file contents do, so a restart or deploy doesn't invalidate clients' caches.
+SIDEBAR_ICON_SIZE = 24 # CSS pixels, see .sidebar-icon in style.css
+asset_manifest = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
+
+
+@app.route(f'{ASSET_URL_PREFIX}/<path:filename>')
+def asset(filename):
+    return asset_manifest.send(filename)
+
+
+# --- Persona Registry ---
+# Personas are parsed once and served from memory; changed files are picked up by mtime.
+persona_registry = PersonaRegistry(COACH_DATA_DIR, images_dir=os.path.join(app.static_folder, 'images'))
+_sidebar_cache = (None, []) # (registry generation, sidebar entries)
 
 # --- Load RAG Components at Startup ---
-# Call the loading function from rag_processor.py
-# This happens once when the Flask app starts.
-RAG_ENABLED = rag_processor.load_rag_components()
-if not RAG_ENABLED:
+# By default this happens once, synchronously, when the Flask app starts (in the gunicorn
+# master when preloading). With RAG_LAZY_INIT=1 the app starts serving immediately and
+# RAG loads on a background thread; chats get non-RAG answers until it is ready.
+RAG_LAZY_INIT = os.getenv("RAG_LAZY_INIT", "0") == "1"
+APP_STARTED_AT = time.time()
+if RAG_LAZY_INIT:
+    rag_processor.start_background_load()
+    logging.info("RAG lazy init enabled. Serving without RAG until components finish loading.")
+elif not rag_processor.initialize_rag():
     logging.warning("RAG components failed to load. Application will run WITHOUT RAG functionality.")
 else:
     logging.info("RAG components loaded successfully. RAG is ENABLED.")
 
+# --- Dad Jokes ---
+# Prefetched in the background; the first fill starts now so jokes are ready for the first request
+joke_provider = JokeProvider()
+joke_provider.start()
+
 # --- Helper Functions ---
 # (get_dad_joke, create_gemini_chat_model, sanitize_input remain largely the same)
 # Minor update to create_gemini_chat_model logging
 def get_dad_joke():
-    # ... (previous code is fine) ...
-    url = "https://icanhazdadjoke.com/"
-    headers = {'Accept': 'application/json'}
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        return response.json().get('joke', "No joke today, but you’re still awesome!")
-    except requests.RequestException as e:
-        logging.warning(f"Dad Joke API failed: {e}")
-        return "No joke fetched – my bad!"
+    # Served from the prefetched buffer (or the local corpus); never waits on the joke API
+    return joke_provider.get_joke()
 
 def create_gemini_chat_model():
-    logging.debug("Creating Gemini chat model instance.")
-    return ChatGoogleGenerativeAI(
-        model=GEMINI_MODEL_NAME,
-        google_api_key=GEMINI_API_KEY,
+    # Returns the pooled client; a new one (and a new connection) is only built per process/settings
+    chat_model = llm_client.get_chat_model(
+        GEMINI_MODEL_NAME,
+        GEMINI_API_KEY,
         # Consider adding safety_settings if needed
         # safety_settings=...
     )
+    stats = llm_client.get_pool_stats()
+    logging.debug(f"Gemini client ready in {stats['last_setup_seconds'] * 1000:.3f} ms (clients built: {stats['clients_built']}, pool hits: {stats['pool_hits']}).")
+    return chat_model
 
 def sanitize_input(text):
     # ... (previous code is fine) ...
@@ -89,45 +121,44 @@ def sanitize_input(text):
         return text.strip()
     return ""
 
+# --- Conversation History ---
+# Bot turns containing a denial phrase are generic AI disclaimers and are kept out of the
+# history. One compiled filter per coach (base phrases + the coach's "denial_phrases").
+denial_filters = DenialFilterRegistry()
+denial_filters.warm(persona_registry.snapshot()[0])
+MAX_HISTORY_EXCHANGES = 15
+
+def filter_exchange(user_msg_content, bot_msg_content, denial_filter=None):
+    """ Converts one user/bot exchange into LangChain messages, dropping empty turns and denials. """
+    denial_filter = denial_filter or denial_filters.base
+    messages = []
+    if user_msg_content:
+        sanitized_user_msg = sanitize_input(user_msg_content)
+        if sanitized_user_msg:
+            messages.append(HumanMessage(content=sanitized_user_msg))
+
+    if bot_msg_content:
+        if isinstance(bot_msg_content, str):
+            if not denial_filter.is_denial(bot_msg_content):
+                messages.append(AIMessage(content=bot_msg_content))
+            else:
+                logging.debug(f"History Filter: Skipping denial AIMessage: {bot_msg_content[:60]}...")
+        else:
+            logging.warning(f"Skipping non-string bot message in history: {bot_msg_content}")
+    return messages
+
 # Updated manage_conversation_history to optionally exclude the *new* message
-def manage_conversation_history(history_from_frontend, new_sanitized_message=None, max_exchanges=15):
+def manage_conversation_history(history_from_frontend, new_sanitized_message=None, max_exchanges=MAX_HISTORY_EXCHANGES, denial_filter=None):
     """
     Builds a list of LangChain messages from frontend history, applying filtering and trimming.
     Optionally adds the new user message at the end.
     """
     messages = []
-    # Keep your denial phrases - they are useful!
-    denial_phrases = [
-        "i am a large language model", "i'm a large language model", "i am an ai",
-        "i'm an ai assistant", "trained by google", "i cannot fulfill that request",
-        "i do not have personal opinions", "as an ai", "language model",
-        "i am not yoda", "i am not aiyoda", "i am not wellness warrior",
-        "i am not career catalyst", "i am not executive coach",
-        "i am not personal growth guru", "i am not relationship revivalist",
-        "hypothetical scenario", "i don't have \"clients\"", "as i am a language model"
-    ] # ... (keep your full list) ...
-
     logging.debug(f"Managing history. Input turns: {len(history_from_frontend)}, Max Exchanges: {max_exchanges}")
 
     # Process past turns from frontend
     for turn in history_from_frontend:
-        user_msg_content = turn.get('user')
-        bot_msg_content = turn.get('bot')
-
-        if user_msg_content:
-            sanitized_user_msg = sanitize_input(user_msg_content)
-            if sanitized_user_msg:
-                messages.append(HumanMessage(content=sanitized_user_msg))
-
-        if bot_msg_content:
-            if isinstance(bot_msg_content, str):
-                is_denial = any(phrase in bot_msg_content.lower() for phrase in denial_phrases)
-                if not is_denial:
-                    messages.append(AIMessage(content=bot_msg_content))
-                else:
-                    logging.debug(f"History Filter: Skipping denial AIMessage: {bot_msg_content[:60]}...")
-            else:
-                logging.warning(f"Skipping non-string bot message in history: {bot_msg_content}")
+        messages.extend(filter_exchange(turn.get('user'), turn.get('bot'), denial_filter))
 
     # Trim history if it's too long
     num_messages_to_keep = max_exchanges * 2
@@ -146,45 +177,561 @@ def manage_conversation_history(history_from_frontend, new_sanitized_message=Non
     return messages
 
 
-# load_coach_sidebar_data remains the same
+# Filtered, trimmed history per (conversation_id, coach key); see conversation_store.py
+conversation_store = create_conversation_store(max_messages=MAX_HISTORY_EXCHANGES * 2)
+
+def get_conversation_id():
+    """ Returns this session's server-side conversation ID, creating one if needed. Needs the request context. """
+    conversation_id = session.get('conversation_id')
+    if not conversation_id:
+        conversation_id = uuid.uuid4().hex
+        session['conversation_id'] = conversation_id
+    return conversation_id
+
+
+# --- Feedback Store ---
+# Ratings are queued in memory and written in batches by a background thread (see feedback_store.py)
+feedback_writer = create_feedback_writer()
+atexit.register(feedback_writer.close)
+
+
+# load_coach_sidebar_data now reads from the persona registry and only rebuilds on reload
 def load_coach_sidebar_data():
-    # ... (previous code is fine, ensure COACH_DATA_DIR is defined globally) ...
-    coach_data_list = []
+    global _sidebar_cache
+    personas, generation = persona_registry.snapshot()
+    cached_generation, coach_data_list = _sidebar_cache
+    if cached_generation == generation:
+        return coach_data_list
+
+    coach_data_list = [
+        {
+            'name': persona.display_name,
+            'url_name': persona.url_name,
+            'image': persona.image,
+            'image_url': asset_manifest.thumbnail(f'images/{persona.image}', SIDEBAR_ICON_SIZE)
+                         or asset_manifest.url(f'images/{persona.image}'),
+            'image_srcset': asset_manifest.srcset(f'images/{persona.image}', SIDEBAR_ICON_SIZE),
+            'image_webp_srcset': asset_manifest.srcset(f'images/{persona.image}', SIDEBAR_ICON_SIZE, fmt='webp'),
+        }
+        for persona in personas
+    ]
+    _sidebar_cache = (generation, coach_data_list)
+    return coach_data_list
+
+# --- Chat Turn Preparation (shared by the JSON and streaming endpoints) ---
+class ChatRequestError(Exception):
+    """ Raised while preparing a chat turn; carries the client-facing error and HTTP status. """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# Stages are kept separate so the async pipeline (asgi.py) can await the blocking ones.
+
+def start_chat_turn(data, endpoint="POST /"):
+    """
+    Validates a chat request body and resolves the coach persona.
+
+    Returns:
+        dict: The turn state ('message_id', 'sanitized_message', 'coach_display_name',
+              'history', 'persona', 'conversation_id', 'client_conversation_id', 'timings')
+              passed to the later stages.
+
+    Raises:
+        ChatRequestError: If the request is invalid or the coach cannot be loaded.
+    """
+    if not data:
+        logging.error(f"{endpoint} - No JSON data received")
+        raise ChatRequestError('No data provided', 400)
+
+    message = data.get('message')
+    coach_display_name = data.get('coach_name')
+    history_from_frontend = data.get('history', [])
+
+    # Basic input validation
+    if not message or not coach_display_name:
+        logging.warning(f"{endpoint} - Missing fields: message={bool(message)}, coach_name={bool(coach_display_name)}")
+        raise ChatRequestError('Missing message or coach name', 400)
+
+    sanitized_message = sanitize_input(message)
+    message_id = str(uuid.uuid4()) # Unique ID for this request
+    logging.info(f"{endpoint} - Request ID: {message_id} - Coach: '{coach_display_name}', Msg: '{sanitized_message[:50]}...'")
+
+    # --- Coach Persona Loading ---
+    persona_start = time.perf_counter()
+    coach_persona = persona_registry.get(coach_display_name)
+    if coach_persona is None:
+        load_error = persona_registry.load_error(coach_display_name)
+        if load_error:
+            logging.error(f"ID:{message_id} - Error loading coach configuration for '{coach_display_name}': {load_error}")
+            raise ChatRequestError('Error loading coach configuration.', 500)
+        logging.error(f"ID:{message_id} - Coach persona not found: '{coach_display_name}'")
+        raise ChatRequestError(f'Coach configuration for "{coach_display_name}" not found.', 400)
+    if not coach_persona.is_valid:
+        logging.error(f"ID:{message_id} - CRITICAL: 'prompt_prefix' missing or empty for coach '{coach_persona.key}'")
+        raise ChatRequestError('Internal server error: Coach configuration invalid.', 500)
+    logging.debug(f"ID:{message_id} - Using cached persona: {coach_persona.key}")
+
+    return {
+        # Seconds spent in each pre-LLM stage; see log_stage_timings()
+        'timings': {'persona': time.perf_counter() - persona_start},
+        'message_id': message_id,
+        'sanitized_message': sanitized_message,
+        'coach_display_name': coach_display_name,
+        'history': history_from_frontend,
+        'persona': coach_persona,
+        'conversation_id': get_conversation_id(),
+        # Clients send their conversation ID (server-side history) along with 'history' as a fallback
+        'client_conversation_id': data.get('conversation_id'),
+    }
+
+
+def format_joke_answer(turn, dad_joke):
+    answer = f"Okay, you asked for it! Here’s a dad joke: {dad_joke}"
+    logging.info(f"ID:{turn['message_id']} - Dad joke triggered. Response: '{answer[:100]}...'")
+    return {'message_id': turn['message_id'], 'answer': answer, 'conversation': conversation_ref(turn)}
+
+
+# --- Intent Router (fast path for messages that need neither RAG nor the LLM) ---
+_intent_router = (None, None) # (registry generation, IntentRouter)
+
+def get_intent_router():
+    """ Returns the intent router, recompiling its coach names when the personas change. """
+    global _intent_router
+    personas, generation = persona_registry.snapshot()
+    cached_generation, router = _intent_router
+    if router is None:
+        router = IntentRouter(coach_aliases(personas))
+    elif cached_generation != generation:
+        router.set_coaches(coach_aliases(personas))
+    _intent_router = (generation, router)
+    return router
+
+
+def _persona_greeting(persona):
+    greeting = persona.data.get('greeting')
+    if isinstance(greeting, str) and greeting.strip():
+        return greeting
+    # Reuse the persona's own example answer to a greeting, if it has one
+    router = get_intent_router()
+    for example in persona.data.get('example_interactions', []):
+        intent_match = router.match_text(str(example.get('prompt', '')))
+        if intent_match is not None and intent_match.intent == 'greeting' and example.get('expected_response'):
+            return example['expected_response']
+    return f"Hello! {persona.data.get('description', '')} What would you like to work on today?".replace("  ", " ")
+
+
+def _persona_help(persona):
+    focus = [str(area) for area in persona.data.get('focus', [])]
+    areas = f" I can help with {', '.join(focus[:-1])} and {focus[-1]}." if len(focus) > 1 else (f" I can help with {focus[0]}." if focus else "")
+    return (f"I'm {persona.display_name}.{areas} Just ask me a question, say \"tell me a joke\" for a laugh, "
+            f"or pick another coach from the coach selector.")
+
+
+def answer_intent(turn, intent_match):
+    """ Builds the prepared answer (same shape as format_joke_answer()) for a routed intent, or None. """
+    persona = turn['persona']
+    if intent_match.intent == 'joke':
+        return format_joke_answer(turn, get_dad_joke())
+    if intent_match.intent == 'greeting':
+        answer = _persona_greeting(persona)
+    elif intent_match.intent == 'help':
+        answer = _persona_help(persona)
+    elif intent_match.intent == 'coach_switch':
+        target = intent_match.params.get('coach')
+        if target == persona.display_name:
+            answer = f"You're already talking with {target}. What's on your mind?"
+        else:
+            prepared = {'message_id': turn['message_id'], 'conversation': conversation_ref(turn), 'switch_coach': target,
+                        'answer': f"Switching you to {target}. Ask away!"}
+            logging.info(f"ID:{turn['message_id']} - Coach switch to '{target}' requested.")
+            return prepared
+    else:
+        logging.warning(f"ID:{turn['message_id']} - No handler for intent '{intent_match.intent}'. Using the normal path.")
+        return None
+    logging.info(f"ID:{turn['message_id']} - Intent '{intent_match.intent}' answered without RAG/LLM. Response: '{answer[:100]}...'")
+    return {'message_id': turn['message_id'], 'answer': answer, 'conversation': conversation_ref(turn)}
+
+
+def route_intent(turn):
+    """
+    Returns a prepared answer if the message is a fast-path intent (joke, greeting,
+    help, coach switch), otherwise None. Blocking only when the opt-in embedding
+    classifier has to embed the message.
+    """
+    router = get_intent_router()
+    embedding = None
+    if router.embedding_threshold > 0 and rag_processor.are_rag_components_loaded():
+        router.prepare_embeddings(rag_processor.embedding_model.encode)
+        embedding = rag_processor.encode_query(turn['sanitized_message'])[0] # Cached for the RAG search too
+    intent_match = router.route(turn['sanitized_message'], embedding)
+    if intent_match is None:
+        return None
+    logging.debug(f"ID:{turn['message_id']} - Routed to intent '{intent_match.intent}' ({intent_match.source}, score {intent_match.score:.3f}).")
+    return answer_intent(turn, intent_match)
+
+
+get_intent_router() # Compile the rules now rather than on the first chat message
+
+
+def answer_payload(prepared_turn, answer):
+    """ The JSON body of a chat answer (also the SSE 'done' event). """
+    payload = {'answer': answer, 'message_id': prepared_turn['message_id'], 'conversation_id': prepared_turn['conversation']['id']}
+    if prepared_turn.get('switch_coach'):
+        payload['switch_coach'] = prepared_turn['switch_coach']
+    return payload
+
+
+def retrieve_context(sanitized_message, message_id, rag_tags=None):
+    """
+    Runs the RAG search and formats the hits into a context block. Blocking (CPU bound).
+    `rag_tags` (the coach's "rag_tags") scopes the search to that coach's documents.
+
+    Returns:
+        tuple: (retrieved_context_str, rag_search_performed). The string is empty
+               if RAG is disabled, nothing relevant was found (every hit was below
+               RAG_MIN_SIMILARITY), or the search failed.
+    """
+    retrieved_context_str = ""
+    rag_search_performed = False
+    if rag_processor.are_rag_components_loaded(): # Flips to True once (lazy) loading finishes
+        try:
+            logging.debug(f"ID:{message_id} - Performing RAG search...")
+            # Up to 3 relevant docs with their similarity to the query
+            retrieved_docs = rag_processor.search_documents_scored(sanitized_message, k=3, tags=rag_tags)
+            rag_search_performed = True
+            if retrieved_docs:
+                # Format the retrieved documents into a string block
+                context_parts = ["Context related to your query:"]
+                for i, (doc, _) in enumerate(retrieved_docs, 1):
+                    context_parts.append(f"[{i}] {doc}") # Add numbering
+                retrieved_context_str = "\n".join(context_parts)
+                scores = ", ".join(f"{score:.2f}" for _, score in retrieved_docs)
+                logging.debug(f"ID:{message_id} - RAG search found {len(retrieved_docs)} documents (similarity {scores}). Context snippet: {retrieved_context_str[:150]}...")
+            else:
+                logging.info(f"ID:{message_id} - No relevant documents for this query. Answering without context.")
+        except Exception as e:
+             logging.error(f"ID:{message_id} - Error during RAG search execution: {e}", exc_info=True)
+             # Proceed without context if RAG search fails
+    else:
+        metrics.count_rag_search("skipped")
+        rag_state = rag_processor.get_load_status()["state"]
+        if rag_state == "loading":
+            logging.info(f"ID:{message_id} - RAG components still loading. Answering without context.")
+        else:
+            logging.warning(f"ID:{message_id} - RAG is disabled or failed to load ({rag_state}). Skipping vector search.")
+    return retrieved_context_str, rag_search_performed
+
+
+def note_current_coach(turn):
+    """ Records the turn's coach in the session. Returns True if it is the same coach as last turn. """
+    previous_coach = session.get('current_coach')
+    coach_display_name = turn['coach_display_name']
+    session['current_coach'] = coach_display_name # Update session
+    if previous_coach and coach_display_name == previous_coach:
+        return True
+    logging.info(f"ID:{turn['message_id']} - Coach changed from '{previous_coach}' to '{coach_display_name}' or first message. Clearing history for model.")
+    return False
+
+
+def load_turn_history(turn, same_coach):
+    """
+    Returns the past HumanMessage/AIMessage list for this turn. Doesn't need the
+    request context, but may block on the conversation store backend.
+
+    Clients that send the session's conversation ID get the stored, already
+    filtered history. When the store has nothing for it (another worker served
+    the previous turn with the in-process backend, or the worker restarted),
+    or the client only posts 'history', the client's history is filtered here
+    and seeds the store for the next turn.
+    """
+    message_id = turn['message_id']
+    key = (turn['conversation_id'], turn['persona'].key)
+    if not same_coach:
+        conversation_store.reset(key)
+        return []
+
+    history_from_frontend = turn['history']
+    # The client appends the pending message before posting; it is sent separately as the final prompt
+    if history_from_frontend and not history_from_frontend[-1].get('bot'):
+        history_from_frontend = history_from_frontend[:-1]
+    # The store is cleared on a coach change, so only the turns since then count
+    coach_turns = len(history_from_frontend)
+    while coach_turns and history_from_frontend[coach_turns - 1].get('coachName', turn['coach_display_name']) == turn['coach_display_name']:
+        coach_turns -= 1
+    history_from_frontend = history_from_frontend[coach_turns:]
+
+    if turn['client_conversation_id'] == turn['conversation_id']:
+        past_conversation_messages = conversation_store.load(key)
+        if past_conversation_messages or not history_from_frontend:
+            logging.debug(f"ID:{message_id} - Same coach. Using stored history (len: {len(past_conversation_messages)}).")
+            return past_conversation_messages
+        logging.info(f"ID:{message_id} - No stored history for this conversation in this worker. Rebuilding it from the client's history.")
+    elif turn['client_conversation_id']:
+        logging.info(f"ID:{message_id} - Unknown conversation ID from client (session expired?). Starting a new conversation.")
+
+    logging.debug(f"ID:{message_id} - Same coach. Using frontend history (len: {len(history_from_frontend)}).")
+    # Pass `None` for new_sanitized_message as we'll build the final prompt separately
+    past_conversation_messages = manage_conversation_history(history_from_frontend, None, denial_filter=denial_filters.for_persona(turn['persona']))
+    conversation_store.replace(key, past_conversation_messages)
+    return past_conversation_messages
+
+
+def conversation_ref(turn):
+    """ What record_exchange() needs to append this turn once it is answered. """
+    return {'id': turn['conversation_id'], 'coach_key': turn['persona'].key, 'user_message': turn['sanitized_message'],
+            'denial_filter': denial_filters.for_persona(turn['persona'])}
+
+
+def record_exchange(prepared_turn, answer):
+    """ Appends the answered exchange to the conversation store. Doesn't need the request context. """
+    conversation = prepared_turn['conversation']
     try:
-        if not os.path.isdir(COACH_DATA_DIR):
-            logging.error(f"Coach data directory '{COACH_DATA_DIR}' not found during sidebar load!")
-            return []
-
-        for filename in sorted(os.listdir(COACH_DATA_DIR)):
-            if filename.endswith(".json") and not filename.startswith('.'):
-                base_name = filename[:-5]
-                coach_display_name = base_name.replace("_", " ").title()
-                coach_url_name = coach_display_name.lower().replace(" ", "")
-                filepath = os.path.join(COACH_DATA_DIR, filename)
-                try:
-                    with open(filepath, "r", encoding='utf-8') as f:
-                        persona_data = json.load(f)
-                        image_filename = persona_data.get('image', 'default.jpg')
-                        # ... (rest of the image checking logic is fine) ...
-                        static_images_dir = os.path.join(app.static_folder, 'images')
-                        image_path_check = os.path.join(static_images_dir, image_filename)
-                        if not os.path.exists(image_path_check):
-                            logging.warning(f"Image file not found: {image_path_check} for coach {coach_display_name}. Using default.jpg.")
-                            image_filename = 'default.jpg'
-
-                        coach_data_list.append({
-                            'name': coach_display_name,
-                            'url_name': coach_url_name,
-                            'image': image_filename,
-                            'image_url': url_for('static', filename=f'images/{image_filename}', v=app.config['LAST_UPDATED'])
-                        })
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error decoding JSON from {filename}: {e}")
-                except Exception as e:
-                    logging.error(f"Error processing coach file {filename}: {e}")
+        conversation_store.append((conversation['id'], conversation['coach_key']), filter_exchange(conversation['user_message'], answer, conversation['denial_filter']))
     except Exception as e:
-        logging.error(f"Error listing coach data directory '{COACH_DATA_DIR}': {e}")
-    return coach_data_list
+        # Losing one exchange of history shouldn't fail an already answered request
+        logging.error(f"ID:{prepared_turn['message_id']} - Failed to store conversation exchange: {e}", exc_info=True)
+
+
+# --- Response Cache (opt-in with RESPONSE_CACHE=1) ---
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+def _query_embedding(sanitized_message):
+    # The RAG search just embedded this query, so this is an embedding cache hit
+    if not rag_processor.are_rag_components_loaded():
+        return None
+    try:
+        return rag_processor.encode_query(sanitized_message)[0]
+    except Exception as e:
+        logging.warning(f"Could not embed query for the response cache: {e}")
+        return None
+
+
+def lookup_cached_answer(turn, retrieved_context_str, past_conversation_messages):
+    """
+    Returns a prepared answer (same shape as format_joke_answer()) on a response
+    cache hit, or None. On a miss of a cacheable turn it sets turn['cache_request']
+    so cache_answer() can store the LLM's answer. Doesn't need the request context.
+    """
+    if response_cache is None or len(past_conversation_messages) > RESPONSE_CACHE_MAX_HISTORY:
+        return None
+    message_id = turn['message_id']
+    embedding = _query_embedding(turn['sanitized_message'])
+    # Keyed by prompt version too, so editing a coach's prompt stops its old answers being replayed
+    cache_coach_key = f"{turn['persona'].key}@{turn['persona'].version}"
+    hit = response_cache.lookup(cache_coach_key, turn['sanitized_message'], retrieved_context_str, embedding)
+    if hit is None:
+        turn['cache_request'] = (cache_coach_key, turn['sanitized_message'], retrieved_context_str, embedding)
+        return None
+
+    answer, match = hit
+    stats = response_cache.stats()
+    match_desc = f"similarity {match:.3f}" if isinstance(match, float) else match
+    logging.info(f"ID:{message_id} - Response cache hit ({match_desc}). Hit rate {stats['hit_rate']:.1%}, "
+                 f"LLM calls saved {stats['llm_calls_saved']}, LLM time saved {stats['latency_saved_s']:.1f}s.")
+    return {'message_id': message_id, 'answer': answer, 'conversation': conversation_ref(turn)}
+
+
+def cache_answer(prepared_turn, answer, llm_seconds):
+    """ Stores a generated answer if the turn was cacheable. Doesn't need the request context. """
+    cache_request = prepared_turn.get('cache_request')
+    if cache_request is None or not answer:
+        return
+    if prepared_turn['conversation']['denial_filter'].is_denial(answer):
+        return # Never replay an out-of-character answer
+    coach_key, sanitized_message, retrieved_context_str, embedding = cache_request
+    try:
+        response_cache.store(coach_key, sanitized_message, retrieved_context_str, answer, llm_seconds, embedding)
+    except Exception as e:
+        logging.error(f"ID:{prepared_turn['message_id']} - Failed to cache response: {e}", exc_info=True)
+
+
+def finish_chat_turn(turn, retrieved_context_str, rag_search_performed, past_conversation_messages):
+    messages_to_send, budget_report = build_prompt_messages(turn['persona'], past_conversation_messages, retrieved_context_str, turn['sanitized_message'], turn['message_id'])
+    return {'message_id': turn['message_id'], 'messages': messages_to_send, 'rag_search_performed': rag_search_performed,
+            'prompt_tokens': budget_report.prompt_tokens, 'conversation': conversation_ref(turn),
+            'cache_request': turn.get('cache_request'), 'timings': turn['timings']}
+
+
+# --- Concurrent Pre-LLM Stages ---
+# Retrieval and history loading don't depend on each other, so they run side by
+# side, each with its own time budget. A stage that overruns is abandoned (its
+# thread finishes in the background) and the turn continues with a fallback.
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "2.0")) # Seconds; then answer without context
+HISTORY_TIMEOUT = float(os.getenv("HISTORY_TIMEOUT", "1.0"))     # Seconds; then answer without history
+PREPARE_WORKERS = int(os.getenv("PREPARE_WORKERS", "16"))
+# Threads are started on first use, so none exist yet in a preloading gunicorn master
+prepare_executor = ThreadPoolExecutor(max_workers=PREPARE_WORKERS, thread_name_prefix="prepare")
+
+def timed_call(fn, *args):
+    """ Returns (fn(*args), seconds it took). Timed where it runs, so queueing isn't counted. """
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def stage_fallback(turn, stage, timeout, fallback):
+    """ Records an overrun stage and returns the value the turn continues with instead. """
+    turn['timings'][stage] = timeout
+    turn.setdefault('timed_out', []).append(stage)
+    if stage == 'retrieval':
+        metrics.count_rag_search("timeout") # The abandoned search is still counted when it finishes
+    logging.warning(f"ID:{turn['message_id']} - Stage '{stage}' exceeded its {timeout:.2f}s budget. Continuing without it.")
+    return fallback
+
+
+def await_stage(turn, stage, future, timeout, fallback):
+    """ Waits up to `timeout` seconds for a timed_call() future. """
+    try:
+        result, seconds = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel() # Only helps if it never started; otherwise it finishes unobserved
+        return stage_fallback(turn, stage, timeout, fallback)
+    turn['timings'][stage] = seconds
+    return result
+
+
+def log_stage_timings(prepared_turn, started, answered_by):
+    """ Logs the per-stage timings of a prepared turn against its message ID and records them in /metrics. """
+    timings = prepared_turn.setdefault('timings', {})
+    timings['prepare_total'] = time.perf_counter() - started
+    for stage, seconds in timings.items():
+        metrics.observe_stage(stage, seconds)
+    metrics.count_chat_turn(answered_by)
+    stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+    logging.info(f"ID:{prepared_turn['message_id']} - Pre-LLM stages: {stages} (answered by {answered_by})")
+    return prepared_turn
+
+
+def prepare_chat_turn(data, endpoint="POST /"):
+    """
+    Runs everything that happens before the LLM call: validation, persona lookup,
+    the intent fast path, RAG search, history management and the response cache.
+    RAG search and history loading run concurrently, each within its own budget
+    (RETRIEVAL_TIMEOUT, HISTORY_TIMEOUT); an overrun degrades to no context or
+    no history instead of delaying the answer.
+
+    Returns:
+        dict: Always has 'message_id' and 'conversation' (for record_exchange()).
+              Has 'answer' if the turn was answered without the LLM (fast-path intent
+              or cache hit; a coach switch also sets 'switch_coach'), otherwise
+              'messages' ready to send to Gemini, 'rag_search_performed' and the
+              estimated 'prompt_tokens'. 'timings' holds seconds per stage.
+
+    Raises:
+        ChatRequestError: If the request is invalid or the coach cannot be loaded.
+    """
+    started = time.perf_counter()
+    turn = start_chat_turn(data, endpoint)
+
+    # --- Intent Fast Path (jokes, greetings, help, coach switch) ---
+    routed_answer, turn['timings']['intent'] = timed_call(route_intent, turn)
+    if routed_answer is not None:
+        routed_answer['timings'] = turn['timings']
+        return log_stage_timings(routed_answer, started, 'intent')
+
+    # --- RAG Processing and Conversation History, concurrently ---
+    retrieval = prepare_executor.submit(timed_call, retrieve_context, turn['sanitized_message'], turn['message_id'], turn['persona'].data.get('rag_tags'))
+    # The session update needs the request context, so it stays on this thread
+    history = prepare_executor.submit(timed_call, load_turn_history, turn, note_current_coach(turn))
+    past_conversation_messages = await_stage(turn, 'history', history, HISTORY_TIMEOUT, [])
+    retrieved_context_str, rag_search_performed = await_stage(turn, 'retrieval', retrieval, RETRIEVAL_TIMEOUT, ("", False))
+
+    # --- Response Cache ---
+    cached_answer, turn['timings']['cache'] = timed_call(lookup_cached_answer, turn, retrieved_context_str, past_conversation_messages)
+    if cached_answer is not None:
+        cached_answer['timings'] = turn['timings']
+        return log_stage_timings(cached_answer, started, 'cache')
+
+    return log_stage_timings(finish_chat_turn(turn, retrieved_context_str, rag_search_performed, past_conversation_messages), started, 'llm')
+
+
+def build_prompt_messages(coach_persona, past_conversation_messages, retrieved_context_str, sanitized_message, message_id):
+    """
+    Combines System (persona) + past history + final Human message with context/query,
+    trimmed to the prompt token budget (see context_builder.py).
+
+    Returns:
+        tuple: (messages_to_send, PromptBudgetReport)
+    """
+    # 1. System Message (Persona)
+    system_prompt_content = coach_persona.prompt_prefix
+    logging.debug(f"ID:{message_id} - SystemMessage: '{system_prompt_content[:150]}...'")
+
+    # 2. Construct the Final Human Message (incorporating context if available)
+    def final_human_content(context_str):
+        final_prompt_parts = []
+        if context_str:
+            # Add context clearly labelled
+            final_prompt_parts.append("--- Start of Provided Context ---")
+            final_prompt_parts.append(context_str)
+            final_prompt_parts.append("--- End of Provided Context ---")
+            final_prompt_parts.append("\nBased on the context above and our previous conversation, answer the following query:")
+
+        # Always include the user's latest query
+        final_prompt_parts.append(f"User Query: {sanitized_message}")
+        return "\n".join(final_prompt_parts)
+
+    # 3. Combine all messages, dropping the oldest history (and lowest ranked context) over budget
+    messages_to_send, budget_report = context_builder.build_prompt(system_prompt_content, past_conversation_messages, retrieved_context_str, final_human_content)
+    logging.debug(f"ID:{message_id} - Final HumanMessage content: '{messages_to_send[-1].content[:200]}...'")
+    logging.info(f"ID:{message_id} - Prompt tokens (est.): {budget_report.prompt_tokens}/{budget_report.budget or 'unlimited'}, "
+                 f"history kept {budget_report.history_kept}/{budget_report.history_kept + budget_report.history_dropped}, "
+                 f"context {budget_report.context_tokens} tokens ({budget_report.context_docs_dropped} docs dropped), summary {budget_report.summary_tokens} tokens.")
+    logging.debug(f"ID:{message_id} - Total messages being sent to Gemini: {len(messages_to_send)}")
+    # Optional: Log full message list structure if needed for deep debugging
+    # logging.debug(f"ID:{message_id} - Messages structure: {[type(m).__name__ for m in messages_to_send]}")
+    return messages_to_send, budget_report
+
+
+# --- Response Cleanup ---
+MARKDOWN_EMPHASIS_RE = re.compile(r'[\*]+')
+
+def clean_answer(answer):
+    """ Strips whitespace and markdown emphasis from a complete model answer. """
+    return MARKDOWN_EMPHASIS_RE.sub('', answer.strip()).strip()
+
+
+class StreamingAnswerCleaner:
+    """
+    Applies clean_answer() incrementally to streamed chunks. Leading whitespace is
+    dropped and trailing whitespace is held back until more text arrives, so the
+    concatenated output equals clean_answer() of the full answer.
+    """
+    def __init__(self):
+        self._started = False
+        self._pending_whitespace = ""
+
+    def feed(self, chunk):
+        text = MARKDOWN_EMPHASIS_RE.sub('', chunk)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._pending_whitespace += text
+            return ""
+        cleaned = self._pending_whitespace + stripped
+        self._pending_whitespace = text[len(stripped):]
+        return cleaned
+
+
+def _chunk_text(content):
+    # Streamed chunk content is usually a string, but may be a list of parts
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else str(part.get('text', '')) for part in content)
+    return str(content)
+
+
+def sse_event(event, payload):
+    """ Formats one Server-Sent Event with a JSON payload. """
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
 
 # --- Routes ---
 @app.route('/', methods=['GET', 'POST'])
@@ -192,144 +739,42 @@ def index():
     coach_sidebar_list = load_coach_sidebar_data() # Load for GET and potential errors
 
     if request.method == 'POST':
-        data = request.get_json()
-        if not data:
-            logging.error("POST / - No JSON data received")
-            return jsonify({'error': 'No data provided'}), 400
-
-        message = data.get('message')
-        coach_display_name = data.get('coach_name')
-        history_from_frontend = data.get('history', [])
-
-        # Basic input validation
-        if not message or not coach_display_name:
-            logging.warning(f"POST / - Missing fields: message={bool(message)}, coach_name={bool(coach_display_name)}")
-            return jsonify({'error': 'Missing message or coach name'}), 400
-
-        sanitized_message = sanitize_input(message)
-        message_id = str(uuid.uuid4()) # Unique ID for this request
-        logging.info(f"POST / - Request ID: {message_id} - Coach: '{coach_display_name}', Msg: '{sanitized_message[:50]}...'")
-
-        # --- Coach Persona Loading ---
-        coach_filename = f"{coach_display_name.lower().replace(' ', '_')}.json"
-        coach_filepath = os.path.join(COACH_DATA_DIR, coach_filename)
-        coach_persona = None
         try:
-            with open(coach_filepath, "r", encoding='utf-8') as f:
-                coach_persona = json.load(f)
-            logging.debug(f"ID:{message_id} - Successfully loaded persona: {coach_filepath}")
-            if "prompt_prefix" not in coach_persona or not coach_persona["prompt_prefix"]:
-                 logging.error(f"ID:{message_id} - CRITICAL: 'prompt_prefix' missing or empty in {coach_filepath}")
-                 return jsonify({'error': 'Internal server error: Coach configuration invalid.'}), 500
-            # --- IMPORTANT REMINDER ---
-            logging.info(f"ID:{message_id} - REMINDER: Ensure prompt_prefix in {coach_filename} instructs model to use provided 'Context:' if available.")
-            # --- END REMINDER ---
-        except FileNotFoundError:
-            logging.error(f"ID:{message_id} - Coach data file not found: {coach_filepath}")
-            return jsonify({'error': f'Coach configuration for "{coach_display_name}" not found.'}), 400
-        except json.JSONDecodeError as e:
-            logging.error(f"ID:{message_id} - Error decoding JSON from {coach_filepath}: {e}")
-            return jsonify({'error': 'Error loading coach configuration.'}), 500
-        except Exception as e:
-            logging.error(f"ID:{message_id} - Unexpected error loading coach data from {coach_filepath}: {e}", exc_info=True)
-            return jsonify({'error': 'Internal server error loading coach data.'}), 500
-
-        # --- Dad Joke Trigger ---
-        joke_triggers = ["joke", "dad joke", "make me laugh", "something funny", "cheer me up"]
-        if any(trigger in sanitized_message.lower() for trigger in joke_triggers):
-            dad_joke = get_dad_joke()
-            answer = f"Okay, you asked for it! Here’s a dad joke: {dad_joke}"
-            logging.info(f"ID:{message_id} - Dad joke triggered. Response: '{answer[:100]}...'")
-            return jsonify({'answer': answer, 'message_id': message_id})
-
-        # --- RAG Processing ---
-        retrieved_context_str = ""
-        rag_search_performed = False
-        if RAG_ENABLED: # Check if components loaded successfully at startup
-            try:
-                logging.debug(f"ID:{message_id} - Performing RAG search...")
-                retrieved_docs = rag_processor.search_documents(sanitized_message, k=3) # Get top 3 docs
-                rag_search_performed = True
-                if retrieved_docs:
-                    # Format the retrieved documents into a string block
-                    context_parts = ["Context related to your query:"]
-                    for i, doc in enumerate(retrieved_docs, 1):
-                        context_parts.append(f"[{i}] {doc}") # Add numbering
-                    retrieved_context_str = "\n".join(context_parts)
-                    logging.debug(f"ID:{message_id} - RAG search found {len(retrieved_docs)} documents. Context snippet: {retrieved_context_str[:150]}...")
-                else:
-                    logging.debug(f"ID:{message_id} - RAG search completed but found 0 relevant documents.")
-            except Exception as e:
-                 logging.error(f"ID:{message_id} - Error during RAG search execution: {e}", exc_info=True)
-                 # Proceed without context if RAG search fails
-        else:
-            logging.warning(f"ID:{message_id} - RAG is disabled or failed to load. Skipping vector search.")
-
-        # --- Conversation History Management ---
-        # Manage history BEFORE constructing the final prompt message
-        previous_coach = session.get('current_coach')
-        history_for_processing = []
-        if previous_coach and coach_display_name == previous_coach:
-            history_for_processing = history_from_frontend
-            logging.debug(f"ID:{message_id} - Same coach. Using frontend history (len: {len(history_for_processing)}).")
-        else:
-            logging.info(f"ID:{message_id} - Coach changed from '{previous_coach}' to '{coach_display_name}' or first message. Clearing history for model.")
-        session['current_coach'] = coach_display_name # Update session
+            turn = prepare_chat_turn(request.get_json(silent=True))
+        except ChatRequestError as e:
+            return jsonify({'error': e.message}), e.status
 
-        # Get the list of past HumanMessage/AIMessage pairs
-        # Pass `None` for new_sanitized_message as we'll build the final prompt separately
-        past_conversation_messages = manage_conversation_history(history_for_processing, None)
+        message_id = turn['message_id']
+        if 'answer' in turn:
+            record_exchange(turn, turn['answer'])
+            return jsonify(answer_payload(turn, turn['answer']))
 
-        # --- Prepare messages for Gemini ---
         try:
             chat_model = create_gemini_chat_model()
 
-            # 1. System Message (Persona)
-            system_prompt_content = coach_persona["prompt_prefix"]
-            system_message_obj = SystemMessage(content=system_prompt_content)
-            logging.debug(f"ID:{message_id} - SystemMessage: '{system_prompt_content[:150]}...'")
-
-            # 2. Construct the Final Human Message (incorporating context if available)
-            final_prompt_parts = []
-            if retrieved_context_str:
-                # Add context clearly labelled
-                final_prompt_parts.append("--- Start of Provided Context ---")
-                final_prompt_parts.append(retrieved_context_str)
-                final_prompt_parts.append("--- End of Provided Context ---")
-                final_prompt_parts.append("\nBased on the context above and our previous conversation, answer the following query:")
-
-            # Always include the user's latest query
-            final_prompt_parts.append(f"User Query: {sanitized_message}")
-
-            final_human_content = "\n".join(final_prompt_parts)
-            final_human_message = HumanMessage(content=final_human_content)
-            logging.debug(f"ID:{message_id} - Final HumanMessage content: '{final_human_content[:200]}...'")
-
-            # 3. Combine all messages: System + Past History + Final Human message with Context/Query
-            messages_to_send = [system_message_obj] + past_conversation_messages + [final_human_message]
-            logging.debug(f"ID:{message_id} - Total messages being sent to Gemini: {len(messages_to_send)}")
-            # Optional: Log full message list structure if needed for deep debugging
-            # logging.debug(f"ID:{message_id} - Messages structure: {[type(m).__name__ for m in messages_to_send]}")
-
             # --- Invoke Gemini ---
             logging.debug(f"ID:{message_id} - Invoking Gemini model...")
-            response = chat_model.invoke(messages_to_send)
+            start_time = time.time()
+            response = chat_model.invoke(turn['messages'])
             answer = response.content
 
             # Response processing
             if not isinstance(answer, str):
                 logging.warning(f"ID:{message_id} - Gemini response content was not a string ({type(answer)}). Converting.")
                 answer = str(answer)
-            answer = answer.strip()
-            answer = re.sub(r'[\*]+', '', answer).strip() # Remove markdown emphasis
+            answer = clean_answer(answer) # Remove markdown emphasis
 
-            logging.info(f"ID:{message_id} - Gemini Call Successful. Answer: '{answer[:100]}...'")
-            return jsonify({'answer': answer, 'message_id': message_id})
+            llm_seconds = time.time() - start_time
+            metrics.observe_stage('llm_total', llm_seconds)
+            logging.info(f"ID:{message_id} - Gemini Call Successful in {llm_seconds:.2f}s (prompt tokens est. {turn['prompt_tokens']}). Answer: '{answer[:100]}...'")
+            record_exchange(turn, answer)
+            cache_answer(turn, answer, llm_seconds)
+            return jsonify(answer_payload(turn, answer))
 
         except Exception as e:
             error_id = message_id # Use the unique ID for error reference
             # Add specific context about where the error occurred
-            step = "RAG search" if rag_search_performed else "Gemini API call or processing"
+            step = "RAG search" if turn['rag_search_performed'] else "Gemini API call or processing"
             logging.error(f"ID:{error_id} - Error during {step}: {e}", exc_info=True)
             # Attach error ID to the exception object for the 500 handler
             setattr(e, 'error_id', error_id)
@@ -340,6 +785,62 @@ def index():
     return render_template('index.html', coaches=coach_sidebar_list)
 
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of POST /. Emits Server-Sent Events:
+    'token' ({text}) for each cleaned chunk, then 'done' ({answer, message_id,
+    conversation_id[, switch_coach]}) or 'error' ({error, message_id}).
+    """
+    try:
+        turn = prepare_chat_turn(request.get_json(silent=True), endpoint="POST /chat/stream")
+    except ChatRequestError as e:
+        return jsonify({'error': e.message}), e.status
+
+    message_id = turn['message_id']
+
+    def generate():
+        if 'answer' in turn:
+            record_exchange(turn, turn['answer'])
+            yield sse_event('token', {'text': turn['answer']})
+            yield sse_event('done', answer_payload(turn, turn['answer']))
+            return
+
+        cleaner = StreamingAnswerCleaner()
+        answer_parts = []
+        start_time = time.time()
+        first_token_time = None
+        try:
+            chat_model = create_gemini_chat_model()
+            logging.debug(f"ID:{message_id} - Streaming from Gemini model...")
+            for chunk in chat_model.stream(turn['messages']):
+                text = cleaner.feed(_chunk_text(chunk.content))
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    metrics.observe_stage('llm_ttfb', first_token_time - start_time)
+                    logging.debug(f"ID:{message_id} - First token after {first_token_time - start_time:.2f}s.")
+                answer_parts.append(text)
+                yield sse_event('token', {'text': text})
+
+            answer = "".join(answer_parts)
+            llm_seconds = time.time() - start_time
+            metrics.observe_stage('llm_total', llm_seconds)
+            ttfb = f"first token {first_token_time - start_time:.2f}s, " if first_token_time else ""
+            logging.info(f"ID:{message_id} - Gemini Stream Successful in {llm_seconds:.2f}s ({ttfb}prompt tokens est. {turn['prompt_tokens']}). Answer: '{answer[:100]}...'")
+            record_exchange(turn, answer)
+            cache_answer(turn, answer, llm_seconds)
+            yield sse_event('done', answer_payload(turn, answer))
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logging.error(f"ID:{message_id} - Error during Gemini streaming: {e}", exc_info=True)
+            yield sse_event('error', {'error': f'An unexpected error occurred (Ref: {message_id}).', 'message_id': message_id})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # --- Other Routes and Error Handlers ---
 
 # /coach/<coach_url_name> remains the same
@@ -364,7 +865,7 @@ def coach_page(coach_url_name):
             coach_sidebar_list = load_coach_sidebar_data()
             current_coach_details = next((c for c in coach_sidebar_list if c['url_name'] == coach_url_name), None)
             # Make RAG status available to templates if needed (optional)
-            # return render_template(template_filename, coaches=coach_sidebar_list, current_coach=current_coach_details, rag_enabled=RAG_ENABLED)
+            # return render_template(template_filename, coaches=coach_sidebar_list, current_coach=current_coach_details, rag_enabled=rag_processor.are_rag_components_loaded())
             return render_template(template_filename, coaches=coach_sidebar_list, current_coach=current_coach_details)
 
         else:
@@ -374,15 +875,90 @@ def coach_page(coach_url_name):
         logging.warning(f"No template mapping found for coach URL name: {coach_url_name}")
         abort(404, description=f"Coach '{coach_url_name}' not recognized.")
 
-# /feedback remains the same
+# --- Metrics ---
+def _rag_index_stats():
+    status = rag_processor.get_index_status()
+    active = status['active'] or {}
+    return {'version': active.get('name'), 'generation': active.get('generation'), 'documents': active.get('documents'),
+            'swaps': status['swaps'], 'failed_swaps': status['failed_swaps']}
+
+
+# Stages timed inside other modules (embedding_encode, faiss_search, joke_fetch) record
+# themselves; the component stats below are read at scrape time.
+metrics.REGISTRY.register_collector("lifecoach_intent_routed", "Messages per routed intent ('none' = RAG + LLM)", lambda: get_intent_router().stats())
+metrics.REGISTRY.register_collector("lifecoach_conversation_store", "Conversation store", conversation_store.stats)
+metrics.REGISTRY.register_collector("lifecoach_jokes", "Dad joke provider", joke_provider.stats)
+metrics.REGISTRY.register_collector("lifecoach_llm_pool", "Gemini client pool (client objects, not connections)", llm_client.get_pool_stats)
+metrics.REGISTRY.register_collector("lifecoach_rag_cache", "RAG embedding and result caches", rag_processor.get_cache_stats)
+metrics.REGISTRY.register_collector("lifecoach_rag_rerank", "RAG candidates, cutoff and duplicate drops", rag_processor.get_rerank_stats)
+metrics.REGISTRY.register_collector("lifecoach_rag_scope_docs", "Documents per coach search scope (0 = whole index)", rag_processor.get_scope_stats)
+metrics.REGISTRY.register_collector("lifecoach_rag_load", "RAG component loading", lambda: {'state': rag_processor.get_load_status()['state'], 'loaded': rag_processor.are_rag_components_loaded()})
+metrics.REGISTRY.register_collector("lifecoach_rag_index", "Active FAISS index version and hot swaps", _rag_index_stats)
+metrics.REGISTRY.register_collector("lifecoach_feedback", "Feedback queue and batched writes", feedback_writer.stats)
+if response_cache is not None:
+    metrics.REGISTRY.register_collector("lifecoach_response_cache", "Response cache", response_cache.stats)
+
+
+def _start_template_timer(sender, template, context, **extra):
+    g.template_render_started = time.perf_counter()
+
+
+def _observe_template_render(sender, template, context, **extra):
+    started = g.pop('template_render_started', None)
+    if started is not None:
+        metrics.observe_stage('template_render', time.perf_counter() - started)
+
+
+if metrics.REGISTRY.enabled:
+    before_render_template.connect(_start_template_timer, app)
+    template_rendered.connect(_observe_template_render, app)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """ Stage latency histograms, RAG outcome counters and component stats in Prometheus text format. """
+    if not metrics.REGISTRY.enabled:
+        abort(404, description="Metrics are disabled (METRICS_ENABLED=0).")
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Health Checks ---
+@app.route('/healthz')
+def healthz():
+    """ Liveness: the process is up and serving requests. """
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: the app serves chats as soon as it starts, so this is 200 unless
+    ?require_rag=1 is given, in which case it is 503 until RAG has loaded.
+    """
+    rag_status = rag_processor.get_load_status()
+    rag_ready = rag_status['state'] == 'loaded'
+    ready = rag_ready or request.args.get('require_rag') != '1'
+    body = {
+        'status': 'ready' if ready else 'loading',
+        'uptime_s': round(time.time() - APP_STARTED_AT, 3),
+        'lazy_init': RAG_LAZY_INIT,
+        'rag': rag_status,
+        'rag_index': rag_processor.get_index_status(),
+    }
+    return jsonify(body), 200 if ready else 503
+
+
 @app.route('/feedback', methods=['POST'])
 def feedback():
-     # ... (previous code is fine) ...
-    data = request.get_json()
-    if not data or 'message_id' not in data or 'rating' not in data:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'message_id' not in data or 'rating' not in data:
         return jsonify({'error': 'Invalid feedback data'}), 400
-    logging.info(f"Feedback Received: Message ID {data['message_id']}, Rating: {data['rating']}, Comment: {data.get('comment', 'N/A')}")
-    # Consider storing feedback persistently here
+    record = make_record(data['message_id'], data['rating'], data.get('comment'),
+                         coach=session.get('current_coach'), conversation_id=session.get('conversation_id'))
+    if not feedback_writer.submit(record):
+        # Queue full: the writer is behind; tell the client to retry rather than wait here
+        logging.warning(f"Feedback queue full. Dropped feedback for message ID {record['message_id']}.")
+        return jsonify({'error': 'Feedback is temporarily unavailable. Please try again.'}), 503
     return jsonify({'status': 'success', 'message': 'Feedback received. Thank you!'})
 
 
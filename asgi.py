@@ -0,0 +1,347 @@
+# asgi.py
+#
+# ASGI entry point with a natively async chat pipeline. The chat endpoints
+# (POST / and POST /chat/stream) run on the event loop: the Gemini call is
+# awaited, RAG search runs on a bounded thread pool and conversation/cache
+# storage on an I/O pool, so a single worker process can keep hundreds of
+# conversations in flight while it waits on upstreams. Every other route is
+# served by the Flask app unchanged, on a pool of WSGI threads.
+#
+# Run with:
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 2 -b 0.0.0.0:8080 asgi:application
+#   (or: uvicorn asgi:application --port 8080)
+
+import os
+import asyncio
+import logging
+import time
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.test import EnvironBuilder
+from flask import request, jsonify
+
+import metrics
+import app as flask_app_module
+from app import app, ChatRequestError
+
+# --- Configuration ---
+# RAG search is CPU bound (MiniLM encode + FAISS), so keep this near the core count.
+RAG_THREAD_POOL_SIZE = int(os.getenv("RAG_THREAD_POOL_SIZE", str(os.cpu_count() or 2)))
+# Blocking I/O (conversation store, response cache) only waits, so it can be wider.
+IO_THREAD_POOL_SIZE = int(os.getenv("IO_THREAD_POOL_SIZE", "32"))
+# Concurrent requests to the other (Flask) routes: pages, /feedback, /metrics, /readyz, /assets/...
+WSGI_THREAD_POOL_SIZE = int(os.getenv("WSGI_THREAD_POOL_SIZE", "16"))
+
+rag_executor = ThreadPoolExecutor(max_workers=RAG_THREAD_POOL_SIZE, thread_name_prefix="rag")
+io_executor = ThreadPoolExecutor(max_workers=IO_THREAD_POOL_SIZE, thread_name_prefix="io")
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREAD_POOL_SIZE, thread_name_prefix="wsgi")
+
+CHAT_ROUTES = {
+    "/": "POST /",
+    "/chat/stream": "POST /chat/stream",
+}
+
+
+async def run_blocking(executor, fn, *args):
+    """ Runs a blocking function on one of the bounded pools and awaits the result. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, fn, *args)
+
+
+async def run_stage(turn, stage, executor, timeout, fallback, fn, *args):
+    """ Awaits a blocking stage within its time budget, like app.await_stage(). """
+    try:
+        result, seconds = await asyncio.wait_for(run_blocking(executor, flask_app_module.timed_call, fn, *args), timeout)
+    except asyncio.TimeoutError:
+        return flask_app_module.stage_fallback(turn, stage, timeout, fallback)
+    turn['timings'][stage] = seconds
+    return result
+
+
+# --- Async Chat Pipeline ---
+async def aprepare_chat_turn(data, endpoint):
+    """ Async counterpart of app.prepare_chat_turn(); same stages, same result shape. """
+    started = time.perf_counter()
+    turn = flask_app_module.start_chat_turn(data, endpoint)
+
+    # Rule matching and the prefetched jokes don't block; the optional embedding classifier does
+    if flask_app_module.get_intent_router().embedding_threshold > 0:
+        routed_answer, turn['timings']['intent'] = await run_blocking(rag_executor, flask_app_module.timed_call, flask_app_module.route_intent, turn)
+    else:
+        routed_answer, turn['timings']['intent'] = flask_app_module.timed_call(flask_app_module.route_intent, turn)
+    if routed_answer is not None:
+        routed_answer['timings'] = turn['timings']
+        return flask_app_module.log_stage_timings(routed_answer, started, 'intent')
+
+    # Retrieval and history run concurrently. The session update needs the request
+    # context, so it stays on the loop; the conversation store may be SQLite or
+    # Redis, so reading it goes to the I/O pool
+    same_coach = flask_app_module.note_current_coach(turn)
+    (retrieved_context_str, rag_search_performed), past_conversation_messages = await asyncio.gather(
+        run_stage(turn, 'retrieval', rag_executor, flask_app_module.RETRIEVAL_TIMEOUT, ("", False),
+                  flask_app_module.retrieve_context, turn['sanitized_message'], turn['message_id'], turn['persona'].data.get('rag_tags')),
+        run_stage(turn, 'history', io_executor, flask_app_module.HISTORY_TIMEOUT, [],
+                  flask_app_module.load_turn_history, turn, same_coach))
+
+    # May read the response cache's SQLite tier
+    cached_answer, turn['timings']['cache'] = await run_blocking(
+        io_executor, flask_app_module.timed_call, flask_app_module.lookup_cached_answer, turn, retrieved_context_str, past_conversation_messages)
+    if cached_answer is not None:
+        cached_answer['timings'] = turn['timings']
+        return flask_app_module.log_stage_timings(cached_answer, started, 'cache')
+
+    return flask_app_module.log_stage_timings(
+        flask_app_module.finish_chat_turn(turn, retrieved_context_str, rag_search_performed, past_conversation_messages), started, 'llm')
+
+
+async def agenerate_answer(turn):
+    message_id = turn['message_id']
+    chat_model = flask_app_module.create_gemini_chat_model()
+    logging.debug(f"ID:{message_id} - Invoking Gemini model (async)...")
+    start_time = time.time()
+    response = await chat_model.ainvoke(turn['messages'])
+    answer = response.content
+    if not isinstance(answer, str):
+        logging.warning(f"ID:{message_id} - Gemini response content was not a string ({type(answer)}). Converting.")
+        answer = str(answer)
+    answer = flask_app_module.clean_answer(answer)
+    llm_seconds = time.time() - start_time
+    metrics.observe_stage('llm_total', llm_seconds)
+    logging.info(f"ID:{message_id} - Gemini Call Successful in {llm_seconds:.2f}s (prompt tokens est. {turn['prompt_tokens']}). Answer: '{answer[:100]}...'")
+    await run_blocking(io_executor, flask_app_module.cache_answer, turn, answer, llm_seconds)
+    return answer
+
+
+async def arecord_exchange(turn, answer):
+    await run_blocking(io_executor, flask_app_module.record_exchange, turn, answer)
+
+
+async def astream_events(turn):
+    """ Yields SSE-formatted strings, mirroring app.chat_stream(). """
+    message_id = turn['message_id']
+    if 'answer' in turn:
+        await arecord_exchange(turn, turn['answer'])
+        yield flask_app_module.sse_event('token', {'text': turn['answer']})
+        yield flask_app_module.sse_event('done', flask_app_module.answer_payload(turn, turn['answer']))
+        return
+
+    cleaner = flask_app_module.StreamingAnswerCleaner()
+    answer_parts = []
+    start_time = time.time()
+    first_token_time = None
+    try:
+        chat_model = flask_app_module.create_gemini_chat_model()
+        async for chunk in chat_model.astream(turn['messages']):
+            text = cleaner.feed(flask_app_module._chunk_text(chunk.content))
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    metrics.observe_stage('llm_ttfb', first_token_time - start_time)
+                answer_parts.append(text)
+                yield flask_app_module.sse_event('token', {'text': text})
+        answer = "".join(answer_parts)
+        llm_seconds = time.time() - start_time
+        metrics.observe_stage('llm_total', llm_seconds)
+        ttfb = f"first token {first_token_time - start_time:.2f}s, " if first_token_time else ""
+        logging.info(f"ID:{message_id} - Gemini Stream Successful in {llm_seconds:.2f}s ({ttfb}prompt tokens est. {turn['prompt_tokens']}). Answer: '{answer[:100]}...'")
+        await arecord_exchange(turn, answer)
+        await run_blocking(io_executor, flask_app_module.cache_answer, turn, answer, llm_seconds)
+        yield flask_app_module.sse_event('done', flask_app_module.answer_payload(turn, answer))
+    except Exception as e:
+        logging.error(f"ID:{message_id} - Error during Gemini streaming: {e}", exc_info=True)
+        yield flask_app_module.sse_event('error', {'error': f'An unexpected error occurred (Ref: {message_id}).', 'message_id': message_id})
+
+
+# --- ASGI Plumbing ---
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _build_environ(scope, body):
+    # Just enough WSGI environ for Flask to parse the JSON body and the session cookie
+    headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope.get("headers", [])]
+    host = next((value for name, value in headers if name.lower() == "host"), None)
+    if host is None and scope.get("server"):
+        host = f"{scope['server'][0]}:{scope['server'][1]}"
+    builder = EnvironBuilder(
+        path=scope["path"],
+        base_url=f"{scope.get('scheme', 'http')}://{host or 'localhost'}{scope.get('root_path', '')}",
+        method=scope["method"],
+        headers=headers,
+        data=body,
+        query_string=scope.get("query_string", b"").decode("latin-1"),
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _asgi_headers(response):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+
+
+async def _send_flask_response(send, response):
+    body = response.get_data()
+    await send({"type": "http.response.start", "status": response.status_code, "headers": _asgi_headers(response)})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def handle_chat(scope, receive, send):
+    endpoint = CHAT_ROUTES[scope["path"]]
+    streaming = scope["path"] == "/chat/stream"
+    body = await _read_body(receive)
+
+    with app.request_context(_build_environ(scope, body)):
+        try:
+            turn = await aprepare_chat_turn(request.get_json(silent=True), endpoint)
+        except ChatRequestError as e:
+            response = jsonify({'error': e.message})
+            response.status_code = e.status
+            await _send_flask_response(send, app.process_response(response))
+            return
+        except Exception as e:
+            # What Flask's errorhandler(Exception) does for the sync endpoints
+            response = app.make_response(flask_app_module.internal_server_error(e))
+            await _send_flask_response(send, app.process_response(response))
+            return
+
+        if not streaming:
+            try:
+                answer = turn['answer'] if 'answer' in turn else await agenerate_answer(turn)
+                await arecord_exchange(turn, answer)
+                response = jsonify(flask_app_module.answer_payload(turn, answer))
+            except Exception as e:
+                setattr(e, 'error_id', turn['message_id'])
+                response = app.make_response(flask_app_module.internal_server_error(e))
+            await _send_flask_response(send, app.process_response(response))
+            return
+
+        # Streaming: headers (including the updated session cookie) go out first
+        response = app.response_class(mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response = app.process_response(response)
+        headers = [(name, value) for name, value in _asgi_headers(response) if name != b"content-length"]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        try:
+            async for event in astream_events(turn):
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        except Exception as e:
+            # The status is already sent; end the stream with an error event the client understands
+            message_id = turn['message_id']
+            logging.error(f"ID:{message_id} - Error while streaming the response: {e}", exc_info=True)
+            error = flask_app_module.sse_event('error', {'error': f'An unexpected error occurred (Ref: {message_id}).', 'message_id': message_id})
+            try:
+                await send({"type": "http.response.body", "body": error.encode("utf-8"), "more_body": True})
+            except Exception:
+                pass # Client already gone
+        await send({"type": "http.response.body", "body": b""})
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    asgiref's WsgiToAsgi, but each request runs on `executor` instead of asgiref's
+    single thread-sensitive thread, so one slow page or asset doesn't queue up every
+    other non-chat request in the process.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise ValueError("WSGI wrapper received a non-HTTP scope")
+        self.scope = scope
+        loop = asyncio.get_running_loop()
+        # Called from the pool thread: hand each message to the event loop and wait for it
+        self.sync_send = lambda message: asyncio.run_coroutine_threadsafe(send(message), loop).result()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return # Client disconnected before sending the whole body
+                body.write(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+            await loop.run_in_executor(self.executor, self.run_wsgi_app, body)
+
+    def run_wsgi_app(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            self.sync_send({"type": "http.response.start", "status": 400, "headers": [(b"content-type", b"text/plain")]})
+            self.sync_send({"type": "http.response.body", "body": b"Bad Request: Too many duplicate headers"})
+            return
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            bytes_sent = 0
+            for output in result:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+        finally:
+            if hasattr(result, "close"):
+                result.close() # Releases send_file's open file
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class ChatASGIApp:
+    """ Routes the chat endpoints to the async pipeline and everything else to Flask. """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_fallback = PooledWsgiToAsgi(wsgi_app, wsgi_executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in CHAT_ROUTES:
+            await handle_chat(scope, receive, send)
+            return
+        await self.wsgi_fallback(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Write out queued feedback now rather than relying on atexit
+                await asyncio.get_running_loop().run_in_executor(None, flask_app_module.feedback_writer.close)
+                rag_executor.shutdown(wait=False)
+                io_executor.shutdown(wait=False)
+                wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = ChatASGIApp(app)
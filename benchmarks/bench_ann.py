@@ -0,0 +1,98 @@
+# benchmarks/bench_ann.py
+#
+# Recall@k, single-query latency and index memory for every index type that
+# faissmaker.py can build, at several nprobe / efSearch settings. Ground truth
+# comes from the exact (flat) index.
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_ann --num-vectors 50000            # synthetic clustered vectors
+#   python -m benchmarks.bench_ann --corpus path/to/docs          # real corpus, embedded with MiniLM
+
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+import faissmaker
+import rag_processor
+
+
+def synthetic_vectors(num_vectors, dim, clusters=200, seed=0):
+    # Clustered data behaves much more like sentence embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=num_vectors)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(num_vectors, dim)).astype(np.float32)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(found_row[:k]) & set(truth_row[:k])) for found_row, truth_row in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def index_memory_mb(index):
+    return faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+
+def measure(index, queries, k):
+    latencies = []
+    found = []
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        _, indices = index.search(queries[row:row + 1], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(indices[0])
+    latencies.sort()
+    return np.array(found), latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types for the RAG corpus.")
+    parser.add_argument("--corpus", help="Directory/JSONL to embed. Synthetic vectors are used if omitted.")
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    if args.corpus:
+        vectors = faissmaker.embed_documents(faissmaker.load_corpus(args.corpus))
+    else:
+        vectors = synthetic_vectors(args.num_vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)] + 0.05 * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    print(f"{len(vectors)} vectors, d={vectors.shape[1]}, {args.queries} queries, k={args.k}\n")
+    print(f"{'index':<9} {'param':<14} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'mem MB':>8}")
+
+    for index_type in faissmaker.INDEX_TYPES:
+        start = time.perf_counter()
+        index = faissmaker.build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+        memory = index_memory_mb(index)
+
+        if index_type == "flat":
+            truth, p50, p99 = measure(index, queries, args.k)
+            settings = [("exact", truth, p50, p99)]
+        else:
+            settings = []
+            sweep = args.ef_search if index_type == "hnsw" else args.nprobe
+            for value in sweep:
+                if index_type == "hnsw":
+                    applied = rag_processor.apply_search_params(index, ef_search=value)
+                else:
+                    applied = rag_processor.apply_search_params(index, nprobe=value)
+                found, p50, p99 = measure(index, queries, args.k)
+                settings.append((", ".join(f"{k}={v}" for k, v in applied.items()), found, p50, p99))
+
+        for label, found, p50, p99 in settings:
+            print(f"{index_type:<9} {label:<14} {build_seconds:8.2f} {recall_at_k(found, truth, args.k):9.3f} {p50:8.3f} {p99:8.3f} {memory:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_denial_filter.py
+#
+# Compares the old denial check (rebuild the phrase list, lowercase each bot
+# message per phrase, one substring scan per phrase) against DenialFilter, both
+# cold (every message new) and warm (the same history re-posted each turn, as
+# clients without a server-side conversation do). --extra-phrases grows the
+# phrase set, e.g. to see the trie regex take over from plain scans.
+# Run from the repository root:  python -m benchmarks.bench_denial_filter --turns 15 100 1000
+
+import time
+import random
+import argparse
+
+from denial_filter import DenialFilter, DEFAULT_DENIAL_PHRASES
+
+FILLER = ("Patience you must have. The path to calm begins with a single breath, and with "
+          "each small step the mind settles. ").split()
+
+
+def make_history(turns, denial_ratio=0.1, words=120, seed=7):
+    rng = random.Random(seed)
+    history = []
+    for i in range(turns):
+        bot = " ".join(rng.choice(FILLER) for _ in range(words))
+        if rng.random() < denial_ratio:
+            bot += " As an AI, opinions I do not hold."
+        history.append({"user": f"Question number {i}?", "bot": bot})
+    return history
+
+
+# --- Baseline: the check manage_conversation_history() did before ---
+def legacy_filter(history, phrases):
+    denial_phrases = list(phrases) # Rebuilt on every call
+    return [turn["bot"] for turn in history if not any(phrase in turn["bot"].lower() for phrase in denial_phrases)]
+
+
+def compiled_filter(history, denial_filter):
+    return [turn["bot"] for turn in history if not denial_filter.is_denial(turn["bot"])]
+
+
+def time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compiled denial-phrase filter.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[15, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--extra-phrases", type=int, default=0, help="Random phrases added to the default set.")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    phrases = DEFAULT_DENIAL_PHRASES + tuple(f"zq{i} " + " ".join(rng.choice(FILLER).lower() for _ in range(2)) for i in range(args.extra_phrases))
+    print(f"{len(phrases)} phrases, {'trie regex' if DenialFilter(phrases)._regex is not None else 'substring scans'}\n")
+
+    print(f"{'turns':>6} {'legacy ms':>10} {'cold ms':>9} {'warm ms':>9} {'cold x':>7} {'warm x':>7}")
+    for turns in args.turns:
+        history = make_history(turns)
+        reference = legacy_filter(history, phrases)
+
+        warm_filter = DenialFilter(phrases)
+        assert compiled_filter(history, warm_filter) == reference
+
+        legacy = time_per_call(lambda: legacy_filter(history, phrases), args.repeat)
+        # Cache disabled, so every message is scanned
+        cold_filter = DenialFilter(phrases, cache_size=0)
+        cold = time_per_call(lambda: compiled_filter(history, cold_filter), args.repeat)
+        warm = time_per_call(lambda: compiled_filter(history, warm_filter), args.repeat)
+        print(f"{turns:>6} {legacy * 1000:>10.3f} {cold * 1000:>9.3f} {warm * 1000:>9.3f} {legacy / cold:>6.1f}x {legacy / warm:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_encoders.py
+#
+# Load time, memory, single-query latency and batch throughput of each encoder
+# backend (torch, torch_int8, onnx, onnx_int8). Each backend runs in a fresh
+# interpreter so the memory numbers include only what that backend imports.
+# Backends whose packages or model files are missing are reported as such.
+# Run from the repository root:  python -m benchmarks.bench_encoders --queries 200
+# (export the ONNX model first:  python encoders.py export)
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from encoders import BACKENDS, PARITY_TEXTS
+
+
+def _rss_mb():
+    """ Current resident set size in MB (Linux), falling back to the peak. """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(backend, queries, batch_size, batches):
+    from encoders import load_encoder, EncoderError
+
+    start = time.perf_counter()
+    try:
+        encoder = load_encoder(backend)
+        encoder.encode(["warm-up query"])
+    except (EncoderError, OSError) as e:
+        return {"backend": backend, "error": str(e)}
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        query = PARITY_TEXTS[i % len(PARITY_TEXTS)]
+        started = time.perf_counter()
+        encoder.encode([query])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    batch = [PARITY_TEXTS[i % len(PARITY_TEXTS)] + f" ({i})" for i in range(batch_size)]
+    started = time.perf_counter()
+    for _ in range(batches):
+        encoder.encode(batch, batch_size=batch_size)
+    throughput = batch_size * batches / (time.perf_counter() - started)
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "torch_imported": "torch" in sys.modules,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "docs_per_s": throughput,
+    }
+
+
+def run_backend(backend, args):
+    command = [sys.executable, "-m", "benchmarks.bench_encoders", "--child", backend, "--queries", str(args.queries),
+               "--batch-size", str(args.batch_size), "--batches", str(args.batches)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"backend": backend, "error": (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encoder backends.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--queries", type=int, default=200, help="Single-query encodes for the latency percentiles.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.queries, args.batch_size, args.batches)))
+        return
+
+    print(f"{'backend':<10} | {'load s':>6} | {'RSS MB':>7} | {'peak MB':>7} | {'torch':>5} | "
+          f"{'p50 ms':>7} | {'p99 ms':>7} | {f'docs/s @{args.batch_size}':>11}")
+    for backend in args.backends:
+        result = run_backend(backend, args)
+        if "error" in result:
+            print(f"{backend:<10} | unavailable: {result['error']}")
+            continue
+        print(f"{backend:<10} | {result['load_s']:6.2f} | {result['rss_mb']:7.0f} | {result['peak_rss_mb']:7.0f} | "
+              f"{'yes' if result['torch_imported'] else 'no':>5} | {result['p50_ms']:7.2f} | {result['p99_ms']:7.2f} | "
+              f"{result['docs_per_s']:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/bench_feedback.py
+#
+# POSTs feedback to the real /feedback endpoint (Flask test client, several
+# threads) at fixed offered rates and reports the endpoint latency for:
+#   direct   a synchronous SQLite insert + commit per request (the naive version)
+#   sqlite   the batched writer in front of SQLite (WAL)
+#   jsonl    the batched writer in front of JSONL segments
+# After each run it waits for the writer to flush and counts what was stored and
+# dropped. Rate 0 means as fast as the clients can go. The in-process Flask test
+# client tops out at around a thousand requests per second per core, so
+# --submit-only calls feedback_writer.submit() directly to push the writer itself
+# to tens of thousands of records per second (and show drops once it falls behind).
+# Run from the repository root:  python -m benchmarks.bench_feedback --rates 1000 5000 0
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+os.environ.setdefault("GOOGLE_API_KEY", "feedback-benchmark")
+os.environ.setdefault("FLASK_SECRET_KEY", "feedback-benchmark")
+os.environ.setdefault("RAG_LAZY_INIT", "1")
+os.environ.setdefault("FEEDBACK_STORE", "log")
+
+import app as app_module
+from feedback_store import FeedbackWriter, SQLiteFeedbackSink, JsonlFeedbackSink, make_record
+
+
+class DirectWriter:
+    """ Writes every record on the request thread, as a naive implementation would. """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def submit(self, record):
+        with self._lock:
+            self.sink.write([record])
+            self.written += 1
+        return True
+
+    def flush(self, timeout=10.0):
+        return True
+
+    def close(self):
+        self.sink.close()
+
+    def stats(self):
+        return {"written": self.written, "dropped": 0, "max_queued": 0}
+
+
+def make_writer(mode, directory, args):
+    if mode == "direct":
+        return DirectWriter(SQLiteFeedbackSink(os.path.join(directory, "direct.db")))
+    if mode == "sqlite":
+        sink = SQLiteFeedbackSink(os.path.join(directory, "batched.db"))
+    else:
+        sink = JsonlFeedbackSink(os.path.join(directory, "jsonl"))
+    return FeedbackWriter(sink, queue_size=args.queue_size, batch_size=args.batch_size, flush_interval=args.flush_interval)
+
+
+def run(writer, posts, clients, rate, submit_only=False):
+    app_module.feedback_writer = writer
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+    interval = clients / rate if rate > 0 else 0.0
+
+    def client(client_id):
+        test_client = app_module.app.test_client()
+        local = []
+        barrier.wait()
+        next_at = time.perf_counter()
+        for i in range(posts // clients):
+            if interval:
+                # Open loop: keep the offered rate even if a request was slow
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            body = {"message_id": f"{client_id}-{i}", "rating": "up" if i % 3 else "down", "comment": "Helpful answer."}
+            start = time.perf_counter()
+            if submit_only:
+                app_module.feedback_writer.submit(make_record(body["message_id"], body["rating"], body["comment"]))
+            else:
+                test_client.post("/feedback", json=body)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    flush_start = time.perf_counter()
+    writer.flush()
+    flush_s = time.perf_counter() - flush_start
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {"posts_per_s": len(latencies) / elapsed, "p50": percentile(0.5), "p99": percentile(0.99),
+            "p999": percentile(0.999), "max": latencies[-1] * 1000, "flush_s": flush_s, "stats": writer.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /feedback with direct vs batched persistence.")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1000, 5000, 0], help="Offered posts/s (0 = unthrottled).")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each throttled run.")
+    parser.add_argument("--posts", type=int, default=20000, help="Posts in an unthrottled run.")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", choices=["direct", "sqlite", "jsonl"], default=["direct", "sqlite", "jsonl"])
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--submit-only", action="store_true", help="Call feedback_writer.submit() instead of POSTing.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="feedback-bench-")
+    print(f"{args.clients} clients, {'submit() only' if args.submit_only else 'POST /feedback'}, store in {directory}\n")
+    print(f"{'rate':>7} | {'mode':<6} | {'posts/s':>8} | {'p50 ms':>7} | {'p99 ms':>7} | {'p99.9 ms':>8} | "
+          f"{'max ms':>7} | {'written':>7} | {'dropped':>7} | {'max queue':>9} | {'flush s':>7}")
+    try:
+        for rate in args.rates:
+            posts = args.posts if rate <= 0 else int(rate * args.seconds)
+            for mode in args.modes:
+                writer = make_writer(mode, directory, args)
+                result = run(writer, posts, args.clients, rate, args.submit_only)
+                stats = result["stats"]
+                print(f"{'max' if rate <= 0 else int(rate):>7} | {mode:<6} | {result['posts_per_s']:8.0f} | "
+                      f"{result['p50']:7.3f} | {result['p99']:7.3f} | {result['p999']:8.3f} | {result['max']:7.2f} | "
+                      f"{stats['written']:>7} | {stats['dropped']:>7} | {stats['max_queued']:>9} | {result['flush_s']:7.3f}")
+                writer.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
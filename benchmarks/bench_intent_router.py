@@ -0,0 +1,77 @@
+# benchmarks/bench_intent_router.py
+#
+# Measures the per-message overhead of IntentRouter.route() (rules only) over
+# a realistic message mix, next to the substring trigger check it replaced,
+# and prints how the mix was classified. route() runs on every chat message,
+# so its p99 has to stay well under a millisecond.
+# Run from the repository root:  python -m benchmarks.bench_intent_router --rounds 2000
+
+import time
+import random
+import argparse
+
+from intent_router import IntentRouter, coach_aliases
+from persona_registry import PersonaRegistry
+
+# --- Baseline: what app.index() did before ---
+JOKE_TRIGGERS = ["joke", "dad joke", "make me laugh", "something funny", "cheer me up"]
+
+def legacy_is_joke(message):
+    lowered = message.lower()
+    return any(trigger in lowered for trigger in JOKE_TRIGGERS)
+
+
+MESSAGES = [
+    "Tell me a joke", "Can you make me laugh?", "hello!", "Hi there", "good morning coach", "help",
+    "What can you do?", "switch to career catalyst please", "Can I talk to Yoda", "I want to switch careers",
+    "hi, I lost my job and I don't know what to do next",
+    "How do I stay motivated when everything at work feels pointless and my manager ignores my ideas?",
+    "My partner and I keep arguing about money. How can we talk about it without it turning into a fight?",
+    "I've been trying to build a morning routine for months but I keep hitting snooze. " * 4,
+]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], samples[-1]
+
+
+def time_calls(fn, messages):
+    samples = []
+    for message in messages:
+        start = time.perf_counter()
+        fn(message)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the intent router's per-message overhead.")
+    parser.add_argument("--rounds", type=int, default=2000, help="Passes over the message mix.")
+    args = parser.parse_args()
+
+    registry = PersonaRegistry()
+    personas, _ = registry.snapshot()
+    aliases = coach_aliases(personas)
+
+    start = time.perf_counter()
+    router = IntentRouter(aliases)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(5)
+    messages = [rng.choice(MESSAGES) for _ in range(args.rounds * len(MESSAGES))]
+
+    print(f"{len(messages)} messages, {len(aliases)} coach aliases, router built in {build_ms:.2f} ms\n")
+    for label, fn in (("legacy any()", legacy_is_joke), ("IntentRouter.route", router.route)):
+        p50, p99, worst = percentiles(time_calls(fn, messages))
+        verdict = "" if label.startswith("legacy") else ("   OK (< 1 ms)" if p99 < 1e-3 else "   OVER BUDGET")
+        print(f"{label:<20} p50 {p50 * 1e6:7.2f} us  p99 {p99 * 1e6:7.2f} us  max {worst * 1e6:8.2f} us{verdict}")
+
+    print("\nintent hits:", router.stats())
+    for message in MESSAGES[:11]:
+        intent_match = router.route(message)
+        print(f"  {message[:50]!r:<54} -> {intent_match.intent + ' ' + str(intent_match.params or '') if intent_match else 'RAG + LLM'}")
+
+
+if __name__ == "__main__":
+    main()
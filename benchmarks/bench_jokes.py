@@ -0,0 +1,74 @@
+# benchmarks/bench_jokes.py
+#
+# Exercises JokeProvider against the local stub joke server and compares it
+# with the old inline requests.get(). Scenarios: healthy upstream, slow
+# upstream (--slow-delay) and failing upstream. For each it reports the
+# latency of getting a joke on the request path, where the jokes came from,
+# how many upstream requests/connections were made, and the breaker state.
+# Run from the repository root:  python -m benchmarks.bench_jokes --calls 40
+
+import time
+import argparse
+
+import requests
+
+from benchmarks.stub_joke_server import StubJokeServer
+from joke_provider import JokeProvider, CircuitBreaker
+
+
+# --- Baseline: what app.get_dad_joke() did before ---
+def legacy_get_joke(url, timeout):
+    try:
+        response = requests.get(url, headers={'Accept': 'application/json'}, timeout=timeout)
+        response.raise_for_status()
+        return response.json().get('joke', "No joke today, but you’re still awesome!")
+    except requests.RequestException:
+        return "No joke fetched – my bad!"
+
+
+def timed_calls(get_joke, calls, pause):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        get_joke()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(pause) # Requests arrive spread out; gives the refill thread time to run
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1]
+
+
+def run_scenario(label, delay, fail, calls, pause, timeout):
+    server = StubJokeServer(("127.0.0.1", 0), delay=delay, fail=fail)
+    server.start_background()
+
+    p50, worst = timed_calls(lambda: legacy_get_joke(server.url, timeout), calls, pause)
+    print(f"{label:<9} legacy    p50 {p50 * 1000:8.2f} ms  max {worst * 1000:8.2f} ms  "
+          f"upstream requests {server.requests:>3}  connections {server.connections:>3}")
+
+    requests_before, connections_before = server.requests, server.connections
+    provider = JokeProvider(api_url=server.url, buffer_size=8, low_water=3, fetch_timeout=timeout,
+                            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=2.0))
+    provider.start()
+    p50, worst = timed_calls(provider.get_joke, calls, pause)
+    stats = provider.stats()
+    print(f"{'':<9} provider  p50 {p50 * 1000:8.2f} ms  max {worst * 1000:8.2f} ms  "
+          f"upstream requests {server.requests - requests_before:>3}  connections {server.connections - connections_before:>3}  "
+          f"buffer/local {stats['served_buffer']}/{stats['served_local']}  breaker {stats['breaker_state']} (opened {stats['breaker_opened']}x)")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prefetching joke provider against the stub joke API.")
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds between joke requests.")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Upstream latency in the slow scenario.")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    run_scenario("healthy", 0.0, False, args.calls, args.pause, args.timeout)
+    run_scenario("slow", args.slow_delay, False, args.calls, args.pause, args.timeout)
+    run_scenario("failing", 0.0, True, args.calls, args.pause, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_llm_pool.py
+#
+# Compares a fresh ChatGoogleGenerativeAI per request against the pooled client
+# from llm_client, using the local stub LLM server (no API key or network needed).
+# Run from the repository root:  python -m benchmarks.bench_llm_pool --calls 50
+
+import os
+import time
+import argparse
+
+from benchmarks.stub_llm_server import StubLLMServer
+
+
+def run(label, server, get_model, calls):
+    from langchain_core.messages import HumanMessage
+
+    connections_before = server.connections
+    setup_total = 0.0
+    start = time.perf_counter()
+    for _ in range(calls):
+        setup_start = time.perf_counter()
+        chat_model = get_model()
+        setup_total += time.perf_counter() - setup_start
+        chat_model.invoke([HumanMessage(content="hello")])
+    elapsed = time.perf_counter() - start
+    connections = server.connections - connections_before
+    print(f"{label:<10} connections/handshakes: {connections:>4}   "
+          f"avg setup: {setup_total / calls * 1000:8.3f} ms   avg call: {elapsed / calls * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-request Gemini clients.")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--model", default="gemini-2.0-flash-lite-001")
+    args = parser.parse_args()
+
+    server = StubLLMServer(("127.0.0.1", 0))
+    server.start_background()
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_ENDPOINT"] = server.url
+
+    # Import after the environment points at the stub
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    import llm_client
+
+    def fresh_model():
+        return ChatGoogleGenerativeAI(
+            model=args.model, google_api_key="stub", transport="rest",
+            client_options={"api_endpoint": server.url},
+        )
+
+    def pooled_model():
+        return llm_client.get_chat_model(args.model, "stub")
+
+    print(f"Stub LLM at {server.url}, {args.calls} calls per mode\n")
+    run("fresh", server, fresh_model, args.calls)
+    run("pooled", server, pooled_model, args.calls)
+    print(f"\nPool stats: {llm_client.get_pool_stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
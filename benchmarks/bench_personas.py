@@ -0,0 +1,82 @@
+# benchmarks/bench_personas.py
+#
+# Compares the old per-request persona loading (directory listing + JSON parse +
+# image exists checks) against the in-memory PersonaRegistry.
+# Run from the repository root:  python -m benchmarks.bench_personas
+
+import os
+import json
+import time
+import argparse
+
+from persona_registry import PersonaRegistry, COACH_DATA_DIR
+
+STATIC_IMAGES_DIR = os.path.join("static", "images")
+
+
+# --- Baseline: what app.py did on every request before the registry ---
+def legacy_sidebar():
+    coach_data_list = []
+    for filename in sorted(os.listdir(COACH_DATA_DIR)):
+        if filename.endswith(".json") and not filename.startswith('.'):
+            coach_display_name = filename[:-5].replace("_", " ").title()
+            with open(os.path.join(COACH_DATA_DIR, filename), "r", encoding='utf-8') as f:
+                persona_data = json.load(f)
+            image_filename = persona_data.get('image', 'default.jpg')
+            if not os.path.exists(os.path.join(STATIC_IMAGES_DIR, image_filename)):
+                image_filename = 'default.jpg'
+            coach_data_list.append({
+                'name': coach_display_name,
+                'url_name': coach_display_name.lower().replace(" ", ""),
+                'image': image_filename,
+            })
+    return coach_data_list
+
+
+def legacy_chat_persona(coach_display_name):
+    coach_filepath = os.path.join(COACH_DATA_DIR, f"{coach_display_name.lower().replace(' ', '_')}.json")
+    with open(coach_filepath, "r", encoding='utf-8') as f:
+        return json.load(f)["prompt_prefix"]
+
+
+# --- Registry equivalents ---
+def registry_sidebar(registry):
+    personas, _ = registry.snapshot()
+    return [{'name': p.display_name, 'url_name': p.url_name, 'image': p.image} for p in personas]
+
+
+def registry_chat_persona(registry, coach_display_name):
+    return registry.get(coach_display_name).prompt_prefix
+
+
+def measure(label, fn, iterations):
+    fn() # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"{label:<28} {rate:>12,.0f} req/s   ({elapsed / iterations * 1e6:8.1f} us/req)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark persona loading paths.")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--coach", default="Career Catalyst")
+    args = parser.parse_args()
+
+    registry = PersonaRegistry(COACH_DATA_DIR, images_dir=STATIC_IMAGES_DIR)
+    print(f"Personas loaded: {len(registry.snapshot()[0])}, iterations: {args.iterations}\n")
+
+    before = measure("sidebar (per-request JSON)", legacy_sidebar, args.iterations)
+    after = measure("sidebar (registry)", lambda: registry_sidebar(registry), args.iterations)
+    print(f"{'':<28} speedup x{after / before:.1f}\n")
+
+    before = measure("chat persona (per-request)", lambda: legacy_chat_persona(args.coach), args.iterations)
+    after = measure("chat persona (registry)", lambda: registry_chat_persona(registry, args.coach), args.iterations)
+    print(f"{'':<28} speedup x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
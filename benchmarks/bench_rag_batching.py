@@ -0,0 +1,88 @@
+# benchmarks/bench_rag_batching.py
+#
+# Per-call vs micro-batched RAG search (MiniLM encode + FAISS search) under
+# 1, 8, 32 and 128 concurrent clients. Uses faiss_index/ if present, otherwise
+# a synthetic flat index of random vectors. Query caches are disabled so every
+# call really encodes.
+# Run from the repository root:  python -m benchmarks.bench_rag_batching --window-ms 3
+
+import time
+import argparse
+import threading
+
+import numpy as np
+import faiss
+
+import rag_processor
+
+
+def setup_components(synthetic_docs):
+    if rag_processor.load_rag_components():
+        return "faiss_index/"
+    # Fall back to a synthetic corpus with the real embedding model
+    from sentence_transformers import SentenceTransformer
+    rag_processor.embedding_model = SentenceTransformer(rag_processor.EMBEDDING_MODEL_NAME)
+    dim = rag_processor.embedding_model.get_sentence_embedding_dimension()
+    index = faiss.IndexFlatL2(dim)
+    index.add(np.random.rand(synthetic_docs, dim).astype(np.float32))
+    rag_processor.activate_index(rag_processor.IndexVersion(index, [f"synthetic document {i}" for i in range(synthetic_docs)], name="synthetic"))
+    return f"synthetic ({synthetic_docs} docs)"
+
+
+def run(clients, queries_per_client, batcher):
+    rag_processor.query_batcher = batcher
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client(client_id):
+        local = []
+        barrier.wait()
+        for i in range(queries_per_client):
+            query = f"client {client_id} asks question {i} about finding balance at work"
+            start = time.perf_counter()
+            rag_processor.search_documents(query, k=3)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / elapsed, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs micro-batched RAG search.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--queries", type=int, default=400, help="Total queries per run.")
+    parser.add_argument("--window-ms", type=float, default=3.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--synthetic-docs", type=int, default=20000)
+    args = parser.parse_args()
+
+    source = setup_components(args.synthetic_docs)
+    rag_processor.embedding_cache.max_size = 0
+    rag_processor.result_cache.max_size = 0
+    print(f"Index: {source}, window {args.window_ms} ms, max batch {args.max_batch}\n")
+    print(f"{'clients':>7} | {'mode':<8} | {'q/s':>8} | {'p50 ms':>8} | {'p99 ms':>8}")
+
+    for clients in args.clients:
+        per_client = max(1, args.queries // clients)
+        for mode, batcher in (("per-call", None), ("batched", rag_processor.QueryBatcher(args.window_ms, args.max_batch))):
+            qps, p50, p99 = run(clients, per_client, batcher)
+            print(f"{clients:>7} | {mode:<8} | {qps:8.1f} | {p50:8.2f} | {p99:8.2f}")
+            if batcher is not None:
+                print(f"{'':>7} | {'':<8} | avg batch size {batcher.stats()['avg_batch_size']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
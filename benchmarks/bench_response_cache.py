@@ -0,0 +1,83 @@
+# benchmarks/bench_response_cache.py
+#
+# Replays a synthetic first-turn workload (Zipf-distributed FAQ questions with
+# several wordings each, spread over the six coaches) through ResponseCache and
+# reports hit rate, LLM calls saved and LLM latency saved. LLM latency is
+# simulated (--llm-latency), not slept. With --semantic the queries are also
+# embedded with the RAG MiniLM model so differently worded questions can hit.
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_response_cache --requests 5000
+#   python -m benchmarks.bench_response_cache --semantic --threshold 0.9
+
+import time
+import random
+import argparse
+
+from response_cache import ResponseCache
+
+COACHES = ["aiyoda", "wellness_warrior", "career_catalyst", "executive_coach", "personal_growth_guru", "relationship_revivalist"]
+GREETINGS = ["Hello", "hello!", "Hi", "hi there", "Hey", "Good morning"]
+QUESTIONS = [
+    ["How do I stay motivated?", "how can I stay motivated", "How do I keep myself motivated?"],
+    ["How do I deal with stress?", "how to handle stress", "How can I cope with stress?"],
+    ["How do I ask for a raise?", "how should I ask for a raise", "Tips for asking for a raise?"],
+    ["How do I build better habits?", "how to build good habits", "How can I form better habits?"],
+    ["How do I improve communication with my partner?", "how to communicate better with my partner"],
+    ["What should I do when I feel stuck?", "I feel stuck, what do I do?", "what to do when feeling stuck"],
+]
+# Questions with unique wording that will never repeat
+LONG_TAIL = "Question about my very specific situation number {}"
+
+
+def build_workload(requests, long_tail_share, seed=11):
+    rng = random.Random(seed)
+    intents = [[g] for g in GREETINGS] + QUESTIONS
+    weights = [1.0 / (rank + 1) for rank in range(len(intents))] # Zipf
+    workload = []
+    for i in range(requests):
+        coach = rng.choice(COACHES)
+        if rng.random() < long_tail_share:
+            workload.append((coach, LONG_TAIL.format(i)))
+        else:
+            workload.append((coach, rng.choice(rng.choices(intents, weights)[0])))
+    return workload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a FAQ-heavy workload through the response cache.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--long-tail", type=float, default=0.3, help="Share of one-off questions.")
+    parser.add_argument("--llm-latency", type=float, default=1.2, help="Simulated seconds per LLM call.")
+    parser.add_argument("--semantic", action="store_true", help="Embed queries with the RAG model for similarity hits.")
+    parser.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args()
+
+    encode = None
+    if args.semantic:
+        import rag_processor
+        if not rag_processor.load_rag_components():
+            raise SystemExit("RAG components failed to load; --semantic needs the embedding model.")
+        encode = lambda query: rag_processor.encode_query(query)[0]
+
+    cache = ResponseCache(similarity_threshold=args.threshold if args.semantic else 0, disk_path="")
+    workload = build_workload(args.requests, args.long_tail)
+    lookup_seconds = 0.0
+    for coach, query in workload:
+        embedding = encode(query) if encode else None
+        start = time.perf_counter()
+        hit = cache.lookup(coach, query, "", embedding)
+        lookup_seconds += time.perf_counter() - start
+        if hit is None:
+            cache.store(coach, query, "", f"answer to {query}", args.llm_latency, embedding)
+
+    stats = cache.stats()
+    print(f"requests {args.requests}, long tail {args.long_tail:.0%}, semantic {args.semantic}\n")
+    print(f"hit rate        {stats['hit_rate']:.1%} (exact {stats['exact_hits']}, semantic {stats['semantic_hits']})")
+    print(f"LLM calls       {stats['misses']} made, {stats['llm_calls_saved']} saved")
+    print(f"LLM time saved  {stats['latency_saved_s']:.0f} s ({stats['latency_saved_s'] / args.requests:.2f} s per request)")
+    print(f"lookup cost     {lookup_seconds / args.requests * 1e6:.1f} us per request, {stats['entries']} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_scoped_retrieval.py
+#
+# Global vs coach-scoped retrieval on a synthetic tagged corpus: one topic per
+# tag, each a mix of sub-clusters, with queries drawn (noisily) from a coach's
+# topics. For each index type it reports single-query latency and precision@k,
+# the share of returned documents that carry one of the coach's tags. It covers
+# the global index at k and at a raised k (the old workaround), a per-scope
+# partition, and an IDSelector-filtered search. Scopes come from the real
+# coach_data "rag_tags", through rag_processor.get_search_scope().
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_scoped_retrieval --num-vectors 60000 --index-type flat hnsw ivf_flat
+
+import time
+import argparse
+
+import numpy as np
+
+import faissmaker
+import rag_processor
+from doc_store import normalize_tag
+from persona_registry import PersonaRegistry
+
+
+def tagged_corpus(tags, num_vectors, dim, topic_offset, subclusters=20, shared=60, seed=0):
+    # Topics draw their sub-clusters from a shared pool, so related topics overlap the
+    # way "stress" and "mindfulness" documents do; the topic offset keeps them apart
+    rng = np.random.default_rng(seed)
+    pool = rng.normal(size=(shared, dim)).astype(np.float32)
+    picks = np.stack([rng.choice(shared, size=subclusters, replace=False) for _ in tags])
+    centers = pool[picks] + topic_offset * rng.normal(size=(len(tags), 1, dim)).astype(np.float32)
+    topic = rng.integers(0, len(tags), size=num_vectors)
+    sub = rng.integers(0, subclusters, size=num_vectors)
+    vectors = centers[topic, sub] + 0.6 * rng.normal(size=(num_vectors, dim)).astype(np.float32)
+    tag_index = {tag: np.flatnonzero(topic == i).astype(np.int64) for i, tag in enumerate(tags)}
+    return np.ascontiguousarray(vectors), topic, centers, tag_index
+
+
+def run(label, search, queries, k, relevant):
+    latencies = []
+    precision = 0.0
+    for (coach_tags, vector), allowed in zip(queries, relevant):
+        start = time.perf_counter()
+        _, indices = search(coach_tags, vector, k)
+        latencies.append(time.perf_counter() - start)
+        found = [idx for idx in indices[0] if idx >= 0]
+        precision += sum(1 for idx in found if allowed[idx]) / k
+    latencies.sort()
+    print(f"  {label:<36} p50 {latencies[len(latencies) // 2] * 1000:7.3f} ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.3f} ms"
+          f"  precision@{k:<2} {precision / len(queries):6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark coach-scoped vs global FAISS retrieval.")
+    parser.add_argument("--num-vectors", type=int, default=60000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--raised-k", type=int, default=10, help="k used today to compensate for off-topic hits.")
+    parser.add_argument("--query-noise", type=float, default=0.5, help="Higher = vaguer queries, more cross-topic hits.")
+    parser.add_argument("--topic-offset", type=float, default=0.15, help="Lower = topics overlap more.")
+    parser.add_argument("--index-type", nargs="+", default=["flat", "hnsw", "ivf_flat"], choices=faissmaker.INDEX_TYPES)
+    args = parser.parse_args()
+
+    personas, _ = PersonaRegistry().snapshot()
+    coach_tags = {persona.display_name: tuple(persona.data.get("rag_tags", ())) for persona in personas}
+    tags = sorted({normalize_tag(tag) for tag_list in coach_tags.values() for tag in tag_list})
+    vectors, topic, centers, tag_index = tagged_corpus(tags, args.num_vectors, args.dim, args.topic_offset)
+
+    rng = np.random.default_rng(1)
+    queries, relevant = [], []
+    coach_names = sorted(coach_tags)
+    for _ in range(args.queries):
+        name = coach_names[rng.integers(len(coach_names))]
+        topic_ids = [tags.index(normalize_tag(tag)) for tag in coach_tags[name]]
+        t = topic_ids[rng.integers(len(topic_ids))]
+        vector = centers[t, rng.integers(centers.shape[1])] + args.query_noise * rng.normal(size=args.dim).astype(np.float32)
+        queries.append((coach_tags[name], vector.reshape(1, -1).astype(np.float32)))
+        relevant.append(np.isin(topic, topic_ids))
+
+    print(f"{len(vectors)} vectors, d={args.dim}, {len(tags)} tags, {len(coach_names)} coaches, {args.queries} queries\n")
+    for index_type in args.index_type:
+        index = faissmaker.build_index(vectors, index_type)
+        rag_processor.apply_search_params(index)
+        documents = [f"document {i}" for i in range(len(vectors))]
+        print(f"{index_type}:")
+        run(f"global k={args.k}", lambda t, v, k: index.search(v, k), queries, args.k, relevant)
+        run(f"global k={args.raised_k}", lambda t, v, k: index.search(v, k), queries, args.raised_k, relevant)
+        for mode in ("partition", "selector"):
+            if mode == "partition" and index_type != "flat":
+                continue # Partitions are exact flat copies; only comparable to the flat index
+            rag_processor.SCOPE_MODE = mode
+            rag_processor.activate_index(rag_processor.IndexVersion(index, documents, tag_index, name=index_type))
+            build_start = time.perf_counter()
+            for tag_list in coach_tags.values():
+                rag_processor.get_search_scope(tag_list)
+            build_ms = (time.perf_counter() - build_start) * 1000
+            run(f"scoped {mode} k={args.k} ({build_ms:.0f} ms build)",
+                lambda t, v, k: rag_processor.get_search_scope(t).search(v, k), queries, args.k, relevant)
+        print()
+
+
+if __name__ == "__main__":
+    main()
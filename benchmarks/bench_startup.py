@@ -0,0 +1,54 @@
+# benchmarks/bench_startup.py
+#
+# Time from process start until app.py is importable (i.e. could accept traffic)
+# and until RAG is usable, with eager loading vs RAG_LAZY_INIT=1. Each run uses a
+# fresh interpreter.
+# Run from the repository root:  python -m benchmarks.bench_startup --runs 3
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+CHILD_SCRIPT = r"""
+import json, time
+start = time.perf_counter()
+import app
+serving = time.perf_counter() - start
+status = app.rag_processor.get_load_status()
+while status["state"] in ("loading", "not_started"):
+    time.sleep(0.05)
+    status = app.rag_processor.get_load_status()
+rag_ready = time.perf_counter() - start
+print(json.dumps({"serving_s": serving, "rag_ready_s": rag_ready, "state": status["state"], "timings": status["timings"]}))
+"""
+
+
+def run_once(lazy):
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "startup-benchmark")
+    env.setdefault("FLASK_SECRET_KEY", "startup-benchmark")
+    env["RAG_LAZY_INIT"] = "1" if lazy else "0"
+    wall_start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - wall_start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app startup with eager vs lazy RAG loading.")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'run':>3} {'serving s':>10} {'RAG ready s':>12} {'state':>8}  timings")
+    for lazy in (False, True):
+        for run in range(1, args.runs + 1):
+            result = run_once(lazy)
+            print(f"{'lazy' if lazy else 'eager':<6} {run:>3} {result['serving_s']:>10.2f} {result['rag_ready_s']:>12.2f} {result['state']:>8}  {result['timings']}")
+
+
+if __name__ == "__main__":
+    main()
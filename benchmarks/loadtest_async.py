@@ -0,0 +1,181 @@
+# benchmarks/loadtest_async.py
+#
+# Load-test harness for the async chat pipeline. Replaces the Gemini client with
+# a fake model that sleeps for --llm-delay seconds, then sends --requests chat
+# messages at --concurrency through:
+#   * the sync Flask app, limited to --sync-workers concurrent requests
+#     (what a gunicorn sync deployment with that many workers can do), and
+#   * the ASGI app (asgi.application), driven in-process on one event loop.
+#
+# --pages instead loads the non-chat routes Flask serves behind the ASGI app
+# (GET /healthz, /readyz, /metrics and an asset), with every --slow-every'th
+# request going to a route that sleeps --slow-delay seconds, through asgiref's
+# WsgiToAsgi (one shared thread) and through asgi.PooledWsgiToAsgi.
+#
+# Run from the repository root:
+#   GOOGLE_API_KEY=unused python -m benchmarks.loadtest_async --requests 400 --concurrency 200
+#   GOOGLE_API_KEY=unused python -m benchmarks.loadtest_async --pages --requests 2000 --concurrency 64
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("GOOGLE_API_KEY", "loadtest-unused")
+os.environ.setdefault("FLASK_SECRET_KEY", "loadtest")
+
+from langchain_core.messages import AIMessage
+
+import app as flask_app_module
+import asgi
+
+ANSWER = "Patience, young one. A fake answer, this is."
+PAYLOAD = {"message": "How can I find inner peace?", "coach_name": "Aiyoda", "history": []}
+
+
+class FakeSlowChatModel:
+    """ Stands in for ChatGoogleGenerativeAI with a fixed response latency. """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def invoke(self, messages):
+        time.sleep(self.delay)
+        return AIMessage(content=ANSWER)
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.delay)
+        return AIMessage(content=ANSWER)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, latencies, elapsed):
+    print(f"{label:<34} {len(latencies) / elapsed:8.1f} req/s   "
+          f"p50 {percentile(latencies, 50) * 1000:8.1f} ms   p99 {percentile(latencies, 99) * 1000:8.1f} ms   "
+          f"wall {elapsed:6.2f} s")
+
+
+# --- Sync path (Flask test client, bounded like gunicorn sync workers) ---
+def run_sync(total, workers):
+    body = json.dumps(PAYLOAD)
+
+    def one_request(_):
+        client = flask_app_module.app.test_client()
+        start = time.perf_counter()
+        response = client.post("/", data=body, content_type="application/json")
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one_request, range(total)))
+    return latencies, time.perf_counter() - start
+
+
+# --- Async path (ASGI app driven in-process) ---
+async def asgi_post(path, payload, method="POST", application=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    scope = {
+        "type": "http", "method": method, "path": path, "root_path": "", "scheme": "http", "http_version": "1.1",
+        "query_string": b"", "server": ("127.0.0.1", 8080),
+        "headers": [(b"host", b"127.0.0.1:8080"), (b"content-type", b"application/json")],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = {}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await (application or asgi.application)(scope, receive, send)
+    return status.get("code")
+
+
+async def run_async(total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            code = await asgi_post("/", PAYLOAD)
+            assert code == 200, code
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one_request() for _ in range(total)))
+    return latencies, time.perf_counter() - start
+
+
+# --- Non-chat routes (Flask behind the ASGI app) ---
+async def run_pages(application, total, concurrency, slow_every, paths):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request(i):
+        async with semaphore:
+            slow = slow_every > 0 and i % slow_every == 0
+            start = time.perf_counter()
+            code = await asgi_post("/_loadtest/slow" if slow else paths[i % len(paths)], None, "GET", application)
+            assert code == 200, code
+            if not slow:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def main_pages(args):
+    app = flask_app_module.app
+    app.add_url_rule("/_loadtest/slow", "loadtest_slow", lambda: time.sleep(args.slow_delay) or "slow")
+    with app.test_request_context():
+        paths = ["/healthz", "/readyz", "/metrics", flask_app_module.asset_manifest.url("style.css").split("?")[0]]
+    print(f"{args.requests} GETs of {paths}, {args.concurrency} in flight, every {args.slow_every}th request sleeps "
+          f"{args.slow_delay:.2f}s (latencies are of the other requests)\n")
+    for label, application in (("asgiref WsgiToAsgi", asgi.WsgiToAsgi(app)),
+                               (f"PooledWsgiToAsgi ({asgi.WSGI_THREAD_POOL_SIZE} threads)", asgi.application)):
+        latencies, elapsed = asyncio.run(run_pages(application, args.requests, args.concurrency, args.slow_every, paths))
+        report(label, latencies, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync vs async chat pipeline under a slow LLM.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200, help="In-flight requests for the async path.")
+    parser.add_argument("--sync-workers", type=int, default=4, help="Concurrent requests the sync path may serve.")
+    parser.add_argument("--llm-delay", type=float, default=1.0, help="Fake LLM latency in seconds.")
+    parser.add_argument("--pages", action="store_true", help="Load the non-chat routes instead of the chat endpoint.")
+    parser.add_argument("--slow-every", type=int, default=20, help="--pages: every Nth request goes to a slow route (0 = none).")
+    parser.add_argument("--slow-delay", type=float, default=0.1, help="--pages: seconds the slow route takes.")
+    args = parser.parse_args()
+
+    if args.pages:
+        main_pages(args)
+        return
+
+    fake_model = FakeSlowChatModel(args.llm_delay)
+    flask_app_module.create_gemini_chat_model = lambda: fake_model
+
+    print(f"{args.requests} requests, fake LLM latency {args.llm_delay:.2f}s, RAG enabled: {flask_app_module.rag_processor.are_rag_components_loaded()}\n")
+    latencies, elapsed = run_sync(args.requests, args.sync_workers)
+    report(f"sync ({args.sync_workers} workers)", latencies, elapsed)
+    latencies, elapsed = asyncio.run(run_async(args.requests, args.concurrency))
+    report(f"async (1 process, {args.concurrency} in flight)", latencies, elapsed)
+
+
+if __name__ == "__main__":
+    main()
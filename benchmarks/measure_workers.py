@@ -0,0 +1,100 @@
+# benchmarks/measure_workers.py
+#
+# Per-worker unique memory (USS), proportional memory (PSS) and total startup
+# time for 1-16 forked workers, with and without preloading the RAG components
+# in the parent. This reproduces what gunicorn does (fork after optional
+# preload) without needing a running server. Requires psutil (Linux for PSS).
+#
+# Run from the repository root:
+#   python -m benchmarks.measure_workers --workers 1 2 4 8 16
+#   RAG_FAISS_MMAP=1 python -m benchmarks.measure_workers
+
+import os
+import gc
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+
+MB = 1024 * 1024
+
+
+def run_single(preload, num_workers):
+    """ Runs one configuration in this (fresh) process and prints a JSON result line. """
+    import psutil
+    import rag_processor
+
+    start = time.perf_counter()
+    if preload:
+        if not rag_processor.load_rag_components():
+            raise SystemExit("RAG components failed to load; build faiss_index/ first (faissmaker.py).")
+        gc.freeze()
+
+    ready_r, ready_w = os.pipe()
+    children = []
+    for _ in range(num_workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            if not preload:
+                rag_processor.load_rag_components()
+            # A real request path: touches model weights, index and documents
+            rag_processor.search_documents("how do I stay calm under pressure", k=3)
+            os.write(ready_w, b"1")
+            signal.pause()
+            os._exit(0)
+        children.append(pid)
+
+    os.close(ready_w)
+    ready = 0
+    while ready < num_workers:
+        ready += len(os.read(ready_r, num_workers))
+    startup_seconds = time.perf_counter() - start
+
+    uss, pss = [], []
+    for pid in children:
+        info = psutil.Process(pid).memory_full_info()
+        uss.append(info.uss)
+        pss.append(getattr(info, "pss", 0))
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    print(json.dumps({
+        "preload": preload,
+        "workers": num_workers,
+        "startup_s": startup_seconds,
+        "avg_uss_mb": sum(uss) / len(uss) / MB,
+        "avg_pss_mb": sum(pss) / len(pss) / MB,
+        "total_pss_mb": sum(pss) / MB,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker memory and startup with/without preload.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--single", nargs=2, metavar=("PRELOAD", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single[0] == "1", int(args.single[1]))
+        return
+
+    print(f"FAISS mmap: {os.getenv('RAG_FAISS_MMAP', '0') == '1'}\n")
+    print(f"{'mode':<10} {'workers':>7} {'startup s':>10} {'USS/worker MB':>14} {'PSS/worker MB':>14} {'total PSS MB':>13}")
+    for preload in (False, True):
+        for num_workers in args.workers:
+            # Each configuration runs in a fresh interpreter so nothing is loaded beforehand
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.measure_workers", "--single", "1" if preload else "0", str(num_workers)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{'preload' if preload else 'per-worker':<10} {num_workers:>7} {result['startup_s']:>10.2f} "
+                  f"{result['avg_uss_mb']:>14.1f} {result['avg_pss_mb']:>14.1f} {result['total_pss_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/stub_joke_server.py
+#
+# A local stand-in for icanhazdadjoke.com. It can add latency, fail every
+# request (500), or be switched between the two at runtime, and counts the
+# requests and TCP connections it sees. Point the app at it with:
+#
+#   JOKE_API_URL=http://127.0.0.1:8090/ python app.py
+#
+# Run standalone:  python -m benchmarks.stub_joke_server --port 8090 --delay 2
+
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubJokeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail=False):
+        super().__init__(address, StubJokeHandler)
+        self.delay = delay
+        self.fail = fail
+        self.stats_lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self._counter = itertools.count(1)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def next_joke(self):
+        number = next(self._counter)
+        return {"id": f"stub{number}", "joke": f"Stub joke number {number}. It's a groaner.", "status": 200}
+
+
+class StubJokeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, so connection reuse is visible
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.stats_lock:
+            self.server.requests += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.fail:
+            body = b'{"message": "stub failure", "status": 500}'
+            self.send_response(500)
+        else:
+            body = json.dumps(self.server.next_joke()).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the dad joke API.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail", action="store_true", help="Answer every request with HTTP 500.")
+    args = parser.parse_args()
+    server = StubJokeServer(("127.0.0.1", args.port), delay=args.delay, fail=args.fail)
+    print(f"Stub joke server on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
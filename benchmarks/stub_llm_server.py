@@ -0,0 +1,132 @@
+# benchmarks/stub_llm_server.py
+#
+# A tiny local stand-in for the Gemini REST API (v1beta generateContent and
+# streamGenerateContent). Point the app at it with:
+#
+#   GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT=http://127.0.0.1:8089 GOOGLE_API_KEY=stub python app.py
+#
+# It counts TCP connections, which is exactly the number of handshakes a real
+# TLS endpoint would have charged us, and can add artificial latency.
+# Run standalone:  python -m benchmarks.stub_llm_server --port 8089 --delay 0.5
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "Hmm. A **stub** answer, this is. Patience, you must have, for the real model."
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, answer=DEFAULT_ANSWER, delay=0.0, chunk_delay=0.0):
+        super().__init__(address, StubLLMHandler)
+        self.answer = answer
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.stats_lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def _response_chunk(text, finished):
+    chunk = {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "index": 0,
+        }],
+    }
+    if finished:
+        chunk["candidates"][0]["finishReason"] = "STOP"
+        chunk["usageMetadata"] = {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2}
+    return chunk
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real endpoint
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with self.server.stats_lock:
+            self.server.requests += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if ":streamGenerateContent" in self.path:
+            self._stream()
+        elif ":generateContent" in self.path:
+            body = json.dumps(_response_chunk(self.server.answer, True)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self):
+        # The REST transport consumes a streamed JSON array of response chunks
+        words = self.server.answer.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b"[")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            text = word if last else word + " "
+            piece = json.dumps(_response_chunk(text, last))
+            self._write_chunk(((", " if i else "") + piece).encode("utf-8"))
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+        self._write_chunk(b"]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub Gemini REST endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering.")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks.")
+    args = parser.parse_args()
+
+    server = StubLLMServer((args.host, args.port), delay=args.delay, chunk_delay=args.chunk_delay)
+    print(f"Stub LLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Connections: {server.connections}, requests: {server.requests}")
+
+
+if __name__ == "__main__":
+    main()
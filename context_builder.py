@@ -0,0 +1,186 @@
+# context_builder.py
+#
+# Fits the prompt (system prompt + history + RAG context + query) into a token
+# budget. Token counts come from a fast local approximation of Gemini's
+# subword tokenizer and history messages are memoized by their text, so a turn
+# only counts the text it hasn't seen before. The newest history is kept first; dropped turns
+# can optionally be folded into a short extractive summary instead of being lost.
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+# --- Configuration ---
+# Upper bound for the whole prompt; 0 disables budgeting (history is still capped by exchange count)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+# Upper bound for the retrieved RAG context within that budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1500"))
+# Summarize dropped turns into the system prompt instead of discarding them
+SUMMARIZE_DROPPED_TURNS = os.getenv("PROMPT_SUMMARIZE_DROPPED", "0") == "1"
+SUMMARY_TOKEN_BUDGET = int(os.getenv("PROMPT_SUMMARY_TOKEN_BUDGET", "200"))
+TOKEN_CACHE_SIZE = int(os.getenv("PROMPT_TOKEN_CACHE_SIZE", "8192"))
+
+# Roughly one token per short word, per 4-character piece of a longer word, and
+# per punctuation mark; close to SentencePiece counts for English chat text.
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+# Per-message overhead for the role/turn markers
+MESSAGE_OVERHEAD_TOKENS = 4
+# Splits "Context related to your query:\n[1] ...\n[2] ..." into its documents
+_CONTEXT_DOC_SPLIT_RE = re.compile(r"\n(?=\[\d+\] )")
+
+_token_cache = {} # message text -> token count, oldest first
+_token_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """ Approximates the number of model tokens in `text`. """
+    return len(_TOKEN_RE.findall(text)) if text else 0
+
+
+def count_message_tokens(message, cache=True) -> int:
+    """
+    Token estimate for one LangChain message. History messages are memoized by
+    their text, so they are only counted once; pass cache=False for one-off
+    messages such as the final prompt with its RAG context.
+    """
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    # Keyed by the text itself: a hash collision must not hand out another message's count
+    tokens = _token_cache.get(content) if cache else None
+    if tokens is None:
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if cache and TOKEN_CACHE_SIZE > 0:
+            with _token_cache_lock:
+                if len(_token_cache) >= TOKEN_CACHE_SIZE:
+                    del _token_cache[next(iter(_token_cache))]
+                _token_cache[content] = tokens
+    return tokens
+
+
+@dataclass
+class PromptBudgetReport:
+    """ What build_prompt() kept and dropped, for logs and metrics. """
+    prompt_tokens: int
+    budget: int
+    history_kept: int
+    history_dropped: int
+    context_tokens: int
+    context_docs_dropped: int
+    summary_tokens: int
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def trim_context(context_str, max_tokens):
+    """
+    Drops trailing documents (the lowest ranked) from a formatted RAG context
+    block until it fits `max_tokens`. Returns (context_str, tokens, docs_dropped).
+    """
+    tokens = estimate_tokens(context_str)
+    if not context_str or tokens <= max_tokens:
+        return context_str, tokens, 0
+    header, *docs = _CONTEXT_DOC_SPLIT_RE.split(context_str)
+    dropped = 0
+    while docs and tokens > max_tokens:
+        docs.pop()
+        dropped += 1
+        tokens = estimate_tokens("\n".join([header] + docs))
+    if not docs: # Nothing useful left; a bare header would only confuse the model
+        return "", 0, dropped
+    return "\n".join([header] + docs), tokens, dropped
+
+
+def summarize_dropped(messages, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """
+    Extractive summary of history that no longer fits: the opening sentence of
+    each dropped user message, newest last, within `max_tokens`.
+    """
+    topics = []
+    for message in messages:
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            first_sentence = re.split(r"(?<=[.!?])\s", message.content.strip(), maxsplit=1)[0]
+            topics.append(first_sentence[:200])
+    if not topics:
+        return ""
+    summary = "Earlier in this conversation the user talked about: " + " | ".join(topics)
+    while topics and estimate_tokens(summary) > max_tokens:
+        topics.pop(0) # The oldest topics go first
+        summary = "Earlier in this conversation the user talked about: " + " | ".join(topics)
+    return summary if topics else ""
+
+
+def _fit_history(history, available):
+    """ Returns the index of the oldest message to keep so the newest messages fit `available` tokens. """
+    used = 0
+    start = len(history)
+    # Whole exchanges only: walk back two messages (user + bot) at a time where possible
+    while start > 0:
+        step = 2 if start >= 2 else 1
+        cost = sum(count_message_tokens(message) for message in history[start - step:start])
+        if used + cost > available:
+            break
+        used += cost
+        start -= step
+    return start, used
+
+
+def build_prompt(system_prompt, history, context_str, final_human_content_fn, budget=PROMPT_TOKEN_BUDGET,
+                 context_budget=CONTEXT_TOKEN_BUDGET, summarize_dropped_turns=SUMMARIZE_DROPPED_TURNS):
+    """
+    Assembles [SystemMessage] + history + [final HumanMessage] within a token budget.
+
+    The system prompt and the user's query are always sent. The RAG context is
+    capped at `context_budget` (dropping its lowest ranked documents), and the
+    newest history exchanges fill what is left.
+
+    Args:
+        system_prompt (str): The persona prompt.
+        history (list): Past HumanMessage/AIMessage objects, oldest first.
+        context_str (str): Formatted RAG context, possibly empty.
+        final_human_content_fn (callable): Builds the final human message text from the (trimmed) context.
+        budget (int): Total prompt tokens; 0 or less disables trimming.
+        context_budget (int): Maximum tokens for the RAG context.
+        summarize_dropped_turns (bool): Fold dropped history into the system prompt.
+
+    Returns:
+        tuple: (messages, PromptBudgetReport)
+    """
+    context_docs_dropped = 0
+    if budget > 0:
+        context_str, context_tokens, context_docs_dropped = trim_context(context_str, min(context_budget, budget))
+    else:
+        context_tokens = estimate_tokens(context_str)
+    final_human_message = HumanMessage(content=final_human_content_fn(context_str))
+    fixed_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS + count_message_tokens(final_human_message, cache=False)
+
+    summary = ""
+    if budget > 0:
+        start, history_tokens = _fit_history(history, max(0, budget - fixed_tokens))
+        if start and summarize_dropped_turns:
+            summary = summarize_dropped(history[:start])
+            summary_cost = estimate_tokens(summary)
+            # Make room for the summary by dropping more history if needed
+            while summary and start < len(history) and fixed_tokens + summary_cost + history_tokens > budget:
+                history_tokens -= count_message_tokens(history[start])
+                start += 1
+        kept_history = history[start:]
+    else:
+        kept_history = list(history)
+        history_tokens = sum(count_message_tokens(message) for message in kept_history)
+
+    system_content = f"{system_prompt}\n\n{summary}" if summary else system_prompt
+    messages = [SystemMessage(content=system_content)] + list(kept_history) + [final_human_message]
+    summary_tokens = estimate_tokens(summary)
+    report = PromptBudgetReport(
+        prompt_tokens=fixed_tokens + summary_tokens + history_tokens,
+        budget=budget,
+        history_kept=len(kept_history),
+        history_dropped=len(history) - len(kept_history),
+        context_tokens=context_tokens,
+        context_docs_dropped=context_docs_dropped,
+        summary_tokens=summary_tokens,
+    )
+    return messages, report
@@ -0,0 +1,237 @@
+# conversation_store.py
+#
+# Server-side conversation history. Each conversation is keyed by
+# (conversation_id, coach_key), where the conversation_id lives in the Flask
+# session. The store keeps the already-filtered, already-trimmed LangChain
+# message list, so a chat turn only appends the new exchange instead of the
+# client re-sending (and the server re-filtering) the whole history.
+#
+# Backends, chosen with CONVERSATION_STORE:
+#   memory                      in-process LRU (default; one copy per worker process)
+#   sqlite:///path/to/file.db   local SQLite file, shared by all workers on the host
+#   redis://host:6379/0         Redis-compatible server (needs the `redis` package)
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+# --- Configuration ---
+CONVERSATION_STORE_URL = os.getenv("CONVERSATION_STORE", "memory")
+# Conversations idle for longer than this are dropped
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "86400"))
+# In-process backend only: maximum number of conversations kept per worker
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000"))
+
+_ROLE_TO_MESSAGE = {"human": HumanMessage, "ai": AIMessage}
+
+
+def _to_record(message):
+    return (message.type, message.content)
+
+
+def _from_record(role, content):
+    return _ROLE_TO_MESSAGE[role](content=content)
+
+
+class MemoryConversationStore:
+    """ Thread-safe in-process store: an LRU of message lists with an idle TTL. """
+
+    def __init__(self, max_messages, ttl_seconds=CONVERSATION_TTL, max_entries=CONVERSATION_MAX_ENTRIES):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._data = OrderedDict() # key -> (messages tuple, expires_at)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def load(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return []
+            messages, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return []
+            self._data.move_to_end(key)
+            return list(messages)
+
+    def _put(self, key, messages):
+        self._data[key] = (tuple(messages[-self.max_messages:]), time.monotonic() + self.ttl_seconds)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def append(self, key, new_messages):
+        with self._lock:
+            entry = self._data.get(key)
+            messages = entry[0] if entry is not None and entry[1] >= time.monotonic() else ()
+            self._put(key, messages + tuple(new_messages))
+
+    def replace(self, key, messages):
+        with self._lock:
+            self._put(key, tuple(messages))
+
+    def reset(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "conversations": len(self._data), "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class SQLiteConversationStore:
+    """
+    Stores one row per message in a local SQLite file (WAL mode), so every worker
+    process on the host sees the same conversations. Connections are per thread.
+    """
+
+    def __init__(self, path, max_messages, ttl_seconds=CONVERSATION_TTL):
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._pid = os.getpid()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " conversation_id TEXT NOT NULL, coach TEXT NOT NULL,"
+                " role TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation_id, coach, seq)")
+
+    def _connect(self):
+        # Connections must not cross a fork, so a new process starts with fresh ones
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key):
+        conversation_id, coach = key
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? AND coach = ? AND created >= ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (conversation_id, coach, time.time() - self.ttl_seconds, self.max_messages),
+        ).fetchall()
+        return [_from_record(role, content) for role, content in reversed(rows)]
+
+    def _insert(self, conn, key, messages):
+        conversation_id, coach = key
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, coach, role, content, created) VALUES (?, ?, ?, ?, ?)",
+            [(conversation_id, coach, *_to_record(message), now) for message in messages],
+        )
+        # Keep only the newest max_messages rows for this conversation
+        conn.execute(
+            "DELETE FROM messages WHERE conversation_id = ? AND coach = ? AND seq <= ("
+            " SELECT seq FROM messages WHERE conversation_id = ? AND coach = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+            (conversation_id, coach, conversation_id, coach, self.max_messages),
+        )
+
+    def append(self, key, new_messages):
+        with self._connect() as conn:
+            self._insert(conn, key, new_messages)
+
+    def replace(self, key, messages):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ? AND coach = ?", key)
+            self._insert(conn, key, messages)
+
+    def reset(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ? AND coach = ?", key)
+
+    def purge_expired(self):
+        """ Deletes messages older than the TTL. Returns the number of rows removed. """
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM messages WHERE created < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+    def stats(self):
+        (conversations,) = self._connect().execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT conversation_id, coach FROM messages)").fetchone()
+        return {"backend": "sqlite", "path": self.path, "conversations": conversations}
+
+
+class RedisConversationStore:
+    """ Keeps each conversation as a capped Redis list of JSON-encoded messages. """
+
+    def __init__(self, url, max_messages, ttl_seconds=CONVERSATION_TTL, prefix="lifecoach:conversation:"):
+        import redis # Optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def _key(self, key):
+        conversation_id, coach = key
+        return f"{self.prefix}{conversation_id}:{coach}"
+
+    def load(self, key):
+        raw_messages = self.client.lrange(self._key(key), -self.max_messages, -1)
+        return [_from_record(*json.loads(raw)) for raw in raw_messages]
+
+    def _push(self, pipe, redis_key, messages):
+        if messages:
+            pipe.rpush(redis_key, *(json.dumps(_to_record(message)) for message in messages))
+        pipe.ltrim(redis_key, -self.max_messages, -1)
+        pipe.expire(redis_key, self.ttl_seconds)
+
+    def append(self, key, new_messages):
+        redis_key = self._key(key)
+        pipe = self.client.pipeline()
+        self._push(pipe, redis_key, new_messages)
+        pipe.execute()
+
+    def replace(self, key, messages):
+        redis_key = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.delete(redis_key)
+        self._push(pipe, redis_key, messages)
+        pipe.execute()
+
+    def reset(self, key):
+        self.client.delete(self._key(key))
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def create_conversation_store(url=CONVERSATION_STORE_URL, max_messages=30):
+    """
+    Builds the conversation store described by `url`.
+
+    Args:
+        url (str): 'memory', 'sqlite:///<path>' or 'redis://...'.
+        max_messages (int): Messages kept per conversation (2 per exchange).
+
+    Returns:
+        An object with load(key), append(key, messages), replace(key, messages),
+        reset(key) and stats(), where key is (conversation_id, coach_key).
+    """
+    if url.startswith("sqlite:///"):
+        store = SQLiteConversationStore(url[len("sqlite:///"):], max_messages)
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        store = RedisConversationStore(url, max_messages)
+    else:
+        if url != "memory":
+            logging.warning(f"Unknown CONVERSATION_STORE '{url}'. Falling back to the in-process store.")
+        store = MemoryConversationStore(max_messages)
+    logging.info(f"Conversation store: {store.stats()['backend']} (max {max_messages} messages per conversation).")
+    return store
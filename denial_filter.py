@@ -0,0 +1,144 @@
+# denial_filter.py
+#
+# Detects generic AI disclaimers ("as an AI", "I am a large language model", ...)
+# in bot messages so they can be kept out of the conversation history. The
+# phrase set is prepared once: phrases that contain another phrase are dropped,
+# and large sets are compiled into a single regex whose alternatives are merged
+# into a trie, so a message is lowercased once and checked in one pass.
+# Verdicts are memoized by message text.
+
+import os
+import re
+import json
+import logging
+import threading
+
+# --- Configuration ---
+# Optional JSON file with a list of phrases that replaces DEFAULT_DENIAL_PHRASES.
+# Coaches can add their own with a "denial_phrases" list in coach_data/<key>.json.
+DENIAL_PHRASES_FILE = os.getenv("DENIAL_PHRASES_FILE")
+DENIAL_CACHE_SIZE = int(os.getenv("DENIAL_CACHE_SIZE", "4096"))
+# Below this many phrases, separate `in` scans (CPython's fast substring search)
+# beat the regex engine; above it the trie regex wins (measured crossover ~60).
+REGEX_MIN_PHRASES = int(os.getenv("DENIAL_REGEX_MIN_PHRASES", "48"))
+
+DEFAULT_DENIAL_PHRASES = (
+    "i am a large language model", "i'm a large language model", "i am an ai",
+    "i'm an ai assistant", "trained by google", "i cannot fulfill that request",
+    "i do not have personal opinions", "as an ai", "language model",
+    "i am not yoda", "i am not aiyoda", "i am not wellness warrior",
+    "i am not career catalyst", "i am not executive coach",
+    "i am not personal growth guru", "i am not relationship revivalist",
+    "hypothetical scenario", "i don't have \"clients\"", "as i am a language model",
+)
+
+
+def _trie_pattern(phrases):
+    """ Builds a regex alternation from a trie of the phrases, so shared prefixes are matched once. """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {} # End of a phrase
+
+    def to_pattern(node):
+        if "" in node and len(node) == 1:
+            return ""
+        alternatives = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node: # A shorter phrase ends here, so the rest is optional
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return to_pattern(trie)
+
+
+class DenialFilter:
+    """ A compiled, case-insensitive phrase matcher with a bounded verdict cache. """
+
+    def __init__(self, phrases, cache_size=DENIAL_CACHE_SIZE, regex_min_phrases=REGEX_MIN_PHRASES):
+        self.phrases = tuple(sorted({phrase.lower() for phrase in phrases if phrase}))
+        # A phrase containing another phrase can never change the verdict
+        self._needles = tuple(p for p in self.phrases if not any(q != p and q in p for q in self.phrases))
+        # Matching lowercased text was measured ~4x faster than re.IGNORECASE
+        self._regex = re.compile(_trie_pattern(self._needles)) if len(self._needles) >= regex_min_phrases else None
+        self.cache_size = cache_size
+        self._verdicts = {} # text -> bool, oldest first
+        self._lock = threading.Lock()
+
+    def search(self, text):
+        """ Returns the first matching phrase in `text`, or None. Not cached. """
+        lowered = text.lower()
+        if self._regex is not None:
+            match = self._regex.search(lowered)
+            return match.group(0) if match else None
+        return next((needle for needle in self._needles if needle in lowered), None)
+
+    def is_denial(self, text):
+        """ True if `text` contains any of the phrases (case-insensitive). """
+        # Keyed by the text itself: a hash collision must not return another message's verdict
+        verdict = self._verdicts.get(text)
+        if verdict is not None:
+            return verdict
+        verdict = self._matches(text.lower())
+        if self.cache_size > 0:
+            with self._lock:
+                if len(self._verdicts) >= self.cache_size:
+                    del self._verdicts[next(iter(self._verdicts))]
+                self._verdicts[text] = verdict
+        return verdict
+
+    def _matches(self, lowered):
+        if self._regex is not None:
+            return self._regex.search(lowered) is not None
+        return any(needle in lowered for needle in self._needles)
+
+
+def load_base_phrases(path=DENIAL_PHRASES_FILE):
+    """ Returns the configured phrase list: DENIAL_PHRASES_FILE if set and readable, else the defaults. """
+    if not path:
+        return DEFAULT_DENIAL_PHRASES
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            phrases = json.load(f)
+        if not isinstance(phrases, list) or not all(isinstance(phrase, str) for phrase in phrases):
+            raise ValueError("expected a JSON list of strings")
+        logging.info(f"Loaded {len(phrases)} denial phrases from '{path}'.")
+        return tuple(phrases)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not load denial phrases from '{path}': {e}. Using the built-in list.")
+        return DEFAULT_DENIAL_PHRASES
+
+
+class DenialFilterRegistry:
+    """
+    Hands out one DenialFilter per coach: the base phrases plus the coach's own
+    "denial_phrases". Filters are rebuilt only when the persona file changes.
+    """
+
+    def __init__(self, base_phrases=None):
+        self.base = DenialFilter(load_base_phrases() if base_phrases is None else base_phrases)
+        self._filters = {} # persona key -> (persona mtime, DenialFilter)
+        self._lock = threading.Lock()
+
+    def for_persona(self, persona):
+        if persona is None:
+            return self.base
+        cached = self._filters.get(persona.key)
+        if cached is not None and cached[0] == persona.mtime:
+            return cached[1]
+
+        extra_phrases = persona.data.get("denial_phrases") or []
+        if not isinstance(extra_phrases, list):
+            logging.warning(f"Ignoring non-list 'denial_phrases' for coach '{persona.key}'.")
+            extra_phrases = []
+        denial_filter = DenialFilter(self.base.phrases + tuple(p for p in extra_phrases if isinstance(p, str))) if extra_phrases else self.base
+        with self._lock:
+            self._filters[persona.key] = (persona.mtime, denial_filter)
+        return denial_filter
+
+    def warm(self, personas):
+        """ Compiles the filters for all given personas (e.g. at startup). """
+        for persona in personas:
+            self.for_persona(persona)
@@ -0,0 +1,271 @@
+# doc_store.py
+#
+# Compact, memory-mapped store for the RAG document texts, replacing index.pkl.
+#
+# File layout (little endian):
+#   magic     8 bytes   b"LCDOCS01"
+#   count     uint64    number of documents (n)
+#   offsets   uint64 * (n + 1)   byte offsets into the blob; doc i is blob[offsets[i]:offsets[i+1]]
+#   blob      UTF-8 text of all documents, concatenated
+#
+# The file is opened read-only with mmap, so every gunicorn worker shares the same
+# page cache and a search only touches the pages of the k documents it returns.
+#
+# Document tags (which coach topics a document belongs to) live next to it in an
+# .npz file with one sorted int64 array of document ids per tag; see write_tag_index().
+
+import os
+import sys
+import mmap
+import array
+import pickle
+import shutil
+import logging
+import argparse
+
+import numpy as np
+
+MAGIC = b"LCDOCS01"
+HEADER_SIZE = len(MAGIC) + 8
+OFFSET_DTYPE = np.dtype("<u8")
+# Tag under which documents without any tag are listed in the tag index
+UNTAGGED = "__untagged__"
+
+
+class DocumentStoreError(Exception):
+    """ Raised when a document store file is missing, truncated or inconsistent. """
+
+
+class DocumentStore:
+    """ Read-only, memory-mapped sequence of document strings. Supports len() and indexing. """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e: # empty file
+            self._file.close()
+            raise DocumentStoreError(f"Document store '{path}' is empty.") from e
+
+        try:
+            if self._mm[:len(MAGIC)] != MAGIC:
+                raise DocumentStoreError(f"'{path}' is not a document store (bad magic).")
+            count = int(np.frombuffer(self._mm, dtype=OFFSET_DTYPE, count=1, offset=len(MAGIC))[0])
+            blob_start = HEADER_SIZE + (count + 1) * OFFSET_DTYPE.itemsize
+            if blob_start > len(self._mm):
+                raise DocumentStoreError(f"Document store '{path}' is truncated (offsets table).")
+            # Zero-copy view over the offsets table inside the mapping
+            self._offsets = np.frombuffer(self._mm, dtype=OFFSET_DTYPE, count=count + 1, offset=HEADER_SIZE)
+            if int(self._offsets[-1]) != len(self._mm) - blob_start:
+                raise DocumentStoreError(f"Document store '{path}' is truncated or corrupt (blob size mismatch).")
+        except Exception:
+            self.close()
+            raise
+        self._count = count
+        self._blob_start = blob_start
+
+    def __len__(self):
+        return self._count
+
+    def get_bytes(self, idx) -> memoryview:
+        """ Returns the UTF-8 bytes of document idx as a view into the mapping (no copy). """
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError(f"Document index {idx} out of range (size {self._count}).")
+        start = self._blob_start + int(self._offsets[idx])
+        end = self._blob_start + int(self._offsets[idx + 1])
+        return memoryview(self._mm)[start:end]
+
+    def __getitem__(self, idx) -> str:
+        view = self.get_bytes(idx)
+        try:
+            return str(view, "utf-8")
+        finally:
+            view.release()
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self[idx]
+
+    def close(self):
+        # Drop the numpy view first; mmap refuses to close while buffers are exported
+        self._offsets = None
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                logging.debug(f"Document store '{self.path}' still has live views; leaving mapping open.")
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_document_store(path, documents):
+    """
+    Writes documents (an iterable of str) to a new store at path. The file is written
+    next to the target and renamed into place, so readers never see a partial file.
+
+    Returns:
+        int: Number of documents written.
+    """
+    encoded = [doc.encode("utf-8") if isinstance(doc, str) else str(doc).encode("utf-8") for doc in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=OFFSET_DTYPE)
+    offsets[1:] = np.cumsum(np.fromiter((len(doc) for doc in encoded), dtype=OFFSET_DTYPE, count=len(encoded)))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(encoded)], dtype=OFFSET_DTYPE).tobytes())
+        f.write(offsets.tobytes())
+        for doc in encoded:
+            f.write(doc)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(encoded)
+
+
+class DocumentStoreWriter:
+    """
+    Writes a document store one document at a time, for corpora that don't fit in
+    memory. Only the offsets (8 bytes per document) are kept; the texts go to a spill
+    file that is copied in behind the header on close(). As with write_document_store(),
+    the store appears at `path` atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.tmp-{os.getpid()}"
+        self._blob_path = f"{path}.blob-{os.getpid()}"
+        self._blob = open(self._blob_path, "wb")
+        self._offsets = array.array("Q", [0])
+
+    def add(self, doc) -> int:
+        """ Appends one document and returns its id. """
+        data = doc.encode("utf-8") if isinstance(doc, str) else str(doc).encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        return len(self._offsets) - 2
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self) -> int:
+        """ Writes the store and returns the number of documents. """
+        self._blob.close()
+        offsets = np.frombuffer(self._offsets, dtype=np.uint64).astype(OFFSET_DTYPE, copy=False)
+        with open(self._tmp_path, "wb") as f, open(self._blob_path, "rb") as blob:
+            f.write(MAGIC)
+            f.write(np.array([len(self)], dtype=OFFSET_DTYPE).tobytes())
+            f.write(offsets.tobytes())
+            shutil.copyfileobj(blob, f, 1 << 20)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+        os.remove(self._blob_path)
+        return len(self)
+
+    def abort(self):
+        """ Discards everything written so far; the target is left untouched. """
+        self._blob.close()
+        for path in (self._blob_path, self._tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def normalize_tag(tag) -> str:
+    """ Tags are matched case-insensitively, with spaces and dashes as underscores. """
+    return "_".join(str(tag).strip().lower().replace("-", " ").split())
+
+
+def write_tag_index(path, doc_tags):
+    """
+    Writes the tag index for a document store: for each tag, the sorted ids of the
+    documents carrying it. Documents with no tags are listed under UNTAGGED.
+
+    Args:
+        path (str): Target .npz path (written atomically, like the store).
+        doc_tags (list[Iterable[str]]): Tags per document, aligned with the document ids.
+
+    Returns:
+        dict: Tag -> number of documents.
+    """
+    ids_by_tag = {}
+    for doc_id, tags in enumerate(doc_tags):
+        add_document_tags(ids_by_tag, doc_id, tags)
+    return save_tag_index(path, ids_by_tag)
+
+
+def add_document_tags(ids_by_tag, doc_id, tags):
+    """ Records document `doc_id` under each of its (normalized) tags, or UNTAGGED if it has none. """
+    normalized = {normalize_tag(tag) for tag in tags or ()} - {""}
+    for tag in normalized or (UNTAGGED,):
+        ids_by_tag.setdefault(tag, []).append(doc_id)
+
+
+def save_tag_index(path, ids_by_tag):
+    """ Writes {tag: ascending document ids} atomically. Returns tag -> number of documents. """
+    arrays = {tag: np.asarray(ids, dtype=np.int64) for tag, ids in ids_by_tag.items()}
+    tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return {tag: len(ids) for tag, ids in arrays.items()}
+
+
+def load_tag_index(path):
+    """ Returns {tag: sorted int64 array of document ids} from write_tag_index(). """
+    with np.load(path, allow_pickle=False) as data:
+        return {tag: np.ascontiguousarray(data[tag], dtype=np.int64) for tag in data.files}
+
+
+def convert_pickle(pkl_path, out_path):
+    """ One-shot conversion of a legacy index.pkl (list/tuple of strings) to a document store. """
+    with open(pkl_path, "rb") as f:
+        documents = pickle.load(f)
+    if not isinstance(documents, (list, tuple)):
+        raise DocumentStoreError(f"Expected a list or tuple in '{pkl_path}', got {type(documents)}.")
+    non_strings = sum(1 for doc in documents if not isinstance(doc, str))
+    if non_strings:
+        logging.warning(f"{non_strings} metadata item(s) are not strings; storing their str() form.")
+    count = write_document_store(out_path, documents)
+    logging.info(f"Converted {count} documents from {pkl_path} to {out_path}.")
+    return count
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Convert index.pkl metadata to a memory-mapped document store.")
+    parser.add_argument("pkl_path", nargs="?", default=os.path.join("faiss_index", "index.pkl"))
+    parser.add_argument("out_path", nargs="?", default=os.path.join("faiss_index", "index.docs"))
+    args = parser.parse_args()
+    try:
+        convert_pickle(args.pkl_path, args.out_path)
+    except (OSError, pickle.UnpicklingError, DocumentStoreError) as e:
+        logging.error(f"Conversion failed: {e}")
+        return 1
+    with DocumentStore(args.out_path) as store:
+        logging.info(f"Verified {args.out_path}: {len(store)} documents.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# encoders.py
+#
+# Query/document encoders for RAG, selected with RAG_ENCODER:
+#
+#   torch       SentenceTransformer in full precision (the reference, and the default)
+#   torch_int8  the same with its Linear layers dynamically quantized to int8
+#   onnx        ONNX Runtime + the `tokenizers` library; PyTorch is never imported
+#   onnx_int8   ONNX Runtime with an int8 dynamically quantized graph
+#
+# Every backend returns L2-normalized float32 embeddings of all-MiniLM-L6-v2, so an
+# index built with one can be searched with another. `python encoders.py parity`
+# checks a backend against the reference before switching. The ONNX backends read
+# model.onnx / model_qint8.onnx and tokenizer.json from RAG_ONNX_MODEL_DIR, written
+# once by `python encoders.py export` (the only step that needs the Hugging Face hub).
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+import numpy as np
+
+# --- Configuration ---
+ENCODER_BACKEND = os.getenv("RAG_ENCODER", "torch")
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+ONNX_MODEL_DIR = os.getenv("RAG_ONNX_MODEL_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+ONNX_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model_qint8.onnx"
+TOKENIZER_FILENAME = "tokenizer.json"
+# Same as the SentenceTransformer's max_seq_length, so long texts are truncated alike
+ONNX_MAX_SEQ_LENGTH = int(os.getenv("RAG_ONNX_MAX_SEQ_LENGTH", "256"))
+ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", "0")) # Intra-op threads per process; 0 = ONNX Runtime's default
+PARITY_THRESHOLD = 0.98 # Minimum cosine similarity to the reference embedding, per text
+
+# Coaching-style sentences of varied length (the last one is truncated) for the parity check
+PARITY_TEXTS = [
+    "hello",
+    "How do I stay calm under pressure at work?",
+    "I keep procrastinating on my thesis and I feel guilty about it.",
+    "What is a good morning routine for more energy?",
+    "My manager never gives feedback. How do I ask for it without sounding needy?",
+    "tips for better sleep",
+    "I want to switch careers into data science but I'm 45. Is it too late?",
+    "How can I be more mindful during the day?",
+    "Meal prep ideas for a busy week with two kids",
+    "Breathing exercises for anxiety before a presentation",
+    "How do I set boundaries with a friend who always cancels plans?",
+    "Patience you must have, my young padawan.",
+    " ".join(["I have been thinking a lot about what I want from life, my work and my relationships."] * 30),
+]
+
+
+class EncoderError(Exception):
+    """ A backend is unknown, or its packages or model files are missing. """
+
+
+class SentenceTransformerEncoder:
+    """ The PyTorch SentenceTransformer, optionally with int8 dynamic quantization. """
+
+    def __init__(self, model_name=MODEL_NAME, quantize=False):
+        from sentence_transformers import SentenceTransformer
+
+        self.backend = "torch_int8" if quantize else "torch"
+        if quantize:
+            import torch
+            # Quantized kernels run on the CPU only; weights become int8, activations stay float
+            self.model = torch.ao.quantization.quantize_dynamic(
+                SentenceTransformer(model_name, device="cpu"), {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        vectors = self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True,
+                                   show_progress_bar=kwargs.get("show_progress_bar", False))
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxEncoder:
+    """
+    MiniLM on ONNX Runtime: tokenizers -> transformer graph -> mean pooling -> L2
+    normalization, the same pipeline as the SentenceTransformer. The inference session
+    is created per process on first use, because ONNX Runtime's thread pool doesn't
+    survive a fork (gunicorn --preload loads this in the master).
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False, threads=ONNX_THREADS):
+        try:
+            import onnxruntime # noqa: F401 -- fail at load time, not on the first request
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise EncoderError(f"The ONNX backends need onnxruntime and tokenizers: {e}") from e
+        self.backend = "onnx_int8" if quantized else "onnx"
+        self.model_path = os.path.join(model_dir, ONNX_INT8_FILENAME if quantized else ONNX_FILENAME)
+        tokenizer_path = os.path.join(model_dir, TOKENIZER_FILENAME)
+        for path in (self.model_path, tokenizer_path):
+            if not os.path.exists(path):
+                raise EncoderError(f"'{path}' not found. Create it with: python encoders.py export --out {model_dir}")
+        self.threads = threads
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=ONNX_MAX_SEQ_LENGTH)
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token="[PAD]")
+        self._session = None
+        self._pid = None
+        self._dim = None
+
+    def _get_session(self):
+        if self._session is None or self._pid != os.getpid():
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+            self._input_names = {graph_input.name for graph_input in self._session.get_inputs()}
+            self._pid = os.getpid()
+        return self._session
+
+    def _encode_batch(self, texts):
+        session = self._get_session()
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                 "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        hidden = session.run(None, feeds)[0]
+        if hidden.ndim == 3: # Token embeddings: mean over the real (unpadded) tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            hidden = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return hidden / np.maximum(np.linalg.norm(hidden, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # Batch texts of similar length together so little time goes into padding
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        vectors = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            for position, vector in zip(positions, self._encode_batch([texts[i] for i in positions])):
+                vectors[position] = vector
+        return np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        if self._dim is None:
+            self._dim = int(self._encode_batch(["dimension probe"]).shape[1])
+        return self._dim
+
+
+def load_encoder(backend=ENCODER_BACKEND, model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR):
+    """
+    Returns the encoder for `backend` (one of BACKENDS). Encoders have the
+    SentenceTransformer methods the app uses: encode(texts) -> (n, d) float32 array
+    and get_sentence_embedding_dimension().
+
+    Raises:
+        EncoderError: Unknown backend, missing package or missing model files.
+    """
+    if backend not in BACKENDS:
+        raise EncoderError(f"Unknown encoder backend '{backend}'. Expected one of {BACKENDS}.")
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEncoder(model_dir, quantized=backend == "onnx_int8")
+    try:
+        return SentenceTransformerEncoder(model_name, quantize=backend == "torch_int8")
+    except ImportError as e:
+        raise EncoderError(f"The '{backend}' backend needs sentence-transformers and torch: {e}") from e
+
+
+# --- Model Export ---
+def export_onnx(out_dir=ONNX_MODEL_DIR, model_name=MODEL_NAME):
+    """
+    Downloads the model's ONNX export and tokenizer from the Hugging Face hub into
+    out_dir and writes an int8 dynamically quantized copy next to it.
+    """
+    import shutil
+    from huggingface_hub import hf_hub_download
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+    for remote, local in (("onnx/model.onnx", ONNX_FILENAME), ("tokenizer.json", TOKENIZER_FILENAME)):
+        shutil.copyfile(hf_hub_download(model_name, remote), os.path.join(out_dir, local))
+        logging.info(f"Downloaded {model_name}/{remote} to {os.path.join(out_dir, local)}.")
+    quantize_dynamic(os.path.join(out_dir, ONNX_FILENAME), os.path.join(out_dir, ONNX_INT8_FILENAME), weight_type=QuantType.QInt8)
+    logging.info(f"Wrote int8 model {os.path.join(out_dir, ONNX_INT8_FILENAME)}.")
+
+
+# --- Parity Check ---
+def check_parity(encoder, reference, texts=PARITY_TEXTS, threshold=PARITY_THRESHOLD):
+    """
+    Compares an encoder's embeddings of `texts` with reference embeddings (same order).
+    Returns True if every text's cosine similarity is at least `threshold`.
+    """
+    vectors = encoder.encode(texts)
+    if vectors.shape != reference.shape:
+        logging.error(f"FAILURE: {encoder.backend} embeddings have shape {vectors.shape}, reference has {reference.shape}.")
+        return False
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    similarities = np.sum(vectors * reference, axis=1) / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+    worst = int(np.argmin(similarities))
+    logging.info(f"{encoder.backend}: cosine similarity to the reference min {similarities.min():.5f} "
+                 f"(\"{texts[worst][:40]}\"), mean {similarities.mean():.5f} over {len(texts)} texts.")
+    if similarities.min() >= threshold:
+        logging.info(f"SUCCESS: every embedding is within the {threshold} threshold.")
+        return True
+    failing = int(np.sum(similarities < threshold))
+    logging.error(f"FAILURE: {failing} of {len(texts)} embeddings are below the {threshold} threshold.")
+    return False
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Export the ONNX encoder and check encoder backends against the reference.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Download model.onnx + tokenizer.json and write model_qint8.onnx.")
+    export_parser.add_argument("--out", default=ONNX_MODEL_DIR)
+    parity_parser = commands.add_parser("parity", help="Compare a backend's embeddings with the reference.")
+    parity_parser.add_argument("--backend", choices=BACKENDS, default=ENCODER_BACKEND)
+    parity_parser.add_argument("--reference", default="torch",
+                               help="Backend, or a .npy file written by --save-reference (for hosts without torch).")
+    parity_parser.add_argument("--save-reference", default=None, help="Also save the reference embeddings to this .npy file.")
+    parity_parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    parity_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            export_onnx(args.out)
+            return 0
+        if args.reference.endswith(".npy"):
+            reference = np.load(args.reference)
+        else:
+            reference = load_encoder(args.reference, model_dir=args.model_dir).encode(PARITY_TEXTS)
+        if args.save_reference:
+            np.save(args.save_reference, reference)
+            logging.info(f"Saved {args.reference} reference embeddings to {args.save_reference}.")
+        encoder = load_encoder(args.backend, model_dir=args.model_dir)
+    except (EncoderError, OSError, ValueError) as e:
+        logging.error(str(e))
+        return 1
+    passed = check_parity(encoder, reference, threshold=args.threshold)
+    print(json.dumps({"backend": args.backend, "reference": args.reference, "passed": passed,
+                      "torch_imported": "torch" in sys.modules}))
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,93 +3,36 @@
 import os
 import faiss
 import pickle
+from doc_store import DocumentStore, DocumentStoreError, load_tag_index
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import logging
 import time
 
 # --- Configuration (Should match faissmaker.py and rag_processor.py) ---
 FAISS_DIR = "faiss_index"
 INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")
-PKL_PATH = os.path.join(FAISS_DIR, "index.pkl")
+PKL_PATH = os.path.join(FAISS_DIR, "index.pkl")    # Legacy metadata format
+DOCS_PATH = os.path.join(FAISS_DIR, "index.docs")  # Memory-mapped document store (preferred)
+TAGS_PATH = os.path.join(FAISS_DIR, "index.tags.npz")  # Optional document tags for coach-scoped search
 MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2' # Model used to create the index
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-def check_faiss_index():
+def validate_components(faiss_index, metadata, tag_index=None, model_dim=None, checks_passed=True):
     """
-    Performs checks on the FAISS index and metadata pickle file.
-    Returns True if all basic checks pass, False otherwise.
+    Checks already-loaded components: index size vs. metadata length, tag ids, index
+    vs. model dimension and a sample search + lookup. Used by check_faiss_index() and
+    by rag_processor before it swaps in a new index version.
+    Returns True if all checks pass (and `checks_passed` was True), False otherwise.
     """
-    logging.info("--- Starting FAISS Index Checks ---")
-    checks_passed = True
-    faiss_index = None
-    metadata = None
-    model_dim = None
-
-    # 1. Check File Existence
-    logging.info(f"Checking existence of FAISS index: {INDEX_PATH}")
-    if not os.path.exists(INDEX_PATH):
-        logging.error(f"FAISS index file not found at {INDEX_PATH}")
+    # An empty index would load and validate but never retrieve anything
+    if faiss_index is not None and faiss_index.ntotal == 0:
+        logging.error("FAILURE: FAISS index contains 0 vectors.")
         checks_passed = False
-    else:
-        logging.info("FAISS index file found.")
-
-    logging.info(f"Checking existence of Metadata pickle: {PKL_PATH}")
-    if not os.path.exists(PKL_PATH):
-        logging.error(f"Metadata pickle file not found at {PKL_PATH}")
-        checks_passed = False
-    else:
-        logging.info("Metadata pickle file found.")
-
-    if not checks_passed:
-        logging.error("One or both required files are missing. Cannot proceed.")
-        return False # Stop if files are missing
-
-    # 2. Load FAISS Index
-    try:
-        logging.info(f"Attempting to load FAISS index from {INDEX_PATH}...")
-        start_time = time.time()
-        faiss_index = faiss.read_index(INDEX_PATH)
-        load_time = time.time() - start_time
-        logging.info(f"FAISS index loaded successfully in {load_time:.2f}s.")
-        logging.info(f"  - Index dimension (d): {faiss_index.d}")
-        logging.info(f"  - Total vectors (ntotal): {faiss_index.ntotal}")
-        if faiss_index.ntotal == 0:
-            logging.warning("FAISS index loaded but contains 0 vectors.")
-            checks_passed = False # Index is empty
-    except Exception as e:
-        logging.error(f"Failed to load FAISS index: {e}", exc_info=True)
-        checks_passed = False
-        faiss_index = None # Ensure it's None if loading failed
-
-    # 3. Load Metadata Pickle
-    try:
-        logging.info(f"Attempting to load metadata from {PKL_PATH}...")
-        start_time = time.time()
-        with open(PKL_PATH, 'rb') as f:
-            metadata = pickle.load(f)
-        load_time = time.time() - start_time
-        logging.info(f"Metadata pickle loaded successfully in {load_time:.2f}s.")
-        logging.info(f"  - Metadata type: {type(metadata)}")
-        # Check type immediately
-        if not isinstance(metadata, (list, tuple)):
-            logging.error(f"Metadata is not a list or tuple (type: {type(metadata)})! Retrieval will fail.")
-            checks_passed = False
-            metadata = None # Mark as invalid
-        elif len(metadata) == 0:
-             logging.warning("Metadata loaded but contains 0 items.")
-             checks_passed = False # Metadata is empty
-        else:
-            logging.info(f"  - Number of metadata items: {len(metadata)}")
-    except Exception as e:
-        logging.error(f"Failed to load metadata pickle: {e}", exc_info=True)
-        checks_passed = False
-        metadata = None # Ensure it's None if loading failed
 
     # 4. Check Size Match (Only if both loaded successfully and are valid types)
-    if faiss_index is not None and metadata is not None and isinstance(metadata, (list, tuple)):
+    if faiss_index is not None and metadata is not None and isinstance(metadata, (DocumentStore, list, tuple)):
         logging.info("Comparing FAISS index size and metadata length...")
         if faiss_index.ntotal == len(metadata):
             logging.info(f"SUCCESS: FAISS index size ({faiss_index.ntotal}) matches metadata length ({len(metadata)}).")
@@ -99,13 +42,22 @@ def check_faiss_index():
     elif checks_passed: # Only log if no previous critical errors
          logging.warning("Skipping size match check due to previous loading errors.")
 
+    # 4b. Check Document Tags (optional file)
+    if tag_index is not None and faiss_index is not None:
+        try:
+            bad_tags = [tag for tag, ids in tag_index.items() if len(ids) and (ids.min() < 0 or ids.max() >= faiss_index.ntotal)]
+            if bad_tags:
+                logging.error(f"FAILURE: Document tags {bad_tags} reference ids outside the index (size {faiss_index.ntotal}). Rebuild the index.")
+                checks_passed = False
+            else:
+                logging.info(f"SUCCESS: {len(tag_index)} document tags reference valid ids: {dict(sorted((tag, len(ids)) for tag, ids in tag_index.items()))}")
+        except Exception as e:
+            logging.error(f"Failed to check document tags: {e}")
+            checks_passed = False
+
 
     # 5. Check Embedding Dimension (Optional but good)
-    try:
-        logging.info(f"Loading embedding model ({MODEL_NAME}) to check dimension...")
-        model = SentenceTransformer(MODEL_NAME)
-        model_dim = model.get_sentence_embedding_dimension()
-        logging.info(f"Model embedding dimension: {model_dim}")
+    if model_dim is not None:
         if faiss_index is not None and faiss_index.d == model_dim:
             logging.info(f"SUCCESS: FAISS index dimension ({faiss_index.d}) matches model dimension ({model_dim}).")
         elif faiss_index is not None:
@@ -113,11 +65,6 @@ def check_faiss_index():
             checks_passed = False
         elif checks_passed: # Only log if no previous critical errors
              logging.warning("Skipping dimension match check due to FAISS index loading error.")
-        del model # Free up model memory
-    except Exception as e:
-        logging.error(f"Could not load embedding model to check dimension: {e}", exc_info=True)
-        # Don't fail the check just because model couldn't load, but log it.
-        logging.warning("Could not verify embedding dimension.")
 
 
     # 6. Perform Sample Search & Lookup (Optional but helpful)
@@ -157,6 +104,112 @@ def check_faiss_index():
         logging.warning("Skipping sample search/lookup due to previous errors or missing components.")
 
 
+    return checks_passed
+
+
+def check_faiss_index(index_path=INDEX_PATH, docs_path=DOCS_PATH, pkl_path=PKL_PATH, tags_path=TAGS_PATH, model_dim=None):
+    """
+    Performs checks on the FAISS index and its metadata (document store, or legacy pickle file).
+    The paths default to the live index; pass a version directory's files to check it
+    before activating it. If `model_dim` is given the embedding model isn't loaded.
+    Returns True if all basic checks pass, False otherwise.
+    """
+    logging.info("--- Starting FAISS Index Checks ---")
+    checks_passed = True
+    faiss_index = None
+    metadata = None
+
+    # 1. Check File Existence
+    logging.info(f"Checking existence of FAISS index: {index_path}")
+    if not os.path.exists(index_path):
+        logging.error(f"FAISS index file not found at {index_path}")
+        checks_passed = False
+    else:
+        logging.info("FAISS index file found.")
+
+    metadata_path = docs_path if os.path.exists(docs_path) else pkl_path
+    logging.info(f"Checking existence of Metadata: {docs_path} (or legacy {pkl_path})")
+    if not os.path.exists(metadata_path):
+        logging.error(f"Metadata not found at {docs_path} or {pkl_path}")
+        checks_passed = False
+    else:
+        logging.info(f"Metadata file found: {metadata_path}")
+
+    if not checks_passed:
+        logging.error("One or both required files are missing. Cannot proceed.")
+        return False # Stop if files are missing
+
+    # 2. Load FAISS Index
+    try:
+        logging.info(f"Attempting to load FAISS index from {index_path}...")
+        start_time = time.time()
+        faiss_index = faiss.read_index(index_path)
+        load_time = time.time() - start_time
+        logging.info(f"FAISS index loaded successfully in {load_time:.2f}s.")
+        logging.info(f"  - Index dimension (d): {faiss_index.d}")
+        logging.info(f"  - Total vectors (ntotal): {faiss_index.ntotal}")
+        if faiss_index.ntotal == 0:
+            logging.warning("FAISS index loaded but contains 0 vectors.")
+            checks_passed = False # Index is empty
+    except Exception as e:
+        logging.error(f"Failed to load FAISS index: {e}", exc_info=True)
+        checks_passed = False
+        faiss_index = None # Ensure it's None if loading failed
+
+    # 3. Load Metadata (document store or legacy pickle)
+    try:
+        logging.info(f"Attempting to load metadata from {metadata_path}...")
+        start_time = time.time()
+        if metadata_path == docs_path:
+            metadata = DocumentStore(docs_path)
+        else:
+            logging.warning(f"Using legacy pickle metadata. Convert it with: python doc_store.py {pkl_path} {docs_path}")
+            with open(pkl_path, 'rb') as f:
+                metadata = pickle.load(f)
+        load_time = time.time() - start_time
+        logging.info(f"Metadata loaded successfully in {load_time:.2f}s.")
+        logging.info(f"  - Metadata type: {type(metadata)}")
+        # Check type immediately
+        if not isinstance(metadata, (DocumentStore, list, tuple)):
+            logging.error(f"Metadata is not a document store, list or tuple (type: {type(metadata)})! Retrieval will fail.")
+            checks_passed = False
+            metadata = None # Mark as invalid
+        elif len(metadata) == 0:
+             logging.warning("Metadata loaded but contains 0 items.")
+             checks_passed = False # Metadata is empty
+        else:
+            logging.info(f"  - Number of metadata items: {len(metadata)}")
+    except DocumentStoreError as e:
+        logging.error(f"Document store is invalid: {e}")
+        checks_passed = False
+        metadata = None
+    except Exception as e:
+        logging.error(f"Failed to load metadata: {e}", exc_info=True)
+        checks_passed = False
+        metadata = None # Ensure it's None if loading failed
+
+    # 4-6. Consistency, dimension and sample lookup
+    if model_dim is None:
+        try:
+            logging.info(f"Loading embedding model ({MODEL_NAME}) to check dimension...")
+            from encoders import load_encoder, ENCODER_BACKEND
+            model = load_encoder(ENCODER_BACKEND, MODEL_NAME)
+            model_dim = model.get_sentence_embedding_dimension()
+            logging.info(f"Model embedding dimension: {model_dim}")
+            del model # Free up model memory
+        except Exception as e:
+            logging.error(f"Could not load embedding model to check dimension: {e}", exc_info=True)
+            # Don't fail the check just because model couldn't load, but log it.
+            logging.warning("Could not verify embedding dimension.")
+    tag_index = None
+    if os.path.exists(tags_path):
+        try:
+            tag_index = load_tag_index(tags_path)
+        except Exception as e:
+            logging.error(f"Failed to load document tags from {tags_path}: {e}")
+            checks_passed = False
+    checks_passed = validate_components(faiss_index, metadata, tag_index, model_dim, checks_passed)
+
     # --- Final Result ---
     logging.info("--- FAISS Index Checks Complete ---")
     if checks_passed:
@@ -0,0 +1,285 @@
+# faissmaker.py
+
+import os
+import json
+import math
+import pickle
+import logging
+import argparse
+import time
+import shutil
+
+import numpy as np
+import faiss
+# sentence_transformers is imported in embed_documents(), so the index helpers can be
+# used (e.g. by the benchmarks) without loading the model stack
+
+from doc_store import write_document_store, write_tag_index
+
+# --- Configuration (Should match rag_processor.py and faisscheck.py) ---
+FAISS_DIR = "faiss_index"
+INDEX_FILENAME = "index.faiss"
+PKL_FILENAME = "index.pkl"    # Legacy metadata, only written with --legacy-pickle
+DOCS_FILENAME = "index.docs"  # Memory-mapped document store read by rag_processor.py
+TAGS_FILENAME = "index.tags.npz"  # Document ids per tag, for coach-scoped retrieval
+VERSIONS_DIRNAME = "versions"     # Published versions: <out>/versions/<name>/, see rag_processor.py
+CURRENT_FILENAME = "CURRENT"      # Names the active version; servers then ignore the base files
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+MAX_CHUNK_CHARS = 1000
+TEXT_EXTENSIONS = (".txt", ".md")
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+
+# --- Corpus Loading ---
+def _chunk_text(text, max_chars=MAX_CHUNK_CHARS):
+    """ Splits text on blank lines and packs paragraphs into chunks of at most max_chars. """
+    chunks = []
+    current = ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > max_chars:
+            chunks.append(current[:max_chars])
+            current = current[max_chars:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def load_corpus(source, max_chars=MAX_CHUNK_CHARS):
+    """
+    Loads documents from a .jsonl file (one {"text": ...} object per line) or a
+    directory of .txt/.md/.jsonl files. Text files are chunked by paragraph.
+
+    Returns:
+        list[str]: Document chunks, in a stable (sorted path) order.
+    """
+    return load_tagged_corpus(source, max_chars)[0]
+
+
+def _path_tags(path, source):
+    # corpus/career/interviews.md -> ["career"]; files at the top level are untagged
+    relative_dir = os.path.dirname(os.path.relpath(path, source)) if os.path.isdir(source) else ""
+    return [relative_dir.split(os.sep)[0]] if relative_dir else []
+
+
+def iter_corpus_paths(source):
+    """ The .txt/.md/.jsonl files under `source` (or `source` itself if it is a file), in sorted order. """
+    if os.path.isfile(source):
+        return [source]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(source)
+        for name in files
+        if name.endswith(TEXT_EXTENSIONS + (".jsonl",))
+    )
+
+
+def iter_file_chunks(path, source, max_chars=MAX_CHUNK_CHARS):
+    """
+    Yields (chunk, tags) for one corpus file, reading JSONL files a line at a time.
+    A JSONL object's "tags" list (or "tag" string) is used when present; otherwise
+    the file's tag is its first sub-directory under `source`.
+    """
+    file_tags = _path_tags(path, source)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    text = record.get("text", "")
+                    tags = record.get("tags", record.get("tag", file_tags))
+                except (json.JSONDecodeError, AttributeError) as e:
+                    logging.warning(f"Skipping invalid JSONL line {path}:{line_no}: {e}")
+                    continue
+                tags = [tags] if isinstance(tags, str) else list(tags or [])
+                for chunk in _chunk_text(text, max_chars):
+                    yield chunk, tags
+        else:
+            for chunk in _chunk_text(f.read(), max_chars):
+                yield chunk, file_tags
+
+
+def load_tagged_corpus(source, max_chars=MAX_CHUNK_CHARS):
+    """
+    Like load_corpus(), also returning each chunk's tags for coach-scoped retrieval
+    (see iter_file_chunks()).
+
+    Returns:
+        tuple: (documents list[str], tags list[list[str]]), aligned.
+    """
+    paths = iter_corpus_paths(source)
+    documents = []
+    doc_tags = []
+    for path in paths:
+        for chunk, tags in iter_file_chunks(path, source, max_chars):
+            documents.append(chunk)
+            doc_tags.append(tags)
+    logging.info(f"Loaded {len(documents)} chunks from {len(paths)} file(s) under {source}.")
+    return documents, doc_tags
+
+
+# --- Index Construction ---
+def default_nlist(num_vectors):
+    """ Rule of thumb: ~4*sqrt(N) inverted lists, with at least 39 training points per list. """
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39 or 1))
+
+
+def _pq_subquantizers(dim, requested):
+    # PQ needs the dimension to be divisible by the number of sub-quantizers
+    m = min(requested, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def create_index(dim, index_type="flat", num_vectors=None, nlist=None, hnsw_m=32, ef_construction=200, pq_m=48, pq_bits=8):
+    """
+    Creates an empty (untrained) FAISS index with L2 distance. `num_vectors` is the
+    expected corpus size, used for the IVF defaults. See build_index() for the other args.
+    """
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if num_vectors < 2 ** pq_bits:
+                pq_bits = max(1, int(math.log2(max(2, num_vectors))) - 1)
+                logging.warning(f"Too few vectors for 8-bit PQ codes; using {pq_bits} bits per code.")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim, pq_m), pq_bits)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    return index
+
+
+def build_index(vectors, index_type="flat", nlist=None, hnsw_m=32, ef_construction=200, pq_m=48, pq_bits=8):
+    """
+    Builds (and trains, where needed) a FAISS index over float32 vectors with L2 distance.
+
+    Args:
+        vectors (np.ndarray): (N, d) float32 embeddings.
+        index_type (str): One of INDEX_TYPES.
+        nlist (int): Inverted lists for IVF types. Defaults to default_nlist(N).
+        hnsw_m (int): Graph neighbours per node for HNSW.
+        ef_construction (int): HNSW build-time search depth.
+        pq_m (int): Sub-quantizers for IVF-PQ (adjusted to divide d).
+        pq_bits (int): Bits per sub-quantizer code for IVF-PQ.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    num_vectors, dim = vectors.shape
+    index = create_index(dim, index_type, num_vectors, nlist=nlist, hnsw_m=hnsw_m, ef_construction=ef_construction,
+                         pq_m=pq_m, pq_bits=pq_bits)
+    if not index.is_trained:
+        logging.info(f"Training {index_type} index (nlist={faiss.extract_index_ivf(index).nlist}) on {num_vectors} vectors...")
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def embed_documents(documents, model_name=MODEL_NAME, batch_size=64):
+    from encoders import load_encoder, ENCODER_BACKEND
+    model = load_encoder(ENCODER_BACKEND, model_name)
+    logging.info(f"Embedding {len(documents)} chunks with {model_name} ({model.backend})...")
+    start_time = time.time()
+    vectors = model.encode(documents, batch_size=batch_size, show_progress_bar=True, convert_to_numpy=True)
+    logging.info(f"Embedded in {time.time() - start_time:.1f}s.")
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _write_index_files(index, documents, directory, legacy_pickle=False, doc_tags=None):
+    faiss.write_index(index, os.path.join(directory, INDEX_FILENAME))
+    write_document_store(os.path.join(directory, DOCS_FILENAME), documents)
+    if doc_tags is not None and any(doc_tags):
+        tag_counts = write_tag_index(os.path.join(directory, TAGS_FILENAME), doc_tags)
+        logging.info(f"Wrote tag index for coach-scoped retrieval: {dict(sorted(tag_counts.items()))}")
+    if legacy_pickle:
+        with open(os.path.join(directory, PKL_FILENAME), "wb") as f:
+            pickle.dump(list(documents), f)
+
+
+def write_index(index, documents, out_dir=FAISS_DIR, legacy_pickle=False, doc_tags=None, version=None):
+    """
+    Writes the index, document store and tag index. Everything is written to a
+    temporary directory first, so a server never reads a half-written file.
+
+    With `version` the directory is renamed to out_dir/versions/<version> in one
+    step, ready for `rag_processor.py activate`. Without it each base file is
+    replaced in turn, which is only safe while no server is starting up (one
+    starting in between would fail validation).
+    """
+    target = os.path.join(out_dir, VERSIONS_DIRNAME, version) if version else out_dir
+    os.makedirs(os.path.dirname(target) if version else out_dir, exist_ok=True)
+    if version and os.path.exists(target):
+        raise FileExistsError(f"Index version '{version}' already exists in {os.path.dirname(target)}.")
+    tmp_directory = f"{target}.tmp-{os.getpid()}" if version else os.path.join(out_dir, f".build-{os.getpid()}")
+    os.makedirs(tmp_directory)
+    try:
+        _write_index_files(index, documents, tmp_directory, legacy_pickle, doc_tags)
+        if version:
+            os.rename(tmp_directory, target)
+        else:
+            for filename in os.listdir(tmp_directory):
+                os.replace(os.path.join(tmp_directory, filename), os.path.join(out_dir, filename))
+            os.rmdir(tmp_directory)
+            tags_path = os.path.join(out_dir, TAGS_FILENAME)
+            if not (doc_tags is not None and any(doc_tags)) and os.path.exists(tags_path):
+                os.remove(tags_path) # Stale: its ids point into the previous document store
+    except Exception:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    logging.info(f"Wrote {index.ntotal} vectors and documents to {target}.")
+    if not version and os.path.exists(os.path.join(out_dir, CURRENT_FILENAME)):
+        logging.warning(f"{os.path.join(out_dir, CURRENT_FILENAME)} names a published version, which servers load "
+                        f"instead of these base files. Build with --version and activate it instead.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAISS index used by rag_processor.py.")
+    parser.add_argument("source", help="Directory of .txt/.md/.jsonl files, or a single .jsonl file.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--out", default=FAISS_DIR)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N)).")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--max-chunk-chars", type=int, default=MAX_CHUNK_CHARS)
+    parser.add_argument("--legacy-pickle", action="store_true", help=f"Also write {PKL_FILENAME} for older deployments.")
+    parser.add_argument("--version", default=None, help=f"Write to <out>/{VERSIONS_DIRNAME}/<VERSION>/ for a hot swap.")
+    args = parser.parse_args()
+    if args.version is not None and (not args.version or os.path.basename(args.version) != args.version):
+        parser.error("--version must be a plain directory name.")
+
+    documents, doc_tags = load_tagged_corpus(args.source, args.max_chunk_chars)
+    if not documents:
+        logging.error("No documents found. Nothing to index.")
+        return 1
+    vectors = embed_documents(documents)
+    index = build_index(vectors, args.index_type, nlist=args.nlist, hnsw_m=args.hnsw_m,
+                        ef_construction=args.ef_construction, pq_m=args.pq_m)
+    write_index(index, documents, args.out, legacy_pickle=args.legacy_pickle, doc_tags=doc_tags, version=args.version)
+    if args.version:
+        print(f"\nActivate it with: python rag_processor.py activate {args.version}")
+    else:
+        print("\nRun faisscheck.py to validate the new index. Tune search with RAG_NPROBE / RAG_EF_SEARCH.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
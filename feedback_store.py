@@ -0,0 +1,298 @@
+# feedback_store.py
+#
+# Persists /feedback ratings without putting disk I/O on the request path.
+# submit() appends the record to a bounded in-memory queue and returns; a
+# background thread writes the queue out in batches, when FEEDBACK_BATCH_SIZE
+# records are waiting or every FEEDBACK_FLUSH_INTERVAL seconds, whichever comes
+# first. When the queue is full new records are dropped (and counted) rather
+# than making the request wait. close() writes out what is left at shutdown.
+#
+# Stores, chosen with FEEDBACK_STORE:
+#   sqlite:///path/to/feedback.db   local SQLite file in WAL mode (default), shared by all workers
+#   jsonl:///path/to/dir            append-only JSONL segments, one series per process
+#   log                             only log each record (the old behaviour)
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+from metrics import observe_stage
+
+# --- Configuration ---
+FEEDBACK_STORE_URL = os.getenv("FEEDBACK_STORE", "sqlite:///feedback.db")
+# Records held in memory at most; more are dropped until the writer catches up
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "10000"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "500"))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "1.0"))
+# JSONL store: start a new segment file once the current one reaches this size
+FEEDBACK_SEGMENT_BYTES = int(os.getenv("FEEDBACK_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+FEEDBACK_MAX_COMMENT_CHARS = 2000
+
+_COLUMNS = ("received_at", "message_id", "rating", "comment", "coach", "conversation_id")
+
+
+def make_record(message_id, rating, comment=None, coach=None, conversation_id=None):
+    """ A feedback record as stored: ids and rating as strings, comment truncated. """
+    if comment is not None:
+        comment = str(comment)[:FEEDBACK_MAX_COMMENT_CHARS]
+    return {"received_at": time.time(), "message_id": str(message_id), "rating": str(rating), "comment": comment,
+            "coach": coach, "conversation_id": conversation_id}
+
+
+# --- Stores ---
+class SQLiteFeedbackSink:
+    """ One row per record in a local SQLite file (WAL mode); each batch is one transaction. """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, received_at REAL NOT NULL,"
+                " message_id TEXT NOT NULL, rating TEXT NOT NULL, comment TEXT,"
+                " coach TEXT, conversation_id TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS feedback_by_message ON feedback (message_id)")
+
+    def _connect(self):
+        # Only the writer thread uses the connection, but it must not cross a fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def write(self, records):
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO feedback ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [tuple(record.get(column) for column in _COLUMNS) for record in records],
+            )
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def describe(self):
+        return {"backend": "sqlite", "path": self.path}
+
+
+class JsonlFeedbackSink:
+    """
+    Appends one JSON object per line to feedback-<start time>-<pid>.jsonl segments in
+    a directory. Each process writes its own files, so workers never interleave lines.
+    """
+
+    def __init__(self, directory, segment_bytes=FEEDBACK_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._pid = None
+        self.segments = 0
+
+    def _segment(self):
+        if self._file is not None and self._pid == os.getpid() and self._file.tell() < self.segment_bytes:
+            return self._file
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        path = os.path.join(self.directory, f"feedback-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.segments}.jsonl")
+        self._file = open(path, "a", encoding="utf-8")
+        self._pid = os.getpid()
+        self.segments += 1
+        return self._file
+
+    def write(self, records):
+        f = self._segment()
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        f.flush()
+
+    def close(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
+
+    def describe(self):
+        return {"backend": "jsonl", "path": self.directory}
+
+
+class LogFeedbackSink:
+    """ Writes each record to the application log only. """
+
+    def write(self, records):
+        for record in records:
+            logging.info(f"Feedback Received: Message ID {record['message_id']}, Rating: {record['rating']}, "
+                         f"Comment: {record['comment'] or 'N/A'}")
+
+    def close(self):
+        pass
+
+    def describe(self):
+        return {"backend": "log"}
+
+
+# --- Batching Writer ---
+class FeedbackWriter:
+    """
+    Bounded queue in front of a sink, drained in batches by a background thread.
+    submit() never blocks on I/O and is safe from any thread.
+    """
+
+    def __init__(self, sink, queue_size=FEEDBACK_QUEUE_SIZE, batch_size=FEEDBACK_BATCH_SIZE,
+                 flush_interval=FEEDBACK_FLUSH_INTERVAL):
+        self.sink = sink
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Condition(self._lock) # Notified after each batch is written
+        self._writing = 0 # Records taken off the queue but not yet written
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._stats = {"submitted": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "write_errors": 0,
+                       "max_queued": 0, "last_batch_size": 0, "last_write_ms": 0.0}
+
+    def _ensure_thread(self):
+        # Called with the lock held. Threads don't survive fork; each worker starts its own
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, record):
+        """ Queues a record for writing. Returns False (and counts a drop) if the queue is full or closed. """
+        with self._lock:
+            if self._closed or len(self._queue) >= self.queue_size:
+                self._stats["dropped"] += 1
+                return False
+            self._queue.append(record)
+            self._stats["submitted"] += 1
+            queued = len(self._queue)
+            if queued > self._stats["max_queued"]:
+                self._stats["max_queued"] = queued
+            self._ensure_thread()
+        if queued >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _take_batch(self):
+        with self._lock:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._writing = len(batch)
+        return batch
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            self.sink.write(batch)
+            written, failed = len(batch), 0
+        except Exception as e:
+            written, failed = 0, len(batch)
+            logging.error(f"Feedback store: could not write {len(batch)} records: {e}")
+        elapsed = time.perf_counter() - start
+        observe_stage("feedback_write", elapsed)
+        with self._lock:
+            self._stats["written"] += written
+            self._stats["failed"] += failed
+            self._stats["write_errors"] += 1 if failed else 0
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_write_ms"] = round(elapsed * 1000, 3)
+            self._writing = 0
+            self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Drain completely: full batches while the queue is long, then the remainder
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    with self._lock:
+                        self._idle.notify_all()
+                    break
+                self._write_batch(batch)
+
+    def flush(self, timeout=10.0):
+        """ Waits until everything queued so far is written. Returns False on timeout. """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if not self._queue and not self._writing:
+                return True
+            self._ensure_thread()
+        self._wakeup.set()
+        with self._lock:
+            while self._queue or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._idle.wait(remaining):
+                    return not (self._queue or self._writing)
+        return True
+
+    def close(self, timeout=10.0):
+        """ Stops accepting records, writes out the queue and closes the store. """
+        with self._lock:
+            self._closed = True
+            thread_running = self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+        if thread_running:
+            self.flush(timeout)
+        else:
+            # No writer thread in this process (never started, or inherited from the parent): write here
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                self._write_batch(batch)
+        with self._lock:
+            lost = len(self._queue)
+        if lost:
+            logging.warning(f"Feedback store: {lost} records were still queued at shutdown and are lost.")
+        self.sink.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._queue) + self._writing
+        stats["queue_size"] = self.queue_size
+        stats.update(self.sink.describe())
+        return stats
+
+
+def create_feedback_writer(url=FEEDBACK_STORE_URL):
+    """
+    Builds the batching writer for the store described by `url`.
+
+    Args:
+        url (str): 'sqlite:///<path>', 'jsonl:///<directory>' or 'log'.
+
+    Returns:
+        FeedbackWriter: submit(record), flush(), close() and stats().
+    """
+    try:
+        if url.startswith("sqlite:///"):
+            sink = SQLiteFeedbackSink(url[len("sqlite:///"):])
+        elif url.startswith("jsonl:///"):
+            sink = JsonlFeedbackSink(url[len("jsonl:///"):])
+        else:
+            if url != "log":
+                logging.warning(f"Unknown FEEDBACK_STORE '{url}'. Feedback will only be logged.")
+            sink = LogFeedbackSink()
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Could not open feedback store '{url}': {e}. Feedback will only be logged.")
+        sink = LogFeedbackSink()
+    writer = FeedbackWriter(sink)
+    logging.info(f"Feedback store: {sink.describe()['backend']} (queue {writer.queue_size}, batches of "
+                 f"{writer.batch_size} or every {writer.flush_interval}s).")
+    return writer
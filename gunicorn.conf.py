@@ -0,0 +1,43 @@
+# gunicorn.conf.py
+#
+# Production settings. With preload (the default) app.py is imported once in the
+# gunicorn master, so the SentenceTransformer weights, the FAISS index and the
+# document store are loaded a single time and shared copy-on-write by every
+# forked worker instead of being loaded per worker.
+#
+#   gunicorn app:app                                               # sync workers
+#   gunicorn -k uvicorn.workers.UvicornWorker asgi:application     # async pipeline
+#
+# Set RAG_FAISS_MMAP=1 to also keep IVF index data in shared, file-backed pages.
+
+import os
+import gc
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Threads per worker for PyTorch inference; keeps N workers from oversubscribing the CPU.
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked.
+    # Freezing moves every loaded object out of the GC's reach, so collections in
+    # the workers don't write to (and un-share) the pages holding the model.
+    if preload_app:
+        gc.freeze()
+        server.log.info(f"Preloaded app; froze {gc.get_freeze_count()} objects for copy-on-write sharing.")
+
+
+def post_fork(server, worker):
+    # The Gemini client pool (llm_client), the RAG batcher thread, the joke prefetch
+    # thread and the feedback writer thread already rebuild themselves in each new
+    # process; here we only cap PyTorch's intra-op threads.
+    if TORCH_THREADS_PER_WORKER > 0:
+        try:
+            import torch
+            torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+        except ImportError:
+            pass
@@ -0,0 +1,389 @@
+# ingest.py
+#
+# Streaming, parallel ingestion for large corpora. Reads a directory of
+# .txt/.md/.jsonl files (or one .jsonl file), chunks it like faissmaker.py,
+# embeds the chunks with all-MiniLM-L6-v2 on a pool of worker processes and
+# writes the FAISS index, document store and tag index in bounded memory.
+#
+# Embeddings are cached per file under the SHA-256 of its contents (plus the
+# model and chunk size), so a re-run only embeds new or changed files; the
+# index itself is rebuilt from the cache, which takes seconds to minutes
+# rather than the hours of re-embedding.
+#
+#   python ingest.py docs/ --workers 8 --index-type ivf_flat
+#   python ingest.py docs/ --version 2026-10-18   # then: python rag_processor.py activate 2026-10-18
+
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import faiss
+
+from encoders import load_encoder, OnnxEncoder, ENCODER_BACKEND, BACKENDS
+from doc_store import DocumentStoreWriter, add_document_tags, save_tag_index, UNTAGGED
+from faissmaker import (FAISS_DIR, INDEX_FILENAME, DOCS_FILENAME, TAGS_FILENAME, MODEL_NAME, INDEX_TYPES,
+                        MAX_CHUNK_CHARS, iter_corpus_paths, iter_file_chunks, create_index)
+
+# --- Configuration ---
+CACHE_DIRNAME = "ingest_cache"        # Under FAISS_DIR; shared by every output (index version) built from it
+MANIFEST_FILENAME = "manifest.json"
+TASK_SIZE = 256                       # Chunks sent to a worker at once (it encodes them in batches of --batch-size)
+ADD_BATCH = 8192                      # Vectors read from the cache and added to the index at once
+TRAIN_SIZE = 100_000                  # Vectors sampled (across the whole corpus) to train IVF indexes
+PROGRESS_INTERVAL = 10.0              # Seconds between progress lines while embedding
+
+
+# --- Embedding Workers ---
+_worker_model = None
+
+
+def _load_model(model_name, backend, threads):
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEncoder(quantized=backend == "onnx_int8", threads=threads)
+    return load_encoder(backend, model_name)
+
+
+def _init_worker(model_name, backend, threads):
+    """ Process pool initializer: each worker loads its own copy of the model once. """
+    global _worker_model
+    if backend.startswith("torch"):
+        try:
+            import torch
+            # N processes x 1 thread scale better for a model this small than one process with N threads
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker_model = _load_model(model_name, backend, threads)
+
+
+def _embed(texts, batch_size):
+    vectors = _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+# --- Embedding Cache ---
+def file_digest(path, model_name=MODEL_NAME, max_chars=MAX_CHUNK_CHARS):
+    """ Cache key of a file's embeddings: SHA-256 of the model (and backend), chunk size and file contents. """
+    digest = hashlib.sha256(f"{model_name}\0{max_chars}\0".encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    One raw float32 file of embeddings per corpus file, named by file_digest(). Files
+    are written in order as the workers' results come back and renamed into place when
+    complete, so an interrupted run never leaves a partial entry behind.
+    """
+
+    def __init__(self, cache_dir, dim=None):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self._current = None # (digest, open temp file)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.f32")
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def write(self, digest, vectors):
+        """ Appends rows for `digest`; starting a new digest completes the previous one. """
+        if self._current is None or self._current[0] != digest:
+            self.finish()
+            self._current = (digest, open(f"{self.path(digest)}.tmp-{os.getpid()}", "wb"))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._current[1].write(vectors.tobytes())
+
+    def finish(self):
+        """ Completes the entry being written. """
+        if self._current is not None:
+            current_digest, f = self._current
+            f.close()
+            os.replace(f.name, self.path(current_digest))
+            self._current = None
+
+    def write_empty(self, digest):
+        """ Records a file without chunks, so it is skipped next time too. """
+        open(self.path(digest), "wb").close()
+
+    def discard(self, digest):
+        """ Drops the entry being written if it is `digest` (its file failed to read). """
+        if self._current is not None and self._current[0] == digest:
+            self._current[1].close()
+            os.remove(self._current[1].name)
+            self._current = None
+
+    def rows(self, digest):
+        return os.path.getsize(self.path(digest)) // (4 * self.dim) if self.dim else 0
+
+    def load(self, digest):
+        """ The entry as a read-only (rows, dim) memory map; nothing is read until it is sliced. """
+        rows = self.rows(digest)
+        if rows == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.path(digest), dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def prune(self, keep):
+        """ Removes entries whose digests aren't in `keep` (deleted or changed files). Returns the count. """
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".f32") and name[:-4] not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+
+# --- Pipeline ---
+def embed_files(files, source, cache, workers, batch_size, model_name=MODEL_NAME, max_chars=MAX_CHUNK_CHARS, encoder=ENCODER_BACKEND):
+    """
+    Embeds the chunks of `files` ([(path, digest)]) into `cache`. Chunks are read and
+    packed into tasks of TASK_SIZE in the parent, and at most 2 tasks per worker are in
+    flight, so memory stays bounded however large the corpus is.
+
+    Returns:
+        int: Number of chunks embedded.
+    """
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name, encoder, threads))
+    else:
+        _init_worker(model_name, encoder, threads)
+    pending = deque() # (future or vectors, [(digest, rows)]), in submission order
+    embedded = 0
+    started = last_report = time.perf_counter()
+
+    def submit(texts, segments):
+        work = executor.submit(_embed, texts, batch_size) if executor is not None else _embed(texts, batch_size)
+        pending.append((work, segments))
+
+    def drain(limit):
+        nonlocal embedded, last_report
+        while len(pending) > limit:
+            work, segments = pending.popleft()
+            vectors = work.result() if executor is not None else work
+            row = 0
+            for digest, rows in segments:
+                cache.write(digest, vectors[row:row + rows])
+                row += rows
+            embedded += row
+            if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.perf_counter()
+                logging.info(f"Embedded {embedded} chunks ({embedded / (last_report - started):.0f} docs/s)...")
+
+    try:
+        texts, segments = [], []
+        for path, digest in files:
+            try:
+                file_rows = 0
+                for chunk, _ in iter_file_chunks(path, source, max_chars):
+                    texts.append(chunk)
+                    file_rows += 1
+                    if segments and segments[-1][0] == digest:
+                        segments[-1] = (digest, segments[-1][1] + 1)
+                    else:
+                        segments.append((digest, 1))
+                    if len(texts) >= TASK_SIZE:
+                        submit(texts, segments)
+                        texts, segments = [], []
+                        drain(2 * max(1, workers))
+            except (OSError, UnicodeDecodeError) as e:
+                # Don't cache a partial file: flush what was queued before it, then drop its rows
+                logging.warning(f"Skipping unreadable file {path}: {e}")
+                segments = [segment for segment in segments if segment[0] != digest]
+                texts = texts[:sum(rows for _, rows in segments)]
+                drain(0)
+                cache.discard(digest)
+                continue
+            if file_rows == 0:
+                cache.write_empty(digest)
+        if texts:
+            submit(texts, segments)
+        drain(0)
+        cache.finish()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return embedded
+
+
+def _training_sample(cache, digests, total, train_size, seed=0):
+    """ Up to train_size cached vectors sampled uniformly from the whole corpus (not just the first files). """
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(total, size=min(train_size, total), replace=False))
+    sample, start = [], 0
+    for digest in digests:
+        rows = cache.rows(digest)
+        local = picks[(picks >= start) & (picks < start + rows)] - start
+        if len(local):
+            sample.append(np.asarray(cache.load(digest)[local]))
+        start += rows
+    return np.ascontiguousarray(np.vstack(sample), dtype=np.float32)
+
+
+def build_from_cache(files, source, cache, out_dir, index_type="flat", max_chars=MAX_CHUNK_CHARS, train_size=TRAIN_SIZE, **index_args):
+    """
+    Streams the cached embeddings into a new index and the chunks into a new document
+    store and tag index in `out_dir`, ADD_BATCH vectors at a time. Files are re-chunked
+    (cheap, deterministic) rather than keeping the texts around.
+
+    Returns:
+        int: Number of documents written.
+    """
+    digests = [digest for _, digest in files]
+    total = sum(cache.rows(digest) for digest in digests)
+    if total == 0:
+        raise ValueError("No chunks to index.")
+    index = create_index(cache.dim, index_type, total, **index_args)
+    if not index.is_trained:
+        sample = _training_sample(cache, digests, total, train_size)
+        logging.info(f"Training {index_type} index (nlist={faiss.extract_index_ivf(index).nlist}) on {len(sample)} sampled vectors...")
+        index.train(sample)
+        del sample
+
+    os.makedirs(out_dir, exist_ok=True)
+    ids_by_tag = {}
+    with DocumentStoreWriter(os.path.join(out_dir, DOCS_FILENAME)) as docs:
+        for path, digest in files:
+            vectors = cache.load(digest)
+            rows = 0
+            for chunk, tags in iter_file_chunks(path, source, max_chars):
+                add_document_tags(ids_by_tag, docs.add(chunk), tags)
+                rows += 1
+            if rows != len(vectors):
+                raise ValueError(f"{path} changed during ingestion ({rows} chunks, {len(vectors)} cached vectors). Re-run.")
+            for start in range(0, rows, ADD_BATCH):
+                index.add(np.ascontiguousarray(vectors[start:start + ADD_BATCH]))
+
+    index_path = os.path.join(out_dir, INDEX_FILENAME)
+    faiss.write_index(index, f"{index_path}.tmp-{os.getpid()}")
+    os.replace(f"{index_path}.tmp-{os.getpid()}", index_path)
+    tags_path = os.path.join(out_dir, TAGS_FILENAME)
+    if set(ids_by_tag) - {UNTAGGED}:
+        tag_counts = save_tag_index(tags_path, ids_by_tag)
+        logging.info(f"Wrote tag index for coach-scoped retrieval: {dict(sorted(tag_counts.items()))}")
+    elif os.path.exists(tags_path):
+        os.remove(tags_path) # Stale: its ids point into the previous document store
+    return index.ntotal
+
+
+def ingest(source, out_dir=FAISS_DIR, cache_dir=None, index_type="flat", workers=None, batch_size=64,
+           model_name=MODEL_NAME, max_chars=MAX_CHUNK_CHARS, train_size=TRAIN_SIZE, encoder=ENCODER_BACKEND, **index_args):
+    """
+    Builds the index, document store and tag index for `source` in `out_dir`, embedding
+    only the files whose contents aren't in the cache yet.
+
+    Args:
+        workers (int): Embedding processes. Defaults to half the CPUs; 0 embeds in this process.
+        encoder (str): Encoder backend (see encoders.py); the cache is kept per model and backend.
+        index_args: Passed to faissmaker.create_index() (nlist, hnsw_m, ef_construction, pq_m).
+
+    Returns:
+        dict: Files, skipped files, chunks embedded and indexed, and timings with docs/sec.
+    """
+    started = time.perf_counter()
+    workers = max(1, (os.cpu_count() or 2) // 2) if workers is None else workers
+    cache_dir = cache_dir or os.path.join(FAISS_DIR, CACHE_DIRNAME)
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILENAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    encoder_id = f"{model_name}@{encoder}"
+    cache = EmbeddingCache(cache_dir, manifest.get("dim"))
+    if manifest.get("model") != encoder_id or cache.dim is None:
+        # Entries can't be read without their dimension, and another model's are useless
+        cache.dim = None
+        cache.prune(set())
+
+    files = [(path, file_digest(path, encoder_id, max_chars)) for path in iter_corpus_paths(source)]
+    seen, to_embed = set(), []
+    for path, digest in files:
+        if not cache.has(digest) and digest not in seen:
+            to_embed.append((path, digest))
+        seen.add(digest)
+    skipped = len(files) - len(to_embed)
+    logging.info(f"{len(files)} file(s) under {source}: {skipped} unchanged, {len(to_embed)} to embed "
+                 f"({workers} worker process(es)).")
+
+    embed_start = time.perf_counter()
+    embedded = embed_files(to_embed, source, cache, workers, batch_size, model_name, max_chars, encoder) if to_embed else 0
+    embed_seconds = time.perf_counter() - embed_start
+    if embedded:
+        logging.info(f"Embedded {embedded} chunks in {embed_seconds:.1f}s ({embedded / embed_seconds:.0f} docs/s).")
+    files = [(path, digest) for path, digest in files if cache.has(digest)] # Minus unreadable files
+    pruned = cache.prune({digest for _, digest in files})
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"model": encoder_id, "dim": cache.dim, "max_chars": max_chars,
+                   "files": {os.path.relpath(path, source) if os.path.isdir(source) else path: digest for path, digest in files}}, f, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    build_start = time.perf_counter()
+    indexed = build_from_cache(files, source, cache, out_dir, index_type, max_chars, train_size, **index_args)
+    build_seconds = time.perf_counter() - build_start
+    total_seconds = time.perf_counter() - started
+    stats = {
+        "files": len(files),
+        "files_skipped": skipped,
+        "cache_entries_pruned": pruned,
+        "chunks_embedded": embedded,
+        "chunks_indexed": indexed,
+        "embed_s": round(embed_seconds, 3),
+        "embed_docs_per_s": round(embedded / embed_seconds, 1) if embedded else None,
+        "build_s": round(build_seconds, 3),
+        "total_s": round(total_seconds, 3),
+        "docs_per_s": round(indexed / total_seconds, 1),
+    }
+    logging.info(f"Indexed {indexed} chunks into {out_dir} in {total_seconds:.1f}s ({stats['docs_per_s']:.0f} docs/s overall; "
+                 f"embedding {embed_seconds:.1f}s, index build {build_seconds:.1f}s).")
+    return stats
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Embed a corpus in parallel and build the FAISS index, document store and tags.")
+    parser.add_argument("source", help="Directory of .txt/.md/.jsonl files, or a single .jsonl file.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--out", default=FAISS_DIR, help="Output directory (ignored with --version).")
+    parser.add_argument("--version", default=None, help="Write to faiss_index/versions/<VERSION>/ for a hot swap.")
+    parser.add_argument("--cache-dir", default=None, help=f"Embedding cache (default {FAISS_DIR}/{CACHE_DIRNAME}).")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding processes (default: half the CPUs; 0 = in-process).")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--encoder", choices=BACKENDS, default=ENCODER_BACKEND, help="Embedding backend (default: RAG_ENCODER).")
+    parser.add_argument("--max-chunk-chars", type=int, default=MAX_CHUNK_CHARS)
+    parser.add_argument("--train-size", type=int, default=TRAIN_SIZE, help="Vectors sampled to train IVF indexes.")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N)).")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--pq-m", type=int, default=48)
+    args = parser.parse_args()
+
+    out_dir = os.path.join(FAISS_DIR, "versions", args.version) if args.version else args.out
+    try:
+        stats = ingest(args.source, out_dir, args.cache_dir, args.index_type, args.workers, args.batch_size,
+                       max_chars=args.max_chunk_chars, train_size=args.train_size, encoder=args.encoder, nlist=args.nlist,
+                       hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, pq_m=args.pq_m)
+    except (OSError, ValueError) as e:
+        logging.error(f"Ingestion failed: {e}")
+        return 1
+    print(json.dumps(stats, indent=2))
+    if args.version:
+        print(f"\nActivate it with: python rag_processor.py activate {args.version}")
+    else:
+        print("\nRun faisscheck.py to validate the new index.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+# intent_router.py
+#
+# Fast-path intent detection for chat messages that don't need RAG or the LLM:
+# dad jokes, greetings, help and switching coach. The rules for all enabled
+# intents are compiled into one regex with a named group per intent, so a
+# message is classified in a single pass. Optionally, messages the rules miss
+# are compared against example phrases with the already-loaded MiniLM model.
+
+import os
+import re
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# --- Configuration ---
+# Comma-separated intents to short-circuit; the rest go through RAG + LLM as before
+INTENT_ROUTER_INTENTS = os.getenv("INTENT_ROUTER_INTENTS", "joke,greeting,help,coach_switch")
+# Optional JSON file {"intent": ["regex", ...]} that replaces the rules of those intents
+INTENT_RULES_FILE = os.getenv("INTENT_RULES_FILE")
+# Cosine similarity for the embedding classifier; 0 (default) disables it
+INTENT_EMBEDDING_THRESHOLD = float(os.getenv("INTENT_EMBEDDING_THRESHOLD", "0"))
+
+# Patterns run against the lowercased message. Greetings and help must be the
+# whole message, so "hi, I lost my job" still reaches the coach.
+_END = r"[\s!.,?]*$"
+DEFAULT_RULES = {
+    "joke": [r"joke", r"make me laugh", r"something funny", r"cheer me up"],
+    "greeting": [
+        r"^(?:hi|hello|hey|hiya|howdy|greetings|yo|good (?:morning|afternoon|evening))(?: there)?"
+        r"(?: (?:coach|yoda|aiyoda|friend))?" + _END,
+    ],
+    "help": [
+        r"^(?:help|help me|what can you do|what can i ask(?: you)?|how does this work|what do you do|who are you)" + _END,
+    ],
+    # {coach} is replaced with an alternation of the known coach names
+    "coach_switch": [
+        r"(?:switch|change|go|talk|speak|move)(?: me)?(?: back)? (?:to|with)(?: the)? (?P<coach>{coach})\b",
+        r"^(?:i want|i'd like|let me talk to|can i talk to)(?: to talk to| to speak with| to speak to)?(?: the)? (?P<coach2>{coach})" + _END,
+    ],
+}
+# Example phrases for the embedding classifier
+EMBEDDING_EXAMPLES = {
+    "joke": ["tell me a joke", "say something funny", "i need a laugh"],
+    "greeting": ["hello", "hi there", "good morning"],
+    "help": ["what can you help me with", "how do i use this", "what can i ask you"],
+}
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    source: str = "rule"       # 'rule' or 'embedding'
+    score: float = 1.0
+    params: dict = field(default_factory=dict)
+
+
+def coach_aliases(personas):
+    """ Lowercased names a user might call each coach by (persona_registry.Persona list) -> display name. """
+    aliases = {}
+    for persona in personas:
+        names = [persona.display_name, persona.url_name, persona.key.replace("_", " "), persona.data.get("persona_name", "")]
+        names += list(persona.data.get("aliases", []))
+        for name in names:
+            if isinstance(name, str) and name.strip():
+                aliases[name.strip().lower()] = persona.display_name
+    return aliases
+
+
+def load_rules(path=INTENT_RULES_FILE):
+    rules = {intent: list(patterns) for intent, patterns in DEFAULT_RULES.items()}
+    if not path:
+        return rules
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for intent, patterns in overrides.items():
+            if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+                raise ValueError(f"rules for '{intent}' must be a list of regex strings")
+            rules[intent] = patterns
+        logging.info(f"Loaded intent rules for {sorted(overrides)} from '{path}'.")
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not load intent rules from '{path}': {e}. Using the built-in rules.")
+    return rules
+
+
+class IntentRouter:
+    """
+    Classifies a message into one of the enabled fast-path intents, or None.
+    Build it once (and again when the set of coaches changes); route() is thread-safe.
+    """
+
+    def __init__(self, coach_aliases, intents=INTENT_ROUTER_INTENTS, rules=None,
+                 embedding_threshold=INTENT_EMBEDDING_THRESHOLD):
+        """
+        Args:
+            coach_aliases (dict): Lowercased name or alias -> coach display name.
+            intents (str | list): Enabled intents, in priority order.
+            rules (dict): intent -> list of regex patterns. Defaults to load_rules().
+            embedding_threshold (float): Minimum cosine similarity for the embedding classifier; 0 disables it.
+        """
+        if isinstance(intents, str):
+            intents = [intent.strip() for intent in intents.split(",") if intent.strip()]
+        self.rules = load_rules() if rules is None else rules
+        self.intents = []
+        for intent in intents:
+            if self.rules.get(intent):
+                self.intents.append(intent)
+            else:
+                logging.warning(f"Intent router: no rules for intent '{intent}'. Skipping it.")
+
+        self.embedding_threshold = embedding_threshold
+        self._examples = None # (matrix of unit vectors, intent per row), built on first use
+        self._lock = threading.Lock()
+        self._counts = {intent: 0 for intent in self.intents}
+        self._counts[None] = 0
+        self.set_coaches(coach_aliases)
+
+    def set_coaches(self, coach_aliases):
+        """ (Re)compiles the rules for a new set of coach names; hit counters are kept. """
+        coach_aliases = dict(coach_aliases)
+        # Longest names first so "wellness warrior" wins over a shorter alias it contains
+        coach_alternation = "|".join(re.escape(alias) for alias in sorted(coach_aliases, key=len, reverse=True)) or r"(?!x)x"
+        group_patterns = []
+        for intent in self.intents:
+            for i, pattern in enumerate(self.rules[intent]):
+                # Group names must be unique in the combined regex
+                pattern = pattern.replace("{coach}", coach_alternation)
+                pattern = re.sub(r"\(\?P<(\w+)>", lambda m: f"(?P<{intent}__{i}__{m.group(1)}>", pattern)
+                group_patterns.append(f"(?P<{intent}__{i}>{pattern})")
+        # Swapped as one tuple so concurrent route() calls see a consistent pair
+        self._compiled = (re.compile("|".join(group_patterns)) if group_patterns else None, coach_aliases)
+
+    def _match_rules(self, lowered):
+        regex, coach_aliases = self._compiled
+        match = regex.search(lowered) if regex is not None else None
+        if match is None:
+            return None
+        intent = match.lastgroup.split("__")[0]
+        params = {}
+        for name, value in match.groupdict().items():
+            parts = name.split("__")
+            if value is not None and len(parts) == 3 and parts[0] == intent:
+                params[parts[2].rstrip("0123456789")] = value
+        if "coach" in params:
+            params["coach"] = coach_aliases.get(params["coach"], params["coach"])
+        return IntentMatch(intent, params=params)
+
+    def _match_embedding(self, embedding):
+        if self._examples is None:
+            return None
+        matrix, labels = self._examples
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        scores = matrix @ (vector / norm)
+        best = int(np.argmax(scores))
+        if scores[best] < self.embedding_threshold:
+            return None
+        return IntentMatch(labels[best], source="embedding", score=float(scores[best]))
+
+    def prepare_embeddings(self, encode):
+        """ Embeds the example phrases with `encode(list[str]) -> (n, d) array`. Safe to call repeatedly. """
+        if self.embedding_threshold <= 0 or self._examples is not None:
+            return
+        labels = [intent for intent in self.intents for _ in EMBEDDING_EXAMPLES.get(intent, ())]
+        phrases = [phrase for intent in self.intents for phrase in EMBEDDING_EXAMPLES.get(intent, ())]
+        if not phrases:
+            return
+        matrix = np.asarray(encode(phrases), dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._examples = (matrix, labels)
+
+    def match_text(self, message):
+        """ The rule-based match for `message`, or None. Unlike route() it isn't counted in stats(). """
+        return self._match_rules(message.lower())
+
+    def route(self, message, embedding=None):
+        """
+        Returns the IntentMatch for `message`, or None if it should take the normal
+        RAG + LLM path. `embedding` (the query's MiniLM vector) enables the
+        embedding classifier for messages the rules don't match.
+        """
+        intent_match = self.match_text(message)
+        if intent_match is None and embedding is not None and self.embedding_threshold > 0:
+            intent_match = self._match_embedding(embedding)
+        with self._lock:
+            self._counts[intent_match.intent if intent_match else None] += 1
+        return intent_match
+
+    def stats(self):
+        """ Hits per intent ('none' = routed to RAG + LLM). """
+        with self._lock:
+            return {(intent or "none"): count for intent, count in self._counts.items()}
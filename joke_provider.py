@@ -0,0 +1,205 @@
+# joke_provider.py
+#
+# Serves dad jokes without touching the network on the request path. A
+# background thread keeps a ring buffer of jokes topped up from the joke API
+# through one pooled (keep-alive) HTTP session; requests take a joke from the
+# buffer, or from the bundled local corpus when the buffer is empty. A circuit
+# breaker stops the refills from hammering an upstream that keeps failing.
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_stage
+
+# --- Configuration ---
+JOKE_API_URL = os.getenv("JOKE_API_URL", "https://icanhazdadjoke.com/")
+JOKE_BUFFER_SIZE = int(os.getenv("JOKE_BUFFER_SIZE", "16"))
+# Refill once the buffer has this many jokes or fewer
+JOKE_REFILL_LOW_WATER = int(os.getenv("JOKE_REFILL_LOW_WATER", "4"))
+JOKE_FETCH_TIMEOUT = float(os.getenv("JOKE_FETCH_TIMEOUT", "3.0"))
+# Consecutive failures that open the breaker, and how long it stays open
+JOKE_BREAKER_FAILURES = int(os.getenv("JOKE_BREAKER_FAILURES", "3"))
+JOKE_BREAKER_COOLDOWN = float(os.getenv("JOKE_BREAKER_COOLDOWN", "60"))
+LOCAL_JOKES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "joke_data", "dad_jokes.json")
+FALLBACK_JOKE = "No joke today, but you’re still awesome!"
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures it
+    opens and refuses calls for `reset_timeout` seconds, then lets a single
+    trial call through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=JOKE_BREAKER_FAILURES, reset_timeout=JOKE_BREAKER_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            return self._state() != "open"
+
+    def seconds_until_retry(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            was_half_open = self._state() == "half_open"
+            self._failures += 1
+            if was_half_open or self._failures >= self.failure_threshold:
+                if self._opened_at is None or was_half_open:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+
+
+def load_local_jokes(path=LOCAL_JOKES_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            jokes = [joke for joke in json.load(f) if isinstance(joke, str) and joke.strip()]
+        if jokes:
+            return jokes
+        logging.warning(f"Local joke corpus '{path}' is empty.")
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not load local joke corpus '{path}': {e}")
+    return [FALLBACK_JOKE]
+
+
+class JokeProvider:
+    """ Prefetching joke source. get_joke() never waits on the network. """
+
+    def __init__(self, api_url=JOKE_API_URL, buffer_size=JOKE_BUFFER_SIZE, low_water=JOKE_REFILL_LOW_WATER,
+                 fetch_timeout=JOKE_FETCH_TIMEOUT, breaker=None, local_jokes=None):
+        self.api_url = api_url
+        self.buffer_size = max(1, buffer_size)
+        self.low_water = min(low_water, self.buffer_size - 1)
+        self.fetch_timeout = fetch_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.local_jokes = local_jokes if local_jokes is not None else load_local_jokes()
+        self._buffer = deque(maxlen=self.buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._session = None
+        self._stats = {"served_buffer": 0, "served_local": 0, "fetched": 0, "fetch_errors": 0, "duplicates": 0}
+
+    # --- Background Refill ---
+    def start(self):
+        """ Starts (or, after a fork, restarts) the refill thread and asks it to fill the buffer. """
+        if not (self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()):
+            with self._lock:
+                if not (self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()):
+                    # Threads and pooled connections don't survive fork; each worker gets its own
+                    self._pid = os.getpid()
+                    self._session = None
+                    self._wakeup = threading.Event()
+                    self._thread = threading.Thread(target=self._run, name="joke-refill", daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _get_session(self):
+        if self._session is None:
+            session = requests.Session()
+            session.headers.update({'Accept': 'application/json', 'User-Agent': 'Life-Coach (dad joke prefetch)'})
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            self._session = session
+        return self._session
+
+    def _fetch_one(self):
+        start = time.perf_counter()
+        try:
+            response = self._get_session().get(self.api_url, timeout=self.fetch_timeout)
+        finally:
+            observe_stage("joke_fetch", time.perf_counter() - start)
+        response.raise_for_status()
+        joke = response.json().get('joke')
+        if not isinstance(joke, str) or not joke.strip():
+            raise ValueError("response has no joke")
+        return joke.strip()
+
+    def refill(self):
+        """ Fetches jokes until the buffer is full or a fetch fails. Returns the number added. """
+        added = 0
+        while len(self._buffer) < self.buffer_size and self.breaker.allow():
+            try:
+                joke = self._fetch_one()
+            except (requests.RequestException, ValueError) as e:
+                self.breaker.record_failure()
+                with self._lock:
+                    self._stats["fetch_errors"] += 1
+                logging.warning(f"Dad Joke API failed ({self.breaker.state}): {e}")
+                break
+            self.breaker.record_success()
+            with self._lock:
+                self._stats["fetched"] += 1
+                if joke in self._buffer:
+                    # The API repeats itself; stop rather than fill the buffer with copies
+                    self._stats["duplicates"] += 1
+                    break
+                self._buffer.append(joke)
+            added += 1
+        return added
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if not self.breaker.allow():
+                # Sleep through the cooldown, then try again if jokes are still needed
+                time.sleep(self.breaker.seconds_until_retry())
+                if len(self._buffer) <= self.low_water:
+                    self._wakeup.set()
+                continue
+            self.refill()
+
+    # --- Serving ---
+    def get_joke(self):
+        """ Returns a joke immediately: a prefetched one if available, otherwise a local one. """
+        with self._lock:
+            joke = self._buffer.popleft() if self._buffer else None
+            remaining = len(self._buffer)
+            self._stats["served_buffer" if joke is not None else "served_local"] += 1
+        if remaining <= self.low_water:
+            self.start()
+        return joke if joke is not None else random.choice(self.local_jokes)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["buffered"] = len(self._buffer)
+        stats["breaker_state"] = self.breaker.state
+        stats["breaker_opened"] = self.breaker.times_opened
+        return stats
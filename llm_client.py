@@ -0,0 +1,131 @@
+# llm_client.py
+
+import os
+import logging
+import threading
+import time
+import hashlib
+
+# --- Configuration ---
+# Transport used by the Gemini client: "grpc" (library default) or "rest".
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None
+# Override the API endpoint, e.g. "http://127.0.0.1:8089" for a local stub LLM server.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+
+# --- Pool State ---
+# One ChatGoogleGenerativeAI per distinct settings tuple. Each client owns its
+# transport (gRPC channel or HTTP session), so reusing it keeps the connection
+# alive across requests instead of paying a new TLS handshake per turn.
+_pool = {}
+_pool_lock = threading.Lock()
+_pool_pid = os.getpid()
+
+_stats_lock = threading.Lock()
+_stats = {
+    # Client objects built (one per process and settings tuple). The connection and its TLS
+    # handshake are opened lazily by the client's transport and are not counted here; the stub
+    # server in benchmarks/bench_llm_pool.py counts those.
+    "clients_built": 0,
+    "pool_hits": 0,
+    "setup_seconds_built": 0.0,
+    "setup_seconds_hits": 0.0,
+    "last_setup_seconds": 0.0,
+}
+
+
+def _reset_after_fork():
+    """
+    Drops every pooled client in a freshly forked child. gRPC channels and HTTP
+    connections opened in the parent (e.g. under gunicorn --preload) must not be
+    shared with workers, so each worker builds its own on first use.
+    """
+    global _pool, _pool_lock, _pool_pid, _stats_lock
+    _pool = {}
+    _pool_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _pool_pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _pool_key(model_name, api_key, settings):
+    # Hash the key so it never ends up in logs or stats output
+    key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+    return (model_name, key_digest, tuple(sorted(settings.items())))
+
+
+def _record(built: bool, elapsed: float):
+    with _stats_lock:
+        if built:
+            _stats["clients_built"] += 1
+            _stats["setup_seconds_built"] += elapsed
+        else:
+            _stats["pool_hits"] += 1
+            _stats["setup_seconds_hits"] += elapsed
+        _stats["last_setup_seconds"] = elapsed
+
+
+def get_chat_model(model_name: str, api_key: str, **settings):
+    """
+    Returns a process-wide ChatGoogleGenerativeAI for the given model and settings,
+    creating it on first use.
+
+    Args:
+        model_name (str): Gemini model name.
+        api_key (str): Google API key.
+        **settings: Extra constructor arguments (temperature, safety_settings, ...).
+                    Values must be hashable; each distinct combination gets its own client.
+
+    Returns:
+        ChatGoogleGenerativeAI: A shared, thread-safe chat model instance.
+    """
+    start = time.perf_counter()
+    if os.getpid() != _pool_pid: # Fallback for platforms without register_at_fork
+        _reset_after_fork()
+
+    if GEMINI_TRANSPORT and "transport" not in settings:
+        settings["transport"] = GEMINI_TRANSPORT
+    key = _pool_key(model_name, api_key, settings)
+
+    chat_model = _pool.get(key)
+    if chat_model is not None:
+        _record(False, time.perf_counter() - start)
+        return chat_model
+
+    with _pool_lock:
+        chat_model = _pool.get(key)
+        if chat_model is None:
+            logging.info(f"Creating pooled Gemini client for model '{model_name}' (pid {os.getpid()}).")
+            # Imported on first use: langchain_google_genai pulls in the whole Google client stack
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            client_kwargs = dict(settings)
+            if GEMINI_API_ENDPOINT:
+                client_kwargs["client_options"] = {"api_endpoint": GEMINI_API_ENDPOINT}
+            chat_model = ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key, **client_kwargs)
+            _pool[key] = chat_model
+            _record(True, time.perf_counter() - start)
+            return chat_model
+
+    _record(False, time.perf_counter() - start)
+    return chat_model
+
+
+def get_pool_stats() -> dict:
+    """ Returns a snapshot of pool size, clients built, pool hits and get_chat_model() latency. """
+    with _stats_lock:
+        stats = dict(_stats)
+    built = stats["clients_built"]
+    hits = stats["pool_hits"]
+    stats["pool_size"] = len(_pool)
+    stats["pid"] = os.getpid()
+    stats["avg_setup_ms_built"] = stats["setup_seconds_built"] / built * 1000 if built else 0.0
+    stats["avg_setup_ms_hits"] = stats["setup_seconds_hits"] / hits * 1000 if hits else 0.0
+    return stats
+
+
+def clear_pool():
+    """ Discards all pooled clients (e.g. after rotating the API key). """
+    with _pool_lock:
+        _pool.clear()
@@ -0,0 +1,205 @@
+# metrics.py
+#
+# In-process instrumentation: latency histograms for the hot stages of a chat
+# turn, counters for RAG outcomes, and collectors that turn the stats() of the
+# caches and pools into gauges. Everything is rendered in the Prometheus text
+# format for GET /metrics. Recording is a bisect and a few additions under a
+# lock, so it stays on in production.
+#
+# Values are per process: with several gunicorn workers each scrape reports the
+# worker that happened to answer it.
+
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Upper bounds (seconds) of the latency buckets; from sub-millisecond cache hits to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ A monotonically increasing count per label combination. """
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Histogram:
+    """ Cumulative-bucket latency histogram per label combination, in seconds. """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *labelvalues):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def snapshot(self, *labelvalues):
+        """ Returns (bucket counts, sum, count) for one label combination. """
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return (list(series[0]), series[1], series[2]) if series else ([0] * (len(self.buckets) + 1), 0.0, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        samples = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, labels, [("le", _format_value(bound))]), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, labels), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, labels), count))
+        return samples
+
+
+class MetricsRegistry:
+    """ Holds the metrics and the stats collectors, and renders them for /metrics. """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix, documentation, stats_fn):
+        """
+        Exports the numeric values of `stats_fn()` (a flat dict, e.g. a cache's stats())
+        as gauges named <prefix>_<key>, read at scrape time. String values become a
+        <prefix>_<key>{value="..."} 1 gauge; nested dicts are flattened with '_'.
+        """
+        self._collectors.append((prefix, documentation, stats_fn))
+
+    def render(self):
+        """ All metrics in the Prometheus text exposition format (version 0.0.4). """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        for prefix, documentation, stats_fn in self._collectors:
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logging.warning(f"Metrics collector '{prefix}' failed: {e}")
+                continue
+            for key, value in _flatten(stats or {}):
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {documentation} ({key})")
+                lines.append(f"# TYPE {name} gauge")
+                if isinstance(value, str):
+                    lines.append(f'{name}{{value="{value}"}} 1')
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(stats, prefix=""):
+    for key, value in stats.items():
+        key = "".join(ch if ch.isalnum() else "_" for ch in f"{prefix}{key}")
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{key}_")
+        elif isinstance(value, bool):
+            yield key, int(value)
+        elif isinstance(value, (int, float, str)):
+            yield key, value
+
+
+# --- Process-wide Metrics ---
+REGISTRY = MetricsRegistry()
+
+stage_seconds = REGISTRY.histogram(
+    "lifecoach_stage_seconds",
+    "Duration of each stage of a chat turn (persona, intent, history, retrieval, cache, prepare_total, "
+    "embedding_encode, faiss_search, llm_ttfb, llm_total, joke_fetch, template_render, feedback_write).",
+    labelnames=("stage",))
+rag_searches = REGISTRY.counter(
+    "lifecoach_rag_searches_total",
+    "RAG retrievals by outcome: hit (documents found), miss (none found), error, timeout, skipped (RAG not loaded).",
+    labelnames=("result",))
+chat_turns = REGISTRY.counter(
+    "lifecoach_chat_turns_total",
+    "Chat turns by what answered them: intent (fast path), cache (response cache) or llm.",
+    labelnames=("answered_by",))
+
+
+def observe_stage(stage, seconds):
+    """ Records one stage duration. No-op when METRICS_ENABLED=0. """
+    if REGISTRY.enabled:
+        stage_seconds.observe(seconds, stage)
+
+
+def count_rag_search(result):
+    if REGISTRY.enabled:
+        rag_searches.inc(result)
+
+
+def count_chat_turn(answered_by):
+    if REGISTRY.enabled:
+        chat_turns.inc(answered_by)
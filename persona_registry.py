@@ -0,0 +1,168 @@
+# persona_registry.py
+
+import os
+import json
+import logging
+import threading
+import time
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+
+# --- Constants ---
+COACH_DATA_DIR = "coach_data"
+DEFAULT_IMAGE = "default.jpg"
+# Minimum seconds between directory scans for changed persona files
+RELOAD_CHECK_INTERVAL = float(os.getenv("PERSONA_RELOAD_INTERVAL", "2.0"))
+
+
+def coach_key(coach_display_name: str) -> str:
+    """ Maps a display name ('Career Catalyst') to its file key ('career_catalyst'). """
+    return coach_display_name.strip().lower().replace(' ', '_')
+
+
+@dataclass(frozen=True)
+class Persona:
+    """ An immutable, validated coach persona loaded from coach_data/<key>.json. """
+    key: str
+    display_name: str
+    url_name: str
+    prompt_prefix: str
+    image: str
+    data: MappingProxyType
+    mtime: float
+
+    @property
+    def is_valid(self) -> bool:
+        return bool(self.prompt_prefix)
+
+    @cached_property
+    def version(self) -> str:
+        """ Short hash of the system prompt; changes whenever the coach's prompt is edited. """
+        return hashlib.sha256(self.prompt_prefix.encode("utf-8")).hexdigest()[:12]
+
+
+class PersonaRegistry:
+    """
+    Loads every persona in the coach data directory once and serves them from
+    memory. The directory is re-scanned at most every `reload_interval` seconds
+    and only files whose mtime changed are parsed again.
+    """
+
+    def __init__(self, data_dir=COACH_DATA_DIR, images_dir=None, reload_interval=RELOAD_CHECK_INTERVAL):
+        self.data_dir = data_dir
+        self.images_dir = images_dir
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._personas = {}   # key -> Persona
+        self._errors = {}     # key -> (mtime, error message) for files that failed to load
+        self._snapshot = ((), 0)  # (personas sorted by key, generation)
+        self._last_check = 0.0
+        self.refresh(force=True)
+
+    # --- Loading ---
+    def _resolve_image(self, image_filename, display_name):
+        if self.images_dir is None:
+            return image_filename
+        if not os.path.exists(os.path.join(self.images_dir, image_filename)):
+            logging.warning(f"Image file not found: {os.path.join(self.images_dir, image_filename)} for coach {display_name}. Using {DEFAULT_IMAGE}.")
+            return DEFAULT_IMAGE
+        return image_filename
+
+    def _load_file(self, key, filepath, mtime):
+        display_name = key.replace("_", " ").title()
+        with open(filepath, "r", encoding='utf-8') as f:
+            persona_data = json.load(f)
+        if not isinstance(persona_data, dict):
+            raise ValueError(f"expected a JSON object, got {type(persona_data).__name__}")
+
+        prompt_prefix = persona_data.get("prompt_prefix") or ""
+        if not isinstance(prompt_prefix, str) or not prompt_prefix.strip():
+            logging.error(f"CRITICAL: 'prompt_prefix' missing or empty in {filepath}")
+            prompt_prefix = ""
+
+        return Persona(
+            key=key,
+            display_name=display_name,
+            url_name=display_name.lower().replace(" ", ""),
+            prompt_prefix=prompt_prefix,
+            image=self._resolve_image(persona_data.get('image', DEFAULT_IMAGE), display_name),
+            data=MappingProxyType(persona_data),
+            mtime=mtime,
+        )
+
+    def refresh(self, force=False) -> bool:
+        """
+        Re-scans the data directory and reloads files whose mtime changed.
+
+        Returns:
+            bool: True if the set of loaded personas changed.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return False
+
+        with self._lock:
+            if not force and now - self._last_check < self.reload_interval:
+                return False
+            self._last_check = now
+
+            try:
+                entries = {
+                    entry.name[:-5]: (entry.path, entry.stat().st_mtime)
+                    for entry in os.scandir(self.data_dir)
+                    if entry.name.endswith(".json") and not entry.name.startswith('.')
+                }
+            except FileNotFoundError:
+                logging.error(f"Coach data directory '{self.data_dir}' not found during persona load!")
+                entries = {}
+            except OSError as e:
+                logging.error(f"Error listing coach data directory '{self.data_dir}': {e}")
+                return False
+
+            personas = {}
+            errors = {}
+            changed = set(entries) != set(self._personas) | set(self._errors)
+            for key, (filepath, mtime) in entries.items():
+                current = self._personas.get(key)
+                if current is not None and current.mtime == mtime:
+                    personas[key] = current
+                    continue
+                previous_error = self._errors.get(key)
+                if previous_error is not None and previous_error[0] == mtime:
+                    errors[key] = previous_error
+                    continue
+
+                changed = True
+                try:
+                    personas[key] = self._load_file(key, filepath, mtime)
+                    logging.info(f"Loaded persona '{key}' from {filepath}.")
+                except json.JSONDecodeError as e:
+                    logging.error(f"Error decoding JSON from {filepath}: {e}")
+                    errors[key] = (mtime, f"Error decoding JSON: {e}")
+                except Exception as e:
+                    logging.error(f"Error processing coach file {filepath}: {e}")
+                    errors[key] = (mtime, str(e))
+
+            if changed:
+                self._personas = personas
+                self._errors = errors
+                self._snapshot = (tuple(personas[key] for key in sorted(personas)), self._snapshot[1] + 1)
+            return changed
+
+    # --- Lookups ---
+    def get(self, coach_display_name):
+        """ Returns the Persona for a display name, or None if it is unknown or failed to load. """
+        self.refresh()
+        return self._personas.get(coach_key(coach_display_name))
+
+    def load_error(self, coach_display_name):
+        """ Returns the load error for a persona file that exists but could not be parsed, else None. """
+        error = self._errors.get(coach_key(coach_display_name))
+        return error[1] if error else None
+
+    def snapshot(self):
+        """ Returns (personas sorted by file name, generation). The generation changes on every reload. """
+        self.refresh()
+        return self._snapshot
@@ -1,33 +1,560 @@
 # rag_processor.py (Fixed for tuple metadata)
 
-import faiss
 import pickle
 import os
 import logging
-from sentence_transformers import SentenceTransformer
 import time # Optional: for timing loading
+import threading
+import queue
+import itertools
+import shutil
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from doc_store import (DocumentStore, DocumentStoreError, write_document_store, write_tag_index,
+                       load_tag_index, normalize_tag, UNTAGGED)
+from metrics import observe_stage, count_rag_search
+from encoders import load_encoder, EncoderError, ENCODER_BACKEND
+# faiss and the encoder backends (sentence_transformers, onnxruntime) are imported inside
+# the functions that need them, so importing this module (and app.py) stays fast; see
+# start_background_load().
 
 # --- Constants ---
 FAISS_INDEX_DIR = "faiss_index"
 FAISS_INDEX_PATH = os.path.join(FAISS_INDEX_DIR, "index.faiss")
-PKL_PATH = os.path.join(FAISS_INDEX_DIR, "index.pkl")
+PKL_PATH = os.path.join(FAISS_INDEX_DIR, "index.pkl")  # Legacy metadata format, see doc_store.py
+DOCS_PATH = os.path.join(FAISS_INDEX_DIR, "index.docs")
+TAGS_PATH = os.path.join(FAISS_INDEX_DIR, "index.tags.npz")  # Optional; enables coach-scoped search
+# Published index versions live in faiss_index/versions/<name>/ (same file names as above)
+# and faiss_index/CURRENT names the active one; without it the files above are used
+# (version "base"). Each worker checks CURRENT at most every RAG_INDEX_CHECK_INTERVAL
+# seconds and swaps to a new version in the background; 0 disables the check.
+INDEX_VERSIONS_DIR = os.path.join(FAISS_INDEX_DIR, "versions")
+CURRENT_VERSION_PATH = os.path.join(FAISS_INDEX_DIR, "CURRENT")
+INDEX_CHECK_INTERVAL = float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "30"))
 EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
 
+# Query caches: repeated openers ("hello", "good morning") skip MiniLM encoding entirely.
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("RAG_EMBEDDING_CACHE_TTL", "3600"))
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024")) # 0 disables the result cache
+RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "600"))
+
+# Micro-batching: queries arriving within the window are encoded and searched together.
+# A window of 0 disables batching (each call encodes and searches on its own).
+BATCH_WINDOW_MS = float(os.getenv("RAG_BATCH_WINDOW_MS", "0"))
+BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+
+# Memory-map the FAISS index file instead of reading it onto the heap. Forked workers
+# then share the mapped pages; needed for IVF data to stay shared after a gunicorn --preload.
+FAISS_MMAP = os.getenv("RAG_FAISS_MMAP", "0") == "1"
+
+# Search-time knobs for approximate indexes built by faissmaker.py (ignored for flat indexes).
+NPROBE = int(os.getenv("RAG_NPROBE", "16"))          # IVF lists scanned per query
+EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))    # HNSW candidate list size
+
+# Coach-scoped retrieval (coach_data "rag_tags" + index.tags.npz): "partition" searches a
+# per-scope flat sub-index (exact indexes only), "selector" filters the main index with a
+# FAISS IDSelector, "auto" picks partition for flat indexes and selector otherwise, "off"
+# always searches everything. Untagged documents are visible to every coach unless disabled.
+SCOPE_MODE = os.getenv("RAG_SCOPE_MODE", "auto")
+SCOPE_INCLUDE_UNTAGGED = os.getenv("RAG_SCOPE_INCLUDE_UNTAGGED", "1") == "1"
+
+# Post-processing of the raw hits: RAG_CANDIDATES are fetched, those below the cosine
+# similarity cutoff are dropped, near-duplicates collapsed, and the best k picked by
+# Maximal Marginal Relevance (1.0 = rank by relevance only).
+MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))      # -1 disables the cutoff
+RERANK_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "12"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+DEDUP_SIMILARITY = float(os.getenv("RAG_DEDUP_SIMILARITY", "0.95"))  # Candidates this close to a picked one are dropped
+
+# Metadata may be the memory-mapped store or a legacy list/tuple from index.pkl
+METADATA_TYPES = (DocumentStore, list, tuple)
+
 # --- Global Variables ---
 embedding_model = None
+# The active IndexVersion's components, kept in sync by activate_index(). Searches read
+# _active_version once instead, so a swap never mixes two versions within one search.
 faiss_index = None
 metadata = None
+doc_tags = None  # {tag: sorted document ids}, or None when the index has no tag file
+_active_version = None
+
+
+# --- Query Caches ---
+class LRUCache:
+    """ A small thread-safe LRU cache with a per-entry TTL and hit/miss counters. """
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _reset_after_fork(self):
+        # Another thread of the parent (loader, warm-up) may have held the lock at fork time
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+# Keyed by (index generation, normalized query, k, scope tags); cleared whenever a new index is activated
+result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+
+def normalize_query(query: str) -> str:
+    """ Case- and whitespace-insensitive cache key. all-MiniLM-L6-v2 is uncased, so this doesn't change the embedding. """
+    return " ".join(query.lower().split())
+
+
+def encode_query(query: str):
+    """ Returns the (1, d) float32 embedding for a query, served from the embedding cache when possible. """
+    key = normalize_query(query)
+    query_embedding = embedding_cache.get(key)
+    if query_embedding is None:
+        start = time.perf_counter()
+        query_embedding = embedding_model.encode([key])
+        observe_stage("embedding_encode", time.perf_counter() - start)
+        query_embedding.setflags(write=False) # Shared between callers
+        embedding_cache.put(key, query_embedding)
+    return query_embedding
+
+
+def get_cache_stats() -> dict:
+    """ Hit/miss counters for the embedding and result caches, for sizing them. """
+    return {"embedding_cache": embedding_cache.stats(), "result_cache": result_cache.stats()}
+
+
+# --- Request Coalescing ---
+class QueryBatcher:
+    """
+    Coalesces concurrent searches. Callers block on a Future while a single
+    background thread gathers queries for up to `window_ms` (or `max_batch`
+    queries), encodes the uncached ones in one batch, runs one batched FAISS
+    search and hands each caller its own row of the result.
+    """
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX_SIZE):
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.batched_queries = 0
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so each (gunicorn) worker process starts its own
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="rag-batcher", daemon=True)
+            self._thread.start()
+
+    def _reset_after_fork(self):
+        # The parent's batcher thread (and any lock or queue state it held) is gone in the child
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+
+    def search(self, query: str, k: int, scope=None, version=None, timeout: float = 30.0):
+        """ Returns (distances, indices) for one query, each of shape (1, k), from `version` (default: the active one). """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((normalize_query(query), k, version or _active_version, scope, future))
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            # Encode each distinct uncached query once, in a single model call
+            embeddings = {}
+            to_encode = []
+            for key, _, _, _, _ in batch:
+                if key in embeddings or key in to_encode:
+                    continue
+                cached = embedding_cache.get(key)
+                if cached is not None:
+                    embeddings[key] = cached
+                else:
+                    to_encode.append(key)
+            if to_encode:
+                start = time.perf_counter()
+                encoded = embedding_model.encode(to_encode)
+                observe_stage("embedding_encode", time.perf_counter() - start)
+                for key, row in zip(to_encode, encoded):
+                    vector = np.ascontiguousarray(row.reshape(1, -1), dtype=np.float32)
+                    vector.setflags(write=False)
+                    embedding_cache.put(key, vector)
+                    embeddings[key] = vector
+
+            # One batched search per index version and scope (most batches have a single one)
+            by_scope = {}
+            for item in batch:
+                by_scope.setdefault((item[2], item[3]), []).append(item)
+            for (version, scope), items in by_scope.items():
+                query_matrix = np.vstack([embeddings[key] for key, _, _, _, _ in items])
+                max_k = max(k for _, k, _, _, _ in items)
+                start = time.perf_counter()
+                distances, indices = scope.search(query_matrix, max_k) if scope is not None else version.index.search(query_matrix, max_k)
+                observe_stage("faiss_search", time.perf_counter() - start)
+                for row, (_, k, _, _, future) in enumerate(items):
+                    future.set_result((distances[row:row + 1, :k], indices[row:row + 1, :k]))
+
+            self.batches += 1
+            self.batched_queries += len(batch)
+        except Exception as e:
+            for _, _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "batched_queries": self.batched_queries,
+            "avg_batch_size": self.batched_queries / self.batches if self.batches else 0.0,
+        }
+
+
+query_batcher = QueryBatcher() if BATCH_WINDOW_MS > 0 else None
+
+
+def _search_index(query: str, k: int, scope=None, version=None):
+    """ Returns (distances, indices) for one query, through the batcher when it is enabled. """
+    version = version or _active_version
+    if query_batcher is not None:
+        return query_batcher.search(query, k, scope, version)
+    query_embedding = encode_query(query)
+    start = time.perf_counter()
+    result = scope.search(query_embedding, k) if scope is not None else version.index.search(query_embedding, k)
+    observe_stage("faiss_search", time.perf_counter() - start)
+    return result
+
+
+# --- Coach-Scoped Search ---
+class SearchScope:
+    """
+    The documents one coach may retrieve (the union of its tags), searchable on
+    their own. Returned indices are document ids in the main index either way.
+    """
+
+    def __init__(self, index, tags, ids, mode):
+        import faiss
+
+        self.index = index
+        self.tags = tags
+        self.ids = ids
+        self.sub_index = None
+        self.params = None
+        if mode == "partition":
+            try:
+                vectors = index.reconstruct_batch(ids)
+            except RuntimeError as e:
+                logging.warning(f"Index cannot reconstruct vectors ({e}); filtering with an IDSelector instead.")
+                mode = "selector"
+        self.mode = mode
+        if mode == "partition":
+            # Exact copy of the scope's vectors: a flat scan over len(ids) instead of ntotal
+            self.sub_index = faiss.IndexFlat(index.d, index.metric_type)
+            self.sub_index.add(vectors)
+        else:
+            self.selector = faiss.IDSelectorBatch(ids) # Keeps its own copy of the ids
+            try:
+                ivf_index = faiss.extract_index_ivf(index)
+            except RuntimeError:
+                ivf_index = None
+            if ivf_index is not None:
+                self.params = faiss.SearchParametersIVF(sel=self.selector, nprobe=ivf_index.nprobe)
+            elif hasattr(faiss.downcast_index(index), "hnsw"):
+                self.params = faiss.SearchParametersHNSW(sel=self.selector, efSearch=faiss.downcast_index(index).hnsw.efSearch)
+            else:
+                self.params = faiss.SearchParameters(sel=self.selector)
+
+    def search(self, query_matrix, k):
+        if self.sub_index is not None:
+            distances, positions = self.sub_index.search(query_matrix, k)
+            indices = np.where(positions >= 0, self.ids[np.maximum(positions, 0)], -1)
+            return distances, indices
+        return self.index.search(query_matrix, k, params=self.params)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _scope_mode(index):
+    if SCOPE_MODE in ("partition", "selector", "off"):
+        mode = SCOPE_MODE
+    else:
+        import faiss
+        mode = "partition" if isinstance(faiss.downcast_index(index), faiss.IndexFlat) else "selector"
+    return mode
+
+
+# --- Index Versions ---
+class IndexVersionError(Exception):
+    """ An index version could not be loaded or failed validation. """
+
+
+class IndexVersion:
+    """
+    One generation of the knowledge base: the FAISS index, its documents and tags, and
+    the coach scopes built over them. Never modified once active; appends and reloads
+    build a new version, and a search keeps the version it started with.
+    """
+
+    def __init__(self, index, metadata, doc_tags=None, name="base", path=None):
+        self.index = index
+        self.metadata = metadata
+        self.doc_tags = doc_tags
+        self.name = name
+        self.path = path
+        self.generation = 0 # Set by activate_index(); part of the result cache key
+        self.loaded_at = time.time()
+        self.scopes = {}  # normalized tag tuple -> SearchScope, or None when the scope is the whole index
+        self._scopes_lock = threading.Lock()
+
+    def get_scope(self, tags):
+        """ See get_search_scope(). """
+        if not tags or self.doc_tags is None:
+            return None
+        key = tuple(sorted({normalize_tag(tag) for tag in tags} - {""}))
+        if key in self.scopes:
+            return self.scopes[key]
+        with self._scopes_lock:
+            if key in self.scopes:
+                return self.scopes[key]
+            index, tag_index = self.index, self.doc_tags
+            mode = _scope_mode(index)
+            scope = None
+            parts = [tag_index[tag] for tag in key if tag in tag_index]
+            if mode != "off" and not parts:
+                logging.warning(f"No documents are tagged {list(key)}; searching the whole index for this coach.")
+            elif mode != "off":
+                if SCOPE_INCLUDE_UNTAGGED and UNTAGGED in tag_index:
+                    parts.append(tag_index[UNTAGGED])
+                ids = np.unique(np.concatenate(parts)).astype(np.int64)
+                ids = ids[(ids >= 0) & (ids < index.ntotal)]
+                if 0 < len(ids) < index.ntotal:
+                    start = time.perf_counter()
+                    scope = SearchScope(index, key, ids, mode)
+                    logging.info(f"Built {scope.mode} search scope {list(key)}: {len(ids)} of {index.ntotal} documents "
+                                 f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+            self.scopes[key] = scope
+            return scope
+
+    def info(self) -> dict:
+        return {"name": self.name, "generation": self.generation, "documents": self.index.ntotal,
+                "loaded_at": round(self.loaded_at, 3), "path": self.path}
+
+
+def get_search_scope(tags, version=None):
+    """
+    Returns the SearchScope for a coach's "rag_tags" in `version` (default: the active
+    one), building it on first use, or None to search the whole index (no tags, no tag
+    file, scoping off, or tags that match nothing or everything).
+    """
+    version = version or _active_version
+    if version is None:
+        return None
+    return version.get_scope(tags)
+
+
+def get_scope_stats() -> dict:
+    """ Size of each scope built so far in the active version (0 = searches the whole index). """
+    version = _active_version
+    if version is None:
+        return {}
+    return {",".join(key): len(scope) if scope is not None else 0 for key, scope in list(version.scopes.items())}
+
+# --- Re-ranking ---
+_rerank_stats = {"candidates": 0, "below_cutoff": 0, "duplicates": 0, "returned": 0}
+_rerank_lock = threading.Lock() # Searches run on many request threads at once
+
+
+def _count_rerank(**counts):
+    with _rerank_lock:
+        for name, value in counts.items():
+            _rerank_stats[name] += value
+
+
+def similarities_from_distances(distances, index=None):
+    """
+    Cosine similarity of each hit. MiniLM embeddings are unit length, so an L2
+    index's squared distance d maps to 1 - d/2; inner-product indexes return it directly.
+    """
+    import faiss
+
+    index = faiss_index if index is None else index
+    distances = np.asarray(distances, dtype=np.float32)
+    if index is not None and index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    return 1.0 - distances / 2.0
+
+
+def _candidate_vectors(ids, index=None):
+    """ Unit-length index vectors for the candidate ids, or None if the index can't reconstruct them. """
+    index = faiss_index if index is None else index
+    try:
+        vectors = np.asarray(index.reconstruct_batch(np.asarray(ids, dtype=np.int64)), dtype=np.float32)
+    except RuntimeError as e:
+        logging.debug(f"Cannot reconstruct candidate vectors ({e}); skipping MMR and duplicate collapsing.")
+        return None
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def mmr_order(similarities, vectors, mmr_lambda=MMR_LAMBDA, dedup_similarity=DEDUP_SIMILARITY):
+    """
+    Orders candidates by Maximal Marginal Relevance: each pick maximizes
+    lambda * relevance - (1 - lambda) * (max similarity to the picks so far).
+    Candidates at least `dedup_similarity` close to an earlier pick are dropped.
+
+    Returns:
+        tuple: (positions in pick order, number of duplicates dropped)
+    """
+    remaining = list(range(len(similarities)))
+    if vectors is None:
+        return remaining, 0
+    pair_similarity = vectors @ vectors.T
+    redundancy = np.full(len(similarities), -np.inf, dtype=np.float32)
+    order, duplicates = [], 0
+    while remaining:
+        scores = [mmr_lambda * similarities[i] - (1 - mmr_lambda) * max(redundancy[i], 0.0) for i in remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        if redundancy[best] >= dedup_similarity:
+            duplicates += 1
+            continue
+        order.append(best)
+        redundancy = np.maximum(redundancy, pair_similarity[best])
+    return order, duplicates
+
+
+def rerank_hits(distances, indices, k, index=None):
+    """
+    Turns raw FAISS hits (one query row) from `index` (default: the active one) into the
+    best k (document id, similarity) pairs: cutoff, duplicate collapsing, then MMR.
+    Texts are not read here.
+    """
+    ids = indices[0]
+    valid = ids >= 0
+    ids = ids[valid]
+    similarities = similarities_from_distances(distances[0][valid], index)
+    relevant = similarities >= MIN_SIMILARITY
+    _count_rerank(candidates=len(ids), below_cutoff=int(len(ids) - relevant.sum()))
+    ids, similarities = ids[relevant], similarities[relevant]
+    if len(ids) == 0:
+        return []
+    order, duplicates = mmr_order(similarities, _candidate_vectors(ids, index) if len(ids) > 1 else None)
+    if duplicates:
+        _count_rerank(duplicates=duplicates)
+    return [(int(ids[i]), float(similarities[i])) for i in order]
+
+
+def get_rerank_stats() -> dict:
+    """ Candidates fetched, dropped by the similarity cutoff or as duplicates, and documents returned. """
+    with _rerank_lock:
+        return dict(_rerank_stats)
+
+
+# --- Index Tuning ---
+def apply_search_params(index, nprobe=NPROBE, ef_search=EF_SEARCH):
+    """
+    Applies nprobe (IVF) or efSearch (HNSW) to a loaded index. Flat indexes are exact and
+    have nothing to tune.
+
+    Returns:
+        dict: The parameters that were applied.
+    """
+    import faiss
+
+    applied = {}
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf_index = None
+    if ivf_index is not None:
+        ivf_index.nprobe = min(nprobe, ivf_index.nlist)
+        applied["nprobe"] = ivf_index.nprobe
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, "hnsw"):
+        hnsw_index.hnsw.efSearch = ef_search
+        applied["efSearch"] = ef_search
+    return applied
+
 
 # --- Initialization Function ---
 def load_rag_components():
     """
-    Loads the Sentence Transformer embedding model, FAISS index, and
-    associated metadata (from pickle file) into memory.
+    Loads the Sentence Transformer embedding model and the active index version: FAISS
+    index, metadata (memory-mapped document store, or legacy pickle file) and tags.
 
     Returns:
         bool: True if all components loaded successfully, False otherwise.
     """
-    global embedding_model, faiss_index, metadata
+    global embedding_model
     start_time = time.time()
     logging.info("Attempting to load RAG components...")
 
@@ -35,80 +562,478 @@ def load_rag_components():
         logging.info("RAG components appear to be already loaded.")
         return True
 
-    # 1. Load Embedding Model
+    # 1. Load Embedding Model (backend chosen with RAG_ENCODER, see encoders.py)
     try:
-        logging.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        logging.info(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded successfully.")
+        logging.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME} (encoder backend '{ENCODER_BACKEND}')...")
+        step_start = time.time()
+        try:
+            embedding_model = load_encoder(ENCODER_BACKEND, EMBEDDING_MODEL_NAME)
+        except EncoderError as e:
+            if ENCODER_BACKEND == "torch":
+                raise
+            # All backends produce interchangeable embeddings, so the reference one is a safe fallback
+            logging.error(f"Could not load encoder backend '{ENCODER_BACKEND}': {e} Falling back to 'torch'.")
+            embedding_model = load_encoder("torch", EMBEDDING_MODEL_NAME)
+        _load_status["timings"]["embedding_model_s"] = round(time.time() - step_start, 3)
+        logging.info(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded successfully (backend '{embedding_model.backend}').")
     except Exception as e:
         logging.error(f"CRITICAL: Failed to load embedding model '{EMBEDDING_MODEL_NAME}'. RAG will be disabled. Error: {e}", exc_info=True)
         embedding_model = None
         return False
 
-    # 2. Load FAISS Index
-    if not os.path.exists(FAISS_INDEX_PATH):
-        logging.error(f"CRITICAL: FAISS index file not found at: {FAISS_INDEX_PATH}. RAG will be disabled.")
+    # 2-4. FAISS index, metadata and tags of the published version (or the base files)
+    name, directory = resolve_index_version()
+    try:
+        version = load_index_version(directory, name, timings=_load_status["timings"])
+    except IndexVersionError as e:
+        logging.error(f"CRITICAL: {e} RAG will be disabled.")
         return False
+    activate_index(version)
+
+    end_time = time.time()
+    logging.info(f"All RAG components loaded successfully in {end_time - start_time:.2f} seconds.")
+    return True
+
+
+def load_index_version(directory=FAISS_INDEX_DIR, name="base", timings=None):
+    """
+    Loads the FAISS index, metadata and optional tag file in `directory` into an
+    IndexVersion, without activating it.
+
+    Args:
+        timings (dict): Receives the seconds spent on each file.
+
+    Raises:
+        IndexVersionError: A required file is missing or can't be read.
+    """
+    timings = {} if timings is None else timings
+    index_path = os.path.join(directory, os.path.basename(FAISS_INDEX_PATH))
+    docs_path = os.path.join(directory, os.path.basename(DOCS_PATH))
+    pkl_path = os.path.join(directory, os.path.basename(PKL_PATH))
+    tags_path = os.path.join(directory, os.path.basename(TAGS_PATH))
+
+    # 2. Load FAISS Index
+    if not os.path.exists(index_path):
+        raise IndexVersionError(f"FAISS index file not found at: {index_path}.")
     try:
-        logging.info(f"Loading FAISS index from: {FAISS_INDEX_PATH}...")
-        faiss_index = faiss.read_index(FAISS_INDEX_PATH)
-        logging.info(f"FAISS index loaded successfully. Index contains {faiss_index.ntotal} vectors.")
+        logging.info(f"Loading FAISS index from: {index_path}...")
+        step_start = time.time()
+        import faiss
+        if FAISS_MMAP:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        else:
+            index = faiss.read_index(index_path)
+        logging.info(f"FAISS index loaded successfully. Index contains {index.ntotal} vectors.")
+        search_params = apply_search_params(index)
+        if search_params:
+            logging.info(f"Applied FAISS search parameters: {search_params}")
+        try:
+            # IVF indexes need an id -> list map to reconstruct the candidate vectors for MMR
+            faiss.extract_index_ivf(index).make_direct_map()
+        except RuntimeError:
+            pass # Not an IVF index; flat and HNSW reconstruct directly
+        timings["faiss_index_s"] = round(time.time() - step_start, 3)
     except Exception as e:
-        logging.error(f"CRITICAL: Failed to load FAISS index from '{FAISS_INDEX_PATH}'. RAG will be disabled. Error: {e}", exc_info=True)
-        faiss_index = None
-        return False
+        logging.error(f"Failed to load FAISS index from '{index_path}': {e}", exc_info=True)
+        raise IndexVersionError(f"Failed to load FAISS index from '{index_path}'.") from e
 
-    # 3. Load Metadata (Pickle file)
-    if not os.path.exists(PKL_PATH):
-        logging.error(f"CRITICAL: Metadata pickle file not found at: {PKL_PATH}. RAG will be disabled.")
-        return False
+    # 3. Load Metadata (memory-mapped document store, or legacy pickle file)
+    metadata_path = docs_path if os.path.exists(docs_path) else pkl_path
+    if not os.path.exists(metadata_path):
+        raise IndexVersionError(f"Metadata not found at: {docs_path} or {pkl_path}.")
     try:
-        logging.info(f"Loading metadata from: {PKL_PATH}...")
-        with open(PKL_PATH, 'rb') as f:
-            metadata = pickle.load(f)
-
-        # --- Validation updated to accept list or tuple ---
-        if not isinstance(metadata, (list, tuple)): # Check for list OR tuple
-             logging.error(f"CRITICAL: Metadata loaded from '{PKL_PATH}' is not a list or tuple (type: {type(metadata)}). Expected sequence mapping index to document. RAG may fail.")
-             # You might still consider returning False if structure is completely wrong
+        logging.info(f"Loading metadata from: {metadata_path}...")
+        step_start = time.time()
+        if metadata_path == docs_path:
+            documents = DocumentStore(docs_path)
         else:
-             logging.info(f"Metadata loaded successfully. Found {len(metadata)} items (type: {type(metadata)}).")
-             if len(metadata) != faiss_index.ntotal:
-                 logging.warning(f"Metadata length ({len(metadata)}) does not match FAISS index size ({faiss_index.ntotal}). Check index/metadata consistency.")
-        # --- End Validation ---
-
-    except (pickle.UnpicklingError, EOFError, FileNotFoundError, Exception) as e:
-        logging.error(f"CRITICAL: Failed to load or parse metadata from '{PKL_PATH}'. RAG will be disabled. Error: {e}", exc_info=True)
-        metadata = None
+            logging.warning(f"Loading legacy pickle metadata into memory. Convert it once with: python doc_store.py {pkl_path} {docs_path}")
+            with open(pkl_path, 'rb') as f:
+                documents = pickle.load(f)
+        timings["metadata_s"] = round(time.time() - step_start, 3)
+    except (pickle.UnpicklingError, EOFError, DocumentStoreError, Exception) as e:
+        logging.error(f"Failed to load or parse metadata from '{metadata_path}': {e}", exc_info=True)
+        raise IndexVersionError(f"Failed to load or parse metadata from '{metadata_path}'.") from e
+    if not isinstance(documents, METADATA_TYPES):
+        raise IndexVersionError(f"Metadata loaded from '{metadata_path}' is not a document store, list or tuple (type: {type(documents)}).")
+    logging.info(f"Metadata loaded successfully. Found {len(documents)} items (type: {type(documents)}).")
+    if len(documents) != index.ntotal:
+        logging.warning(f"Metadata length ({len(documents)}) does not match FAISS index size ({index.ntotal}). Check index/metadata consistency.")
+
+    # 4. Load Document Tags (optional; without them every coach searches the whole index)
+    tag_index = None
+    if os.path.exists(tags_path):
+        try:
+            tag_index = load_tag_index(tags_path)
+            logging.info(f"Loaded document tags for coach-scoped search: {len(tag_index)} tags (scope mode '{SCOPE_MODE}').")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load document tags from '{tags_path}': {e}. Coach-scoped search disabled.")
+
+    return IndexVersion(index, documents, tag_index, name=name, path=directory)
+
+
+# --- Hot Swapping ---
+# Searches read _active_version once, so replacing it is a single reference assignment:
+# new searches get the new version, running ones finish on the old one, and the old
+# index and document store are freed when the last of them lets go.
+_generations = itertools.count(1)
+_index_status = {"swaps": 0, "failed_swaps": 0, "previous": None, "swapping": None,
+                 "failed_version": None, "last_error": None}
+_swap_lock = threading.Lock()
+_last_index_check = 0.0
+
+
+def activate_index(version):
+    """
+    Makes `version` the index new searches use.
+
+    Returns:
+        IndexVersion | None: The version it replaced.
+    """
+    global _active_version, faiss_index, metadata, doc_tags
+    version.generation = next(_generations)
+    previous = _active_version
+    _active_version = version
+    faiss_index, metadata, doc_tags = version.index, version.metadata, version.doc_tags
+    result_cache.clear() # Keys include the generation; this just frees the old entries
+    if previous is not None:
+        _index_status["swaps"] += 1
+        _index_status["previous"] = previous.name
+        logging.info(f"Activated index version '{version.name}' ({version.index.ntotal} documents), replacing '{previous.name}'.")
+    return previous
+
+
+def validate_index_version(version):
+    """ Runs faisscheck's consistency checks on a loaded version. Raises IndexVersionError if one fails. """
+    import faisscheck
+
+    # Without the model (e.g. from the CLI) the dimension can't be checked, but the sample lookup still runs
+    model_dim = embedding_model.get_sentence_embedding_dimension() if embedding_model is not None else version.index.d
+    if not faisscheck.validate_components(version.index, version.metadata, version.doc_tags, model_dim):
+        raise IndexVersionError(f"Index version '{version.name}' failed validation; see the faisscheck errors above.")
+
+
+def swap_index(name, directory=None, background=False) -> bool:
+    """
+    Loads index version `name` (from faiss_index/versions/<name>/ unless `directory` is
+    given), validates it and activates it while searches keep running. If loading or
+    validation fails, the current version stays active.
+
+    Args:
+        background (bool): Swap on a daemon thread and return immediately.
+
+    Returns:
+        bool: True if the version is now active (always False when background=True).
+    """
+    directory = directory or os.path.join(INDEX_VERSIONS_DIR, name)
+    if background:
+        threading.Thread(target=swap_index, args=(name, directory), name="rag-index-swap", daemon=True).start()
         return False
+    with _swap_lock:
+        current = _active_version
+        if current is not None and current.name == name and current.path == directory:
+            return True # Another check got here first
+        _index_status["swapping"] = name
+        start = time.perf_counter()
+        try:
+            version = load_index_version(directory, name)
+            validate_index_version(version)
+        except IndexVersionError as e:
+            _index_status["failed_swaps"] += 1
+            _index_status["failed_version"] = name
+            _index_status["last_error"] = str(e)
+            logging.error(f"Index swap to '{name}' failed; keeping version '{current.name if current else None}'. {e}")
+            return False
+        finally:
+            _index_status["swapping"] = None
+        activate_index(version)
+        _index_status["failed_version"] = _index_status["last_error"] = None
+        logging.info(f"Index swap to '{name}' took {time.perf_counter() - start:.2f}s.")
+        return True
+
+
+def read_current_version():
+    """ The version name in faiss_index/CURRENT, or None if there is none. """
+    try:
+        with open(CURRENT_VERSION_PATH, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logging.warning(f"Could not read {CURRENT_VERSION_PATH}: {e}")
+        return None
+    if name and os.path.basename(name) != name:
+        logging.error(f"{CURRENT_VERSION_PATH} must hold a version name under {INDEX_VERSIONS_DIR}, not '{name}'. Ignoring it.")
+        return None
+    return name or None
+
+
+def resolve_index_version():
+    """ (name, directory) of the version to load at startup: the one in CURRENT, else the base files. """
+    name = read_current_version()
+    if name:
+        directory = os.path.join(INDEX_VERSIONS_DIR, name)
+        if os.path.isdir(directory):
+            return name, directory
+        logging.error(f"Index version '{name}' named in {CURRENT_VERSION_PATH} does not exist; using the base index.")
+    return "base", FAISS_INDEX_DIR
+
+
+def publish_index_version(name):
+    """ Points faiss_index/CURRENT at version `name`; each worker swaps to it within RAG_INDEX_CHECK_INTERVAL. """
+    if not os.path.isdir(os.path.join(INDEX_VERSIONS_DIR, name)):
+        raise IndexVersionError(f"Index version '{name}' does not exist in {INDEX_VERSIONS_DIR}.")
+    tmp_path = f"{CURRENT_VERSION_PATH}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+    os.replace(tmp_path, CURRENT_VERSION_PATH)
+    logging.info(f"Published index version '{name}'.")
+
+
+def check_for_new_index():
+    """
+    Starts a background swap if faiss_index/CURRENT names a version other than the
+    active one. Called on the search path; reads the file at most every
+    RAG_INDEX_CHECK_INTERVAL seconds and never waits for the swap.
+    """
+    global _last_index_check
+    now = time.monotonic()
+    if INDEX_CHECK_INTERVAL <= 0 or now - _last_index_check < INDEX_CHECK_INTERVAL:
+        return
+    _last_index_check = now
+    name = read_current_version()
+    current = _active_version
+    if not name or current is None or name == current.name or name == _index_status["failed_version"] or _swap_lock.locked():
+        return
+    logging.info(f"Index version '{name}' was published (active: '{current.name}'); swapping in the background.")
+    swap_index(name, background=True)
+
+
+def get_index_status() -> dict:
+    """ Active and published index versions, swap counters and the last swap error. """
+    status = dict(_index_status)
+    version = _active_version
+    status["active"] = version.info() if version is not None else None
+    status["published"] = read_current_version()
+    return status
+
+
+# --- Incremental Appends ---
+def _add_with_ids(index, vectors, ids):
+    """
+    Adds vectors under `ids`. IVF indexes take the ids directly (with a hashtable direct
+    map, so MMR can still reconstruct them); flat and HNSW indexes only number
+    sequentially, which yields the same ids since they continue after ntotal.
+    """
+    import faiss
+
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf_index = None
+    if ivf_index is not None:
+        ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.add_with_ids(vectors, ids)
+    else:
+        index.add(vectors)
+
+
+def _tags_per_document(tag_index, count):
+    doc_tag_lists = [[] for _ in range(count)]
+    for tag, ids in (tag_index or {}).items():
+        if tag != UNTAGGED:
+            for doc_id in ids.tolist():
+                doc_tag_lists[doc_id].append(tag)
+    return doc_tag_lists
+
+
+def append_documents(texts, tags=None, embeddings=None, name=None, publish=True):
+    """
+    Adds documents to the active index without a rebuild. The index is copied, the new
+    vectors get the ids after the existing ones, and the result is written to
+    faiss_index/versions/<name>/ and swapped in; searches running meanwhile finish on
+    the old version.
+
+    Args:
+        texts (list[str]): The new documents, already chunked.
+        tags (list[Iterable[str]]): Tags per new document, for coach-scoped search.
+        embeddings (np.ndarray): Their (n, d) embeddings. Encoded with the loaded model if omitted.
+        name (str): Name of the new version. Defaults to a timestamp.
+        publish (bool): Also point faiss_index/CURRENT at it, so the other workers follow.
+
+    Returns:
+        IndexVersion: The new active version.
+    """
+    import faiss
+
+    base = _active_version
+    if base is None:
+        raise IndexVersionError("No index version is loaded; nothing to append to.")
+    texts = list(texts)
+    if tags is not None and len(tags) != len(texts):
+        raise IndexVersionError(f"Got {len(tags)} tag lists for {len(texts)} documents.")
+    if embeddings is None:
+        if embedding_model is None:
+            raise IndexVersionError("The embedding model is not loaded; pass the embeddings.")
+        embeddings = embedding_model.encode(texts)
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if vectors.shape != (len(texts), base.index.d):
+        raise IndexVersionError(f"Expected embeddings of shape {(len(texts), base.index.d)}, got {vectors.shape}.")
+    name = name or time.strftime("%Y%m%d-%H%M%S")
+    directory = os.path.join(INDEX_VERSIONS_DIR, name)
+    if os.path.exists(directory):
+        raise IndexVersionError(f"Index version '{name}' already exists.")
+
+    start = time.perf_counter()
+    # A private in-memory copy; the active version is never modified. A memory-mapped
+    # index only serializes a reference to its file, so that one is read from disk.
+    if base.path is not None and os.path.exists(os.path.join(base.path, os.path.basename(FAISS_INDEX_PATH))):
+        index = faiss.read_index(os.path.join(base.path, os.path.basename(FAISS_INDEX_PATH)))
+    else:
+        index = faiss.deserialize_index(faiss.serialize_index(base.index))
+    _add_with_ids(index, vectors, np.arange(index.ntotal, index.ntotal + len(texts), dtype=np.int64))
+
+    doc_tag_lists = None
+    if base.doc_tags is not None or (tags is not None and any(tags)):
+        doc_tag_lists = _tags_per_document(base.doc_tags, base.index.ntotal)
+        doc_tag_lists += [list(doc_tags or ()) for doc_tags in (tags or [()] * len(texts))]
+
+    # Written next to the target and renamed into place, so a watcher never sees a partial version
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp_directory)
+    try:
+        faiss.write_index(index, os.path.join(tmp_directory, os.path.basename(FAISS_INDEX_PATH)))
+        write_document_store(os.path.join(tmp_directory, os.path.basename(DOCS_PATH)), itertools.chain(base.metadata, texts))
+        if doc_tag_lists is not None:
+            write_tag_index(os.path.join(tmp_directory, os.path.basename(TAGS_PATH)), doc_tag_lists)
+        os.rename(tmp_directory, directory)
+    except Exception:
+        # Don't leave a half-written directory behind to block the next append (makedirs would fail)
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    logging.info(f"Wrote index version '{name}': {base.index.ntotal} + {len(texts)} documents in {time.perf_counter() - start:.2f}s.")
+
+    if not swap_index(name, directory):
+        raise IndexVersionError(f"Index version '{name}' was written but could not be activated: {_index_status['last_error']}")
+    if publish:
+        publish_index_version(name)
+    return _active_version
+
+# --- Background Loading ---
+# State for the readiness endpoint: not_started -> loading -> loaded | failed
+_load_status = {"state": "not_started", "started_at": None, "finished_at": None, "duration_s": None, "timings": {}}
+_load_lock = threading.Lock()
+
+
+def _run_load():
+    started = time.time()
+    ok = False
+    try:
+        ok = load_rag_components()
+    except Exception as e:
+        logging.error(f"Unexpected error while loading RAG components: {e}", exc_info=True)
+    finished = time.time()
+    _load_status.update(state="loaded" if ok else "failed", finished_at=finished, duration_s=round(finished - started, 3))
+    return ok
+
+
+def initialize_rag(background=False) -> bool:
+    """
+    Loads the RAG components once per process, recording state and timings for get_load_status().
+
+    Args:
+        background (bool): Load on a daemon thread and return immediately. search_documents()
+                           returns [] (and are_rag_components_loaded() is False) until it finishes.
+
+    Returns:
+        bool: True if the components are loaded (always False when background=True and
+              loading has only just started).
+    """
+    with _load_lock:
+        if _load_status["state"] in ("loading", "loaded"):
+            return _load_status["state"] == "loaded"
+        _load_status.update(state="loading", started_at=time.time(), finished_at=None, duration_s=None, timings={})
+        if background:
+            threading.Thread(target=_run_load, name="rag-loader", daemon=True).start()
+            logging.info("RAG components are loading on a background thread.")
+            return False
+    return _run_load()
+
+
+def start_background_load():
+    """ Starts loading the RAG components on a background thread (no-op if already started). """
+    initialize_rag(background=True)
+
+
+def _restart_load_after_fork():
+    # A loader thread running in the parent does not exist in the child; start our own.
+    # A swap running in the parent doesn't either; the next check_for_new_index() redoes it.
+    # Any lock held by a parent thread at fork time stays held forever in the child, so every
+    # lock a search can take is replaced.
+    global _load_lock, _swap_lock, _rerank_lock
+    _load_lock = threading.Lock()
+    _swap_lock = threading.Lock()
+    _rerank_lock = threading.Lock()
+    embedding_cache._reset_after_fork()
+    result_cache._reset_after_fork()
+    if query_batcher is not None:
+        query_batcher._reset_after_fork()
+    if _active_version is not None:
+        _active_version._scopes_lock = threading.Lock()
+    if _load_status["state"] == "loading":
+        _load_status["state"] = "not_started"
+        start_background_load()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_load_after_fork)
+
+
+def get_load_status() -> dict:
+    """ Loading state ('not_started', 'loading', 'loaded', 'failed') with start time and per-step timings. """
+    status = dict(_load_status)
+    status["timings"] = dict(_load_status["timings"])
+    if status["state"] == "loading" and status["started_at"]:
+        status["elapsed_s"] = round(time.time() - status["started_at"], 3)
+    return status
 
-    end_time = time.time()
-    logging.info(f"All RAG components loaded successfully in {end_time - start_time:.2f} seconds.")
-    # Return True even if metadata type caused an error log above, allows app to run without RAG
-    # If metadata structure is critical, consider returning False on the type error inside the try block.
-    return True # Indicate components *attempted* loading
 
 # --- Search Function ---
-def search_documents(query: str, k: int = 3) -> list[str]:
+def search_documents(query: str, k: int = 3, tags=None) -> list[str]:
     """
     Embeds the query and performs similarity search against the FAISS index.
 
     Args:
         query (str): The user query text.
         k (int): The maximum number of documents to retrieve. Defaults to 3.
+        tags (Iterable[str]): The coach's "rag_tags". Restricts the search to documents
+                              with one of these tags (plus untagged ones); see get_search_scope().
 
     Returns:
         list[str]: A list containing the text content of the retrieved documents.
                    Returns an empty list if RAG components are not loaded,
                    if the query is invalid, or if an error occurs during search.
     """
+    return [text for text, _ in search_documents_scored(query, k, tags)]
+
+
+def search_documents_scored(query: str, k: int = 3, tags=None) -> list[tuple[str, float]]:
+    """
+    Like search_documents(), with each document's cosine similarity to the query.
+    Fetches RAG_CANDIDATES hits, drops those below RAG_MIN_SIMILARITY, collapses
+    near-duplicates and picks the best k by MMR, so fewer than k (or no) documents
+    come back when little in the index is relevant.
+
+    Returns:
+        list[tuple[str, float]]: (document text, similarity), in MMR order.
+    """
     if not are_rag_components_loaded():
         logging.warning("Search called but RAG components are not loaded. Returning empty list.")
         return []
-    # Also specifically check if metadata loaded correctly, even if other components did
-    if metadata is None:
-         logging.error("Search called but metadata object is None. Cannot retrieve documents.")
-         return []
+    check_for_new_index()
+    # The whole search uses this version, even if another one is activated meanwhile
+    version = _active_version
+    documents = version.metadata
 
     if not isinstance(query, str) or not query.strip():
         logging.warning("Search query is empty or invalid. Returning empty list.")
@@ -116,51 +1041,110 @@ def search_documents(query: str, k: int = 3) -> list[str]:
 
     logging.debug(f"Performing RAG search for query: '{query[:100]}...', k={k}")
 
+    scope = version.get_scope(tags)
+    cache_key = (version.generation, normalize_query(query), k, scope.tags if scope is not None else None)
+    cached_results = result_cache.get(cache_key)
+    if cached_results is not None:
+        logging.debug(f"RAG result cache hit for query: '{query[:50]}...'")
+        count_rag_search("hit" if cached_results else "miss")
+        return list(cached_results)
+
     try:
-        query_embedding = embedding_model.encode([query])
-        distances, indices = faiss_index.search(query_embedding, k)
-        retrieved_indices = indices[0]
+        distances, indices = _search_index(query, max(k, RERANK_CANDIDATES), scope, version)
 
         results = []
-        # --- Ensure metadata is the list OR tuple we expect ---
-        if isinstance(metadata, (list, tuple)): # <--- THE FIX IS HERE
-            for idx in retrieved_indices:
-                if idx != -1:
-                    if 0 <= idx < len(metadata):
-                        doc_content = metadata[idx]
-                        if isinstance(doc_content, str):
-                            results.append(doc_content)
-                        # Add handling for other expected types if needed (e.g., dicts)
-                        # elif isinstance(doc_content, dict) and 'content' in doc_content:
-                        #     results.append(doc_content['content'])
-                        else:
-                            logging.warning(f"Retrieved metadata item at index {idx} is not a string (type: {type(doc_content)}). Skipping.")
-                    else:
-                        logging.warning(f"Retrieved index {idx} is out of bounds for metadata (size {len(metadata)}). Skipping.")
-                else:
-                    logging.debug("FAISS search returned -1 index; fewer than k results available.")
-        # --- Updated Error Message ---
-        else:
-             logging.error(f"Cannot retrieve documents: metadata is not a list or tuple (type: {type(metadata)}).")
-             return [] # Return empty list because we can't process metadata
+        seen_texts = set()
+        # Only the picked documents are read from the store
+        for idx, similarity in rerank_hits(distances, indices, k, version.index):
+            if len(results) == k:
+                break
+            if not 0 <= idx < len(documents):
+                logging.warning(f"Retrieved index {idx} is out of bounds for metadata (size {len(documents)}). Skipping.")
+                continue
+            doc_content = documents[idx]
+            if not isinstance(doc_content, str):
+                logging.warning(f"Retrieved metadata item at index {idx} is not a string (type: {type(doc_content)}). Skipping.")
+                continue
+            if doc_content in seen_texts: # The same chunk indexed twice
+                _count_rerank(duplicates=1)
+                continue
+            seen_texts.add(doc_content)
+            results.append((doc_content, similarity))
+        _count_rerank(returned=len(results))
 
-        logging.info(f"RAG search found {len(results)} documents for query: '{query[:50]}...'")
+        best = f", best similarity {results[0][1]:.3f}" if results else ""
+        logging.info(f"RAG search found {len(results)} relevant documents for query: '{query[:50]}...'{best}")
+        result_cache.put(cache_key, tuple(results))
+        count_rag_search("hit" if results else "miss")
         return results
 
     except Exception as e:
         logging.error(f"Error during RAG search for query '{query[:50]}...': {e}", exc_info=True)
+        count_rag_search("error")
         return []
 
 # --- Helper to check loading status ---
 def are_rag_components_loaded() -> bool:
-    """ Checks if the embedding model, FAISS index, and metadata are loaded. """
+    """ Checks if the embedding model and an index version (FAISS index + metadata) are loaded. """
     # Check if all are not None. Metadata check is crucial after loading attempt.
-    loaded = all([embedding_model is not None, faiss_index is not None, metadata is not None])
-    # Also check that metadata is the *correct type* (list or tuple) for retrieval to work
-    type_ok = isinstance(metadata, (list, tuple))
+    version = _active_version
+    loaded = all([embedding_model is not None, version is not None, version is not None and version.metadata is not None])
+    # Also check that metadata is the *correct type* (document store, list or tuple) for retrieval to work
+    type_ok = version is not None and isinstance(version.metadata, METADATA_TYPES)
     if not loaded:
         logging.debug("Checked RAG components: Not all components were loaded successfully (are None).")
     elif not type_ok:
-         logging.warning(f"Checked RAG components: Metadata loaded but has unexpected type ({type(metadata)}), retrieval might fail.")
+         logging.warning(f"Checked RAG components: Metadata loaded but has unexpected type ({type(version.metadata)}), retrieval might fail.")
+
+    return loaded and type_ok # RAG is only truly ready if loaded AND type is correct
+
+
+# --- Index Version CLI ---
+def main():
+    """
+    python rag_processor.py status
+    python rag_processor.py activate <version>            # validate and publish faiss_index/versions/<version>
+    python rag_processor.py append <source> [--name N]    # add documents to the active version, publish the result
+    """
+    import json
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Manage the versions of the FAISS index used by the app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Show the published version and the versions on disk.")
+    activate_parser = commands.add_parser("activate", help="Validate a version and point faiss_index/CURRENT at it.")
+    activate_parser.add_argument("version")
+    append_parser = commands.add_parser("append", help="Append documents to the published version without a rebuild.")
+    append_parser.add_argument("source", help="Directory of .txt/.md/.jsonl files, or a single .jsonl file (as for faissmaker.py).")
+    append_parser.add_argument("--name", default=None, help="Name of the new version (default: a timestamp).")
+    append_parser.add_argument("--no-publish", action="store_true", help="Write the version but leave CURRENT alone.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "status":
+            versions = sorted(entry for entry in os.listdir(INDEX_VERSIONS_DIR)
+                              if os.path.isdir(os.path.join(INDEX_VERSIONS_DIR, entry))) if os.path.isdir(INDEX_VERSIONS_DIR) else []
+            print(json.dumps({"published": read_current_version(), "versions": versions}, indent=2))
+        elif args.command == "activate":
+            version = load_index_version(os.path.join(INDEX_VERSIONS_DIR, args.version), args.version)
+            validate_index_version(version)
+            publish_index_version(args.version)
+        else:
+            from faissmaker import load_tagged_corpus
+            documents, tags = load_tagged_corpus(args.source)
+            if not documents:
+                logging.error("No documents found. Nothing to append.")
+                return 1
+            if not load_rag_components():
+                return 1
+            version = append_documents(documents, tags, name=args.name, publish=not args.no_publish)
+            print(json.dumps(version.info(), indent=2))
+    except IndexVersionError as e:
+        logging.error(str(e))
+        return 1
+    return 0
+
 
-    return loaded and type_ok # RAG is only truly ready if loaded AND type is correct
\ No newline at end of file
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,237 @@
+# response_cache.py
+#
+# Opt-in cache of coach answers for first-turn / FAQ-style questions. An entry
+# is keyed by the coach, the retrieved RAG context (hashed, so the answer is
+# only reused when the model would see the same documents) and the normalized
+# query. Queries that are worded differently still hit when their MiniLM
+# embeddings are within a cosine-similarity threshold. Entries live in an
+# in-process LRU with a TTL, backed by an optional SQLite file that survives
+# restarts and is shared by the workers on a host.
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+# --- Configuration ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# Cosine similarity above which a differently worded query reuses an answer; 0 disables semantic matching
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Only turns with at most this many past messages are cached (answers depend on history)
+RESPONSE_CACHE_MAX_HISTORY = int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", "0"))
+# SQLite file for the disk tier; empty keeps the cache in memory only
+RESPONSE_CACHE_DISK_PATH = os.getenv("RESPONSE_CACHE_DISK_PATH", "")
+
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s.!?]+$")
+
+
+def normalize_prompt(query: str) -> str:
+    """ Lowercases, collapses whitespace and drops trailing punctuation ('Hello!' == 'hello'). """
+    return _TRAILING_PUNCTUATION_RE.sub("", " ".join(query.lower().split()))
+
+
+def context_fingerprint(context_str: str) -> str:
+    """ Stable ID of the retrieved documents; unlike FAISS row IDs it survives index rebuilds. """
+    return hashlib.sha256(context_str.encode("utf-8")).hexdigest()[:16] if context_str else ""
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else None
+
+
+@dataclass
+class CachedResponse:
+    answer: str
+    query: str
+    embedding: object # unit-length np.ndarray (d,) or None
+    llm_seconds: float
+    expires_at: float # time.time() based, so it is meaningful on disk too
+
+
+class ResponseCache:
+    """
+    Two-tier answer cache. Exact matches are dict lookups; semantic matches
+    compare the query embedding with the entries sharing its (coach, context).
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl_seconds=RESPONSE_CACHE_TTL,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY, disk_path=RESPONSE_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.disk_path = disk_path or None
+        self._entries = OrderedDict() # (coach, context id, normalized query) -> CachedResponse
+        self._buckets = {}            # (coach, context id) -> set of entry keys, for semantic matching
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                       "evictions": 0, "latency_saved_s": 0.0}
+        if self.disk_path:
+            self._init_disk()
+
+    # --- Memory Tier ---
+    def _put_memory(self, key, entry):
+        if key not in self._entries:
+            self._buckets.setdefault(key[:2], set()).add(key)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        bucket = self._buckets.get(key[:2])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[key[:2]]
+
+    def _semantic_match(self, bucket_key, embedding, now):
+        best_key, best_score = None, self.similarity_threshold
+        for key in self._buckets.get(bucket_key, ()):
+            entry = self._entries[key]
+            if entry.embedding is None or entry.expires_at < now:
+                continue
+            score = float(np.dot(entry.embedding, embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+    # --- Disk Tier ---
+    def _connect(self):
+        if self._pid != os.getpid(): # No sqlite connection may cross a fork
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_disk(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " coach TEXT NOT NULL, context_id TEXT NOT NULL, query TEXT NOT NULL,"
+                " answer TEXT NOT NULL, embedding BLOB, llm_seconds REAL NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (coach, context_id, query))"
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            rows = conn.execute(
+                "SELECT coach, context_id, query, answer, embedding, llm_seconds, expires_at FROM responses"
+                " ORDER BY expires_at DESC LIMIT ?", (self.max_entries,)).fetchall()
+        # Newest last, so the LRU order matches
+        for coach, context_id, query, answer, embedding, llm_seconds, expires_at in reversed(rows):
+            vector = np.frombuffer(embedding, dtype=np.float32) if embedding else None
+            self._put_memory((coach, context_id, query), CachedResponse(answer, query, vector, llm_seconds, expires_at))
+        logging.info(f"Response cache: loaded {len(rows)} entries from '{self.disk_path}'.")
+
+    def _disk_get(self, key):
+        row = self._connect().execute(
+            "SELECT answer, embedding, llm_seconds, expires_at FROM responses WHERE coach = ? AND context_id = ? AND query = ?",
+            key).fetchone()
+        if row is None or row[3] < time.time():
+            return None
+        answer, embedding, llm_seconds, expires_at = row
+        return CachedResponse(answer, key[2], np.frombuffer(embedding, dtype=np.float32) if embedding else None, llm_seconds, expires_at)
+
+    def _disk_put(self, key, entry):
+        embedding = entry.embedding.astype(np.float32).tobytes() if entry.embedding is not None else None
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (*key, entry.answer, embedding, entry.llm_seconds, entry.expires_at))
+
+    # --- Public API ---
+    def lookup(self, coach_key, query, context_str, embedding=None):
+        """
+        Returns (answer, match) for a cached answer, or None. `match` is 'exact',
+        'disk' or the cosine similarity of a semantic match.
+        """
+        key = (coach_key, context_fingerprint(context_str), normalize_prompt(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at >= now:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                self._stats["latency_saved_s"] += entry.llm_seconds
+                return entry.answer, "exact"
+            if entry is not None:
+                self._remove(key)
+
+            vector = _unit_vector(embedding) if embedding is not None else None
+            if vector is not None and self.similarity_threshold > 0:
+                match_key, score = self._semantic_match(key[:2], vector, now)
+                if match_key is not None:
+                    entry = self._entries[match_key]
+                    self._entries.move_to_end(match_key)
+                    self._stats["semantic_hits"] += 1
+                    self._stats["latency_saved_s"] += entry.llm_seconds
+                    return entry.answer, score
+
+        if self.disk_path:
+            # Another worker may have answered it since we loaded the disk tier
+            try:
+                entry = self._disk_get(key)
+            except sqlite3.Error as e:
+                # A locked or busy database is a miss, not a failed chat turn
+                logging.warning(f"Response cache: could not read from '{self.disk_path}': {e}")
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self._put_memory(key, entry)
+                    self._stats["disk_hits"] += 1
+                    self._stats["latency_saved_s"] += entry.llm_seconds
+                return entry.answer, "disk"
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def store(self, coach_key, query, context_str, answer, llm_seconds, embedding=None):
+        """ Caches a freshly generated answer together with how long the LLM took to produce it. """
+        key = (coach_key, context_fingerprint(context_str), normalize_prompt(query))
+        vector = _unit_vector(embedding) if embedding is not None else None
+        entry = CachedResponse(answer, key[2], vector, llm_seconds, time.time() + self.ttl_seconds)
+        with self._lock:
+            self._put_memory(key, entry)
+            self._stats["stores"] += 1
+        if self.disk_path:
+            try:
+                self._disk_put(key, entry)
+            except sqlite3.Error as e:
+                logging.warning(f"Response cache: could not write to '{self.disk_path}': {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """ Hit rate, LLM calls saved and the LLM latency those hits avoided. """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["semantic_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["llm_calls_saved"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
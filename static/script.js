@@ -20,6 +20,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Load conversation history from localStorage
     let conversationHistory = JSON.parse(localStorage.getItem('conversationHistory')) || [];
     const maxHistoryLength = 5;
+    // The server keeps the model's copy of the history under this ID. The local history is
+    // still sent, so a server worker that has no copy of the conversation can rebuild it
+    let conversationId = localStorage.getItem('conversationId');
 
     // Function to add a message to the chat display
     function addMessage(sender, message) {
@@ -38,6 +41,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return messageText;
     }
 
     // Display conversation history on page load
@@ -68,14 +72,48 @@ document.addEventListener('DOMContentLoaded', function() {
             conversationHistory.shift();
         }
 
-        fetch('/', {
+        const payload = {
+            message: message,
+            coach_name: coachName,
+            history: conversationHistory
+        };
+        if (conversationId) payload.conversation_id = conversationId;
+
+        streamReply(payload, coachName)
+            .catch(error => {
+                if (error.fallback) {
+                    // Streaming unsupported or the stream endpoint refused the request
+                    console.warn('Streaming unavailable, falling back to JSON endpoint:', error.message);
+                    return fetchReply(payload, coachName);
+                }
+                throw error;
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                addMessage(coachName, 'An error occurred. Please try again.');
+            });
+    }
+
+    function saveBotReply(answer, newConversationId, switchCoach) {
+        // Add bot response to history with coach name
+        conversationHistory[conversationHistory.length - 1].bot = answer;
+        localStorage.setItem('conversationHistory', JSON.stringify(conversationHistory));
+        if (newConversationId) {
+            conversationId = newConversationId;
+            localStorage.setItem('conversationId', conversationId);
+        }
+        // "Switch me to ..." was answered by the server; follow it in the coach selector
+        if (switchCoach && Array.from(coachSelect.options).some(option => option.value === switchCoach)) {
+            coachSelect.value = switchCoach;
+        }
+    }
+
+    // Non-streaming request to the JSON endpoint
+    function fetchReply(payload, coachName) {
+        return fetch('/', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                message: message,
-                coach_name: coachName,
-                history: conversationHistory
-            })
+            body: JSON.stringify(payload)
         })
         .then(response => {
             if (!response.ok) throw new Error('Response not OK');
@@ -86,17 +124,75 @@ document.addEventListener('DOMContentLoaded', function() {
                 addMessage(coachName, `Error: ${data.error}`);
             } else {
                 addMessage(coachName, data.answer);
-                // Add bot response to history with coach name
-                conversationHistory[conversationHistory.length - 1].bot = data.answer;
-                localStorage.setItem('conversationHistory', JSON.stringify(conversationHistory));
+                saveBotReply(data.answer, data.conversation_id, data.switch_coach);
             }
-        })
-        .catch(error => {
-            console.error('Error:', error);
-            addMessage(coachName, 'An error occurred. Please try again.');
         });
     }
 
+    // Streaming request: renders Server-Sent Event tokens as they arrive
+    async function streamReply(payload, coachName) {
+        const fallback = message => Object.assign(new Error(message), { fallback: true });
+        if (!window.ReadableStream || !window.TextDecoder) throw fallback('ReadableStream not supported');
+
+        const response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            body: JSON.stringify(payload)
+        });
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !response.body || !contentType.startsWith('text/event-stream')) {
+            throw fallback(`Stream endpoint returned ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let messageText = null;
+        let buffer = '';
+        let finished = false; // Set by the terminal 'done' or 'error' event
+
+        const handleEvent = (eventName, data) => {
+            if (eventName === 'token') {
+                if (!messageText) messageText = addMessage(coachName, '');
+                messageText.textContent += data.text;
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (eventName === 'done') {
+                finished = true;
+                if (!messageText) messageText = addMessage(coachName, data.answer);
+                saveBotReply(data.answer, data.conversation_id, data.switch_coach);
+            } else if (eventName === 'error') {
+                finished = true;
+                addMessage(coachName, `Error: ${data.error}`);
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) handleEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+
+        // The connection closed without a terminal event (proxy timeout, worker restart)
+        if (!finished) {
+            if (!messageText) throw fallback('Stream ended before any reply');
+            throw new Error('Stream ended before the reply was complete');
+        }
+    }
+
     // Event listeners
     sendButton.addEventListener('click', function() {
         console.log('Send button clicked');
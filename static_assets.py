@@ -0,0 +1,281 @@
+# static_assets.py
+#
+# Build step and serving layer for the files in static/. The build writes a
+# content-addressed copy of every asset to static/dist/ (style.<hash>.css,
+# images/aiyoda.<hash>.jpg, ...), gzip and brotli copies of the text assets,
+# and small square WebP/JPEG thumbnails of the coach images for the sidebar,
+# and lists them all in static/dist/manifest.json:
+#
+#   python static_assets.py build            # run on deploy, before starting the app
+#
+# The app serves the built files from /assets/ with a year-long immutable
+# Cache-Control and a strong ETag, picking the precompressed copy the client
+# accepts. Because a URL only changes when the file's contents do, a deploy
+# invalidates exactly the assets that changed. Without a build, asset_url()
+# falls back to /static/<file>?v=<content hash>.
+#
+# Thumbnails need Pillow and .br files need the `brotli` package; without them
+# the build skips those outputs and the app uses the full-size image / gzip.
+
+import os
+import io
+import json
+import gzip
+import hashlib
+import logging
+import argparse
+import mimetypes
+import threading
+
+from flask import request, send_file, abort, url_for
+
+# --- Configuration ---
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIRNAME = "dist"
+MANIFEST_FILENAME = "manifest.json"
+ASSET_URL_PREFIX = "/assets"
+ASSET_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 12 # Hex digits of the SHA-256 in file names and ETags
+# Sidebar icons are 24x24 CSS pixels; 2x and 3x cover high-density screens
+THUMBNAIL_SIZES = (24, 48, 72)
+THUMBNAIL_QUALITY = {"webp": 80, "jpeg": 82}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html", ".ico")
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"} # In order of preference
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(logical_path, digest, variant=None):
+    """ 'images/aiyoda.jpg' -> 'images/aiyoda.<digest>.jpg' (or 'images/aiyoda.<variant>.<digest>.jpg'). """
+    stem, ext = os.path.splitext(logical_path)
+    return f"{stem}.{variant}.{digest}{ext}" if variant else f"{stem}.{digest}{ext}"
+
+
+# --- Build Step ---
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        return # Content-addressed: an existing file already has these bytes
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _precompress(data):
+    """ {encoding: compressed bytes} for the encodings that actually make `data` smaller. """
+    compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        compressed["br"] = brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    return {encoding: blob for encoding, blob in compressed.items() if len(blob) < len(data)}
+
+
+def _thumbnails(data, sizes=THUMBNAIL_SIZES):
+    """ Yields (format, size, bytes): square, centre-cropped thumbnails (like object-fit: cover). """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size in sizes:
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            for fmt, quality in THUMBNAIL_QUALITY.items():
+                out = io.BytesIO()
+                if fmt == "jpeg":
+                    thumbnail.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+                else:
+                    thumbnail.save(out, "WEBP", quality=quality, method=6)
+                yield fmt, size, out.getvalue()
+
+
+def iter_static_files(static_dir=STATIC_DIR):
+    """ Logical paths ('style.css', 'images/aiyoda.jpg') of the source assets, skipping dist/. """
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not (root == static_dir and d == DIST_DIRNAME) and not d.startswith("."))
+        for filename in sorted(files):
+            if not filename.startswith("."):
+                yield os.path.relpath(os.path.join(root, filename), static_dir).replace(os.sep, "/")
+
+
+def build_assets(static_dir=STATIC_DIR, prune=False):
+    """
+    Writes the fingerprinted, precompressed and resized assets and the manifest to
+    static_dir/dist. Files from earlier builds are kept (pages rendered before a
+    deploy may still reference them) unless `prune` is set.
+
+    Returns:
+        dict: The manifest.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    manifest = {"files": {}, "thumbnails": {}, "assets": {}}
+    try:
+        import PIL # noqa: F401
+        make_thumbnails = True
+    except ImportError:
+        logging.warning("Pillow is not installed; skipping the sidebar thumbnails (the full-size images will be used).")
+        make_thumbnails = False
+
+    original_bytes = output_bytes = 0
+    for logical_path in iter_static_files(static_dir):
+        with open(os.path.join(static_dir, logical_path), "rb") as f:
+            data = f.read()
+        digest = content_hash(data)
+        dist_path = hashed_name(logical_path, digest)
+        encodings = {}
+        if logical_path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            encodings = _precompress(data)
+        _write_file(os.path.join(dist_dir, dist_path), data)
+        for encoding, blob in encodings.items():
+            _write_file(os.path.join(dist_dir, dist_path + ENCODING_SUFFIXES[encoding]), blob)
+        manifest["files"][logical_path] = dist_path
+        manifest["assets"][dist_path] = {"etag": digest, "size": len(data), "encodings": sorted(encodings)}
+        original_bytes += len(data)
+        output_bytes += min([len(data)] + [len(blob) for blob in encodings.values()])
+
+        if make_thumbnails and logical_path.lower().endswith(IMAGE_EXTENSIONS):
+            try:
+                variants = {}
+                for fmt, size, blob in _thumbnails(data):
+                    ext = ".webp" if fmt == "webp" else ".jpg"
+                    thumbnail_path = hashed_name(os.path.splitext(logical_path)[0] + ext, content_hash(blob), f"{size}px")
+                    _write_file(os.path.join(dist_dir, thumbnail_path), blob)
+                    variants.setdefault(fmt, {})[str(size)] = thumbnail_path
+                    manifest["assets"][thumbnail_path] = {"etag": content_hash(blob), "size": len(blob), "encodings": []}
+                manifest["thumbnails"][logical_path] = variants
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not make thumbnails of '{logical_path}': {e}")
+
+    tmp_path = os.path.join(dist_dir, f"{MANIFEST_FILENAME}.tmp{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist_dir, MANIFEST_FILENAME))
+
+    if prune:
+        keep = {MANIFEST_FILENAME} | {path + suffix for path in manifest["assets"] for suffix in ("", *ENCODING_SUFFIXES.values())}
+        removed = 0
+        for root, _, files in os.walk(dist_dir):
+            for filename in files:
+                relative = os.path.relpath(os.path.join(root, filename), dist_dir).replace(os.sep, "/")
+                if relative not in keep:
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+        logging.info(f"Pruned {removed} files of earlier builds.")
+
+    logging.info(f"Built {len(manifest['files'])} assets and {sum(len(s) for v in manifest['thumbnails'].values() for s in v.values())} "
+                 f"thumbnails in {dist_dir} ({original_bytes / 1024:.0f} KiB of sources, {output_bytes / 1024:.0f} KiB "
+                 f"smallest encodings).")
+    return manifest
+
+
+# --- Serving ---
+class AssetManifest:
+    """
+    The build manifest, used to turn logical asset paths into URLs and to serve the
+    built files. Assets missing from the manifest (or every asset, when there is no
+    build) get /static/ URLs versioned by their content hash instead.
+    """
+
+    def __init__(self, static_dir=STATIC_DIR):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+        self.files = {}
+        self.thumbnails = {}
+        self.assets = {}
+        self._source_hashes = {} # logical path -> (mtime, digest), for unbuilt assets
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.dist_dir, MANIFEST_FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.files, self.thumbnails, self.assets = manifest["files"], manifest.get("thumbnails", {}), manifest["assets"]
+            logging.info(f"Loaded asset manifest: {len(self.files)} fingerprinted assets, {len(self.thumbnails)} with thumbnails.")
+        except FileNotFoundError:
+            logging.info(f"No asset manifest at '{path}'; serving /static/ with content-hash versions. "
+                         "Run 'python static_assets.py build' to fingerprint and precompress the assets.")
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Could not load asset manifest '{path}': {e}. Serving /static/ with content-hash versions.")
+
+    def _source_hash(self, logical_path):
+        path = os.path.join(self.static_dir, logical_path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._source_hashes.get(logical_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = content_hash(f.read())
+        with self._lock:
+            self._source_hashes[logical_path] = (mtime, digest)
+        return digest
+
+    def url(self, logical_path):
+        """ Cache-safe URL of a static asset. Needs an app or request context. """
+        dist_path = self.files.get(logical_path)
+        if dist_path is not None:
+            return f"{ASSET_URL_PREFIX}/{dist_path}"
+        digest = self._source_hash(logical_path)
+        return url_for('static', filename=logical_path, v=digest) if digest else url_for('static', filename=logical_path)
+
+    def thumbnail(self, logical_path, size, fmt="jpeg"):
+        """ URL of the smallest built thumbnail of at least `size` px, or None. """
+        variants = self.thumbnails.get(logical_path, {}).get(fmt, {})
+        sizes = sorted(int(s) for s in variants)
+        if not sizes:
+            return None
+        chosen = next((s for s in sizes if s >= size), sizes[-1])
+        return f"{ASSET_URL_PREFIX}/{variants[str(chosen)]}"
+
+    def srcset(self, logical_path, base_size, fmt="jpeg"):
+        """ 'url 1x, url 2x, ...' of the thumbnails for an image shown at `base_size` CSS px, or None. """
+        variants = self.thumbnails.get(logical_path, {}).get(fmt, {})
+        candidates = [(int(size) / base_size, path) for size, path in variants.items() if int(size) % base_size == 0]
+        if not candidates:
+            return None
+        return ", ".join(f"{ASSET_URL_PREFIX}/{path} {density:g}x" for density, path in sorted(candidates))
+
+    def send(self, dist_path):
+        """ Response for GET /assets/<dist_path>: precompressed if accepted, immutable, with an ETag. """
+        entry = self.assets.get(dist_path)
+        if entry is None:
+            abort(404) # Only files listed in the manifest are served, so the path can't escape dist/
+        file_path = os.path.join(self.dist_dir, dist_path)
+        encoding = next((e for e in ENCODING_SUFFIXES if e in entry["encodings"] and request.accept_encodings[e]), None)
+        etag = entry["etag"]
+        if encoding:
+            file_path += ENCODING_SUFFIXES[encoding]
+            etag = f"{etag}-{encoding}"
+        mimetype = mimetypes.guess_type(dist_path)[0] or "application/octet-stream"
+        response = send_file(file_path, mimetype=mimetype, etag=etag, conditional=True, max_age=ASSET_MAX_AGE)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if entry["encodings"]:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.immutable = True
+        return response
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Fingerprint, precompress and resize the static assets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Write static/dist/ and its manifest.")
+    build_parser.add_argument("--static-dir", default=STATIC_DIR)
+    build_parser.add_argument("--prune", action="store_true", help="Delete files from earlier builds.")
+    args = parser.parse_args()
+    build_assets(args.static_dir, prune=args.prune)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
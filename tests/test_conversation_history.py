@@ -0,0 +1,81 @@
+# tests/test_conversation_history.py
+#
+# Two store instances stand in for two gunicorn workers: a turn served by a
+# worker that did not see the previous one must still get the conversation's
+# history. Run from the repository root:  python -m pytest tests
+
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "conversation-test")
+os.environ.setdefault("FLASK_SECRET_KEY", "conversation-test")
+os.environ.setdefault("RAG_LAZY_INIT", "1")
+os.environ.setdefault("FEEDBACK_STORE", "log")
+
+import pytest
+
+import app as app_module
+from conversation_store import MemoryConversationStore, SQLiteConversationStore
+
+COACH = "Aiyoda"
+CONVERSATION_ID = "conversation-1"
+
+
+def make_turn(message, history, client_conversation_id=CONVERSATION_ID):
+    return {
+        'message_id': f"msg-{message}",
+        'sanitized_message': message,
+        'coach_display_name': COACH,
+        'history': history,
+        'persona': app_module.persona_registry.get(COACH),
+        'conversation_id': CONVERSATION_ID,
+        'client_conversation_id': client_conversation_id,
+    }
+
+
+def serve_turn(monkeypatch, store, turn, answer):
+    """ Loads the history and records the answer the way a worker using `store` would. """
+    monkeypatch.setattr(app_module, "conversation_store", store)
+    past_messages = app_module.load_turn_history(turn, same_coach=True)
+    app_module.record_exchange({'message_id': turn['message_id'], 'conversation': app_module.conversation_ref(turn)}, answer)
+    return [message.content for message in past_messages]
+
+
+def test_memory_store_rebuilds_history_on_another_worker(monkeypatch):
+    worker_a, worker_b = MemoryConversationStore(max_messages=20), MemoryConversationStore(max_messages=20)
+    history = [{'user': "first", 'coachName': COACH}]
+    serve_turn(monkeypatch, worker_a, make_turn("first", history), "first answer")
+
+    history = [{'user': "first", 'bot': "first answer", 'coachName': COACH}, {'user': "second", 'coachName': COACH}]
+    assert serve_turn(monkeypatch, worker_b, make_turn("second", history), "second answer") == ["first", "first answer"]
+    # Worker B now holds the whole conversation and uses it for the next turn
+    assert [m.content for m in worker_b.load((CONVERSATION_ID, app_module.persona_registry.get(COACH).key))] == \
+        ["first", "first answer", "second", "second answer"]
+
+
+def test_stored_history_is_preferred_over_client_history(monkeypatch):
+    store = MemoryConversationStore(max_messages=20)
+    serve_turn(monkeypatch, store, make_turn("first", [{'user': "first", 'coachName': COACH}]), "first answer")
+    tampered = [{'user': "edited", 'bot': "edited answer", 'coachName': COACH}, {'user': "second", 'coachName': COACH}]
+    assert serve_turn(monkeypatch, store, make_turn("second", tampered), "second answer") == ["first", "first answer"]
+
+
+def test_client_history_from_another_coach_is_ignored(monkeypatch):
+    history = [{'user': "elsewhere", 'bot': "other coach", 'coachName': "Career Catalyst"},
+               {'user': "first", 'bot': "first answer", 'coachName': COACH}, {'user': "second", 'coachName': COACH}]
+    past = serve_turn(monkeypatch, MemoryConversationStore(max_messages=20), make_turn("second", history), "second answer")
+    assert past == ["first", "first answer"]
+
+
+def test_sqlite_store_is_shared_between_workers(monkeypatch, tmp_path):
+    path = str(tmp_path / "conversations.db")
+    worker_a, worker_b = SQLiteConversationStore(path, max_messages=20), SQLiteConversationStore(path, max_messages=20)
+    serve_turn(monkeypatch, worker_a, make_turn("first", [{'user': "first", 'coachName': COACH}]), "first answer")
+    # No client history at all: the shared file alone has to carry the conversation
+    assert serve_turn(monkeypatch, worker_b, make_turn("second", []), "second answer") == ["first", "first answer"]
+
+
+@pytest.mark.parametrize("client_conversation_id", [None, "expired-conversation"])
+def test_client_history_without_a_matching_conversation_id(monkeypatch, client_conversation_id):
+    history = [{'user': "first", 'bot': "first answer", 'coachName': COACH}, {'user': "second", 'coachName': COACH}]
+    turn = make_turn("second", history, client_conversation_id)
+    assert serve_turn(monkeypatch, MemoryConversationStore(max_messages=20), turn, "second answer") == ["first", "first answer"]